@@ -7,9 +7,12 @@ from compras_page import compras_page
 from resumen_excel_page import resumen_excel_page
 from analisis_page import analisis_page
 from historial_page import historial_page
+from rendimiento_page import rendimiento_page
 
 # Login / roles
 from loginpassword import login_page, get_user_role
+from data_utils import flush_pendientes
+from rendimiento import tramo
 
 
 # -------------------------------------------------------------------
@@ -277,7 +280,9 @@ def main():
     role_label = "Dueño / Admin" if role_code == "admin" else "Operación"
 
     # Páginas según rol
-    pages_admin = ["Home", "Ventas", "Compras", "Resumen Excel", "Análisis", "Histórico"]
+    pages_admin = [
+        "Home", "Ventas", "Compras", "Resumen Excel", "Análisis", "Histórico", "Rendimiento",
+    ]
     pages_user = ["Home", "Ventas", "Compras", "Resumen Excel"]
 
     pages = pages_admin if role_code == "admin" else pages_user
@@ -302,6 +307,8 @@ def main():
 
         # Botón cerrar sesión
         if st.button("Cerrar sesión"):
+            # Que no quede nada en cola al salir
+            flush_pendientes()
             for k in ["logged_in", "authenticated", "current_user", "current_role", "page"]:
                 ss.pop(k, None)
             st.rerun()
@@ -327,23 +334,26 @@ def main():
             unsafe_allow_html=True,
         )
 
-    # Router según page
+    # Router según page (cada rerun se mide, ver "Rendimiento")
     page = ss["page"]
-    if page == "Home":
-        home_page()
-    elif page == "Ventas":
-        ingresos_page()
-    elif page == "Compras":
-        compras_page()
-    elif page == "Resumen Excel":
-        resumen_excel_page()
-    elif page == "Análisis" and role_code == "admin":
-        analisis_page()
-    elif page == "Histórico" and role_code == "admin":
-        historial_page()
-    else:
-        # por si alguien intenta forzar URL a una página que no debería ver
-        st.error("No tienes permisos para ver esta sección.")
+    with tramo(f"rerun · {page}"):
+        if page == "Home":
+            home_page()
+        elif page == "Ventas":
+            ingresos_page()
+        elif page == "Compras":
+            compras_page()
+        elif page == "Resumen Excel":
+            resumen_excel_page()
+        elif page == "Análisis" and role_code == "admin":
+            analisis_page()
+        elif page == "Histórico" and role_code == "admin":
+            historial_page()
+        elif page == "Rendimiento" and role_code == "admin":
+            rendimiento_page()
+        else:
+            # por si alguien intenta forzar URL a una página que no debería ver
+            st.error("No tienes permisos para ver esta sección.")
 
 
 if __name__ == "__main__":
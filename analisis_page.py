@@ -1,11 +1,9 @@
 import streamlit as st
-import pandas as pd
 import altair as alt
 
-from data_utils import (
-    cargar_ventas_historicas,
-    cargar_compras_historicas,
-)
+from data_utils import MESES, montos_invalidos, totales_historicos
+from filtros import filtros_rango
+from rendimiento import tramo
 
 
 def analisis_page():
@@ -13,55 +11,31 @@ def analisis_page():
     st.caption("Visualización dinámica de **ventas** y **compras** por mes y por año.")
 
     # =========================
-    # 1) Cargar histórico desde CSV
+    # 1) Totales por año/mes/tipo (agregados materializados, no filas)
+    #    Con filtros por rango, el backend suma sólo las filas que caen dentro
     # =========================
-    ventas_hist = cargar_ventas_historicas()
-    compras_hist = cargar_compras_historicas()
-
-    if not ventas_hist and not compras_hist:
-        st.info(
-            "Todavía no hay datos para analizar. "
-            "Primero captura ventas y compras en las pestañas correspondientes."
-        )
+    rangos = filtros_rango("analisis")
+    df_all = totales_historicos(rangos)
+
+    if df_all.empty:
+        if rangos.activos():
+            st.warning("No hay movimientos dentro de los rangos seleccionados.")
+        else:
+            st.info(
+                "Todavía no hay datos para analizar. "
+                "Primero captura ventas y compras en las pestañas correspondientes."
+            )
         return
 
-    # =========================
-    # 2) Unificar datos
-    # =========================
-    def parse_monto(texto):
-        if texto is None or texto == "":
-            return 0.0
-        txt = str(texto).replace("$", "").replace(",", "").strip()
-        try:
-            return float(txt)
-        except ValueError:
-            return 0.0
-
-    df_list = []
-
-    if ventas_hist:
-        df_v = pd.DataFrame(ventas_hist).copy()
-        df_v["Tipo"] = "Ventas"
-        df_list.append(df_v)
-
-    if compras_hist:
-        df_c = pd.DataFrame(compras_hist).copy()
-        df_c["Tipo"] = "Compras"
-        df_list.append(df_c)
-
-    df_all = pd.concat(df_list, ignore_index=True)
-
-    df_all["Monto_num"] = df_all["Monto MXN"].apply(parse_monto)
-
-    meses_order = [
-        "Enero", "Febrero", "Marzo", "Abril",
-        "Mayo", "Junio", "Julio", "Agosto",
-        "Septiembre", "Octubre", "Noviembre", "Diciembre",
-    ]
-    df_all["Mes"] = pd.Categorical(df_all["Mes"], categories=meses_order, ordered=True)
+    invalidos = montos_invalidos()
+    if invalidos:
+        st.warning(
+            f"{invalidos} monto(s) de todo el histórico (sin contar los filtros) "
+            "no se pudieron interpretar como número y no se incluyen en ningún total."
+        )
 
     # =========================
-    # 3) Filtros
+    # 2) Filtros
     # =========================
     años_disp = sorted(df_all["Año"].unique())
 
@@ -92,63 +66,67 @@ def analisis_page():
         return
 
     # =========================
-    # 4) Gráfica mensual
+    # 3) Gráfica mensual
     # =========================
-    df_m = (
-        df_f.groupby(["Mes", "Tipo"], as_index=False)["Monto_num"]
-        .sum()
-        .sort_values("Mes")
-    )
+    with tramo("Análisis · agrupar"):
+        df_m = (
+            df_f.groupby(["Mes", "Tipo"], as_index=False)["Monto_num"]
+            .sum()
+            .sort_values("Mes")
+        )
 
     st.markdown("### Totales mensuales")
 
-    chart_m = (
-        alt.Chart(df_m)
-        .mark_bar()
-        .encode(
-            x=alt.X("Mes:N", sort=meses_order, title="Mes"),
-            y=alt.Y("Monto_num:Q", title="Monto MXN"),
-            color="Tipo:N",
-            tooltip=["Mes", "Tipo", alt.Tooltip("Monto_num:Q", format=",.2f")],
+    with tramo("Análisis · gráficas"):
+        chart_m = (
+            alt.Chart(df_m)
+            .mark_bar()
+            .encode(
+                x=alt.X("Mes:N", sort=MESES, title="Mes"),
+                y=alt.Y("Monto_num:Q", title="Monto MXN"),
+                color="Tipo:N",
+                tooltip=["Mes", "Tipo", alt.Tooltip("Monto_num:Q", format=",.2f")],
+            )
+            .properties(
+                width="container",
+                height=350,
+                title=f"Totales mensuales {año_sel}",
+            )
         )
-        .properties(
-            width="container",
-            height=350,
-            title=f"Totales mensuales {año_sel}",
-        )
-    )
 
-    st.altair_chart(chart_m, use_container_width=True)
+        st.altair_chart(chart_m, use_container_width=True)
 
     # =========================
-    # 5) Gráfica anual (histórico)
+    # 4) Gráfica anual (histórico)
     # =========================
     st.markdown("---")
     st.markdown("### Totales anuales (histórico)")
 
-    df_y = (
-        df_all.groupby(["Año", "Tipo"], as_index=False)["Monto_num"]
-        .sum()
-        .sort_values("Año")
-    )
-
-    chart_y = (
-        alt.Chart(df_y)
-        .mark_bar()
-        .encode(
-            x=alt.X("Año:O", title="Año"),
-            y=alt.Y("Monto_num:Q", title="Monto MXN"),
-            color="Tipo:N",
-            tooltip=["Año", "Tipo", alt.Tooltip("Monto_num:Q", format=",.2f")],
+    with tramo("Análisis · agrupar"):
+        df_y = (
+            df_all.groupby(["Año", "Tipo"], as_index=False)["Monto_num"]
+            .sum()
+            .sort_values("Año")
         )
-        .properties(
-            width="container",
-            height=300,
-            title="Totales anuales de ventas y compras",
+
+    with tramo("Análisis · gráficas"):
+        chart_y = (
+            alt.Chart(df_y)
+            .mark_bar()
+            .encode(
+                x=alt.X("Año:O", title="Año"),
+                y=alt.Y("Monto_num:Q", title="Monto MXN"),
+                color="Tipo:N",
+                tooltip=["Año", "Tipo", alt.Tooltip("Monto_num:Q", format=",.2f")],
+            )
+            .properties(
+                width="container",
+                height=300,
+                title="Totales anuales de ventas y compras",
+            )
         )
-    )
 
-    st.altair_chart(chart_y, use_container_width=True)
+        st.altair_chart(chart_y, use_container_width=True)
 
     # 👀 IMPORTANTE:
     # Ya no mostramos la tabla de detalle aquí.
@@ -0,0 +1,298 @@
+# benchmarks/bench_datos.py
+"""
+Benchmarks de la capa de datos y de las páginas con libros sintéticos
+(ver sinteticos.py): guardar, cargar, filtrar, agregar, exportar y
+renderizar Histórico y Análisis sin navegador (streamlit AppTest).
+
+Cada tamaño corre en un proceso aparte con IMPRESOS_DATA_DIR apuntando a
+una carpeta temporal: los datos reales no se tocan y el pico de memoria
+de un tamaño no se mezcla con el del siguiente.
+
+Por caso se reporta latencia p50/p95 (ms), filas por segundo (llamadas
+por segundo en los casos de una sola fila o de caché) y pico de
+memoria (tracemalloc, en una corrida aparte). Con --comparar se contrasta
+contra benchmarks/base.json y el proceso sale con código 1 si algún p50
+empeoró más que la tolerancia; --guardar-base reescribe ese archivo con
+los resultados de esta máquina.
+
+Uso:
+  python benchmarks/bench_datos.py [filas ...] [--backend csv|sqlite]
+         [--repeticiones N] [--comparar] [--tolerancia 0.3] [--guardar-base]
+  python benchmarks/bench_datos.py 1000 100000 1000000 --comparar
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import tracemalloc
+import subprocess
+from datetime import date
+
+import numpy as np
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "base.json")
+TAMAÑOS = [1_000, 100_000, 1_000_000]
+
+# Script mínimo para AppTest: una página suelta, sin login ni Home.py
+_SCRIPT_PAGINA = """
+import sys
+sys.path.insert(0, {raiz!r})
+from {modulo} import {funcion}
+{funcion}()
+"""
+
+
+# ------------ MEDICIÓN ------------
+
+def _medir(correr, repeticiones: int, filas: int, preparar=None, calentar: bool = True) -> dict:
+    """
+    Corre `correr()` `repeticiones` veces (con `preparar()` antes de cada una,
+    fuera del tiempo) y luego una más bajo tracemalloc para el pico de memoria.
+    """
+    if calentar:
+        if preparar is not None:
+            preparar()
+        correr()
+    tiempos = []
+    for _ in range(repeticiones):
+        if preparar is not None:
+            preparar()
+        inicio = time.perf_counter()
+        correr()
+        tiempos.append(time.perf_counter() - inicio)
+    if preparar is not None:
+        preparar()
+    tracemalloc.start()
+    correr()
+    pico = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    p50 = float(np.percentile(tiempos, 50))
+    return {
+        "p50_ms": round(p50 * 1000, 2),
+        "p95_ms": round(float(np.percentile(tiempos, 95)) * 1000, 2),
+        "filas_s": round(filas / p50) if p50 > 0 else None,
+        "pico_mb": round(pico / 1e6, 1),
+    }
+
+
+def _esperar_snapshots(du) -> None:
+    """El snapshot Parquet se escribe en un hilo: no medir mientras corre."""
+    while du._SNAPSHOTS_EN_CURSO:
+        time.sleep(0.05)
+
+
+def _pagina_apptest(carpeta: str, modulo: str, funcion: str):
+    from streamlit.testing.v1 import AppTest
+
+    script = os.path.join(carpeta, f"app_{modulo}.py")
+    with open(script, "w", encoding="utf-8") as f:
+        f.write(_SCRIPT_PAGINA.format(raiz=RAIZ, modulo=modulo, funcion=funcion))
+
+    def correr():
+        at = AppTest.from_file(script, default_timeout=600).run()
+        if at.exception:
+            raise RuntimeError(f"{modulo}: {at.exception[0].value}")
+
+    return correr
+
+
+# ------------ CASOS (proceso hijo) ------------
+
+def _casos(filas: int, repeticiones: int, carpeta: str) -> dict:
+    """Genera los libros en `carpeta` (ya es IMPRESOS_DATA_DIR) y corre todos los casos."""
+    sys.path.insert(0, RAIZ)
+    import data_utils as du
+    from data_utils import Rangos
+    from excel_export import construir_excel, construir_excel_anual
+    from export_jobs import escribir_historico
+    from sinteticos import escribir_libros, libro_sintetico, registro_sintetico
+
+    escribir_libros(carpeta, filas)
+    if du.STORAGE_BACKEND == "sqlite":
+        du.importar_csv_a_sqlite()
+    backend = du.get_backend()
+    año = max(du.años_historicos())
+    r = {}
+
+    # Cargar: sin snapshot (sólo CSV), en frío desde el snapshot y desde la caché
+    if backend.nombre == "csv":
+        def sin_snapshot():
+            _esperar_snapshots(du)
+            shutil.rmtree(du._snapshot_dir(du.VENTAS_FILE), ignore_errors=True)
+            du._CACHE.invalidar()
+
+        r["cargar libro (CSV)"] = _medir(du.cargar_ventas_df, repeticiones, filas, sin_snapshot)
+
+    def en_frio():
+        _esperar_snapshots(du)
+        du._CACHE.invalidar()
+
+    r["cargar libro (frío)"] = _medir(du.cargar_ventas_df, repeticiones, filas, en_frio)
+    r["cargar libro (caché)"] = _medir(du.cargar_ventas_df, repeticiones, 1)
+
+    # Guardar: una factura a la vez (como la pantalla de captura) y por lote
+    contador = iter(range(10**7))
+    r["guardar factura"] = _medir(
+        lambda: du.guardar_venta_historica(registro_sintetico("ventas", next(contador))),
+        max(repeticiones * 4, 20), 1,
+    )
+    lotes = iter(range(10**4))
+
+    def guardar_lote():
+        k = next(lotes)
+        lote = libro_sintetico(
+            "compras", 500, 100 + k, (año,), inicio=8_000_000 + 500 * k, ilegibles=0
+        )
+        du.guardar_lote_historico("compras", lote.to_dict("records"))
+
+    r["guardar lote (500)"] = _medir(guardar_lote, repeticiones, 500)
+    _esperar_snapshots(du)
+
+    # Filtrar (con la caché caliente, como en los reruns de la app)
+    r["consultar año/mes"] = _medir(
+        lambda: du.consultar_historico(año=año, mes="Marzo"), repeticiones, filas * 2
+    )
+    r["contar año (frío)"] = _medir(
+        lambda: du.contar_historico(año=año, rangos=Rangos(monto_min=1000)),
+        repeticiones, filas * 2, en_frio,
+    )
+    r["página ordenada por monto"] = _medir(
+        lambda: du.pagina_historico(orden="Monto MXN", ascendente=False, offset=500, limite=50),
+        repeticiones, filas * 2,
+    )
+    r["buscar texto"] = _medir(
+        lambda: du.contar_historico(texto="cucea udeg"), repeticiones, filas * 2
+    )
+    r["rangos fecha/monto"] = _medir(
+        lambda: du.contar_historico(
+            rangos=Rangos(emision_desde=date(año, 1, 1), monto_min=1000, monto_max=20000)
+        ),
+        repeticiones, filas * 2,
+    )
+
+    # Agregar
+    r["totales (agregados)"] = _medir(du.cargar_agregados, repeticiones, filas * 2)
+    r["totales con rangos"] = _medir(
+        lambda: du.totales_historicos(Rangos(monto_min=5000)), repeticiones, filas * 2
+    )
+
+    # Exportar
+    df_v = backend.consultar("ventas", año=año, mes="Marzo")
+    df_c = backend.consultar("compras", año=año, mes="Marzo")
+    r["Excel mensual"] = _medir(
+        lambda: construir_excel("Marzo", año, df_v, df_c), repeticiones, len(df_v) + len(df_c)
+    )
+    n_año = du.contar_historico(año=año)
+    r["Excel anual"] = _medir(
+        lambda: construir_excel_anual(año), max(1, repeticiones // 2), n_año, calentar=False
+    )
+    ruta = os.path.join(carpeta, "historico.csv.gz")
+    r["histórico CSV gzip"] = _medir(
+        lambda: escribir_historico(ruta, "CSV comprimido (gzip)"),
+        max(1, repeticiones // 2), filas * 2, calentar=False,
+    )
+
+    # Páginas completas, como las ve un usuario (primera carga de la sesión)
+    r["página Histórico"] = _medir(
+        _pagina_apptest(carpeta, "historial_page", "historial_page"), repeticiones, filas * 2
+    )
+    r["página Análisis"] = _medir(
+        _pagina_apptest(carpeta, "analisis_page", "analisis_page"), repeticiones, filas * 2
+    )
+    return r
+
+
+# ------------ DRIVER ------------
+
+def _correr_tamaño(filas: int, backend: str, repeticiones: int) -> dict:
+    carpeta = tempfile.mkdtemp(prefix=f"impresos-bench-{filas}-")
+    env = dict(os.environ, IMPRESOS_DATA_DIR=carpeta, IMPRESOS_STORAGE=backend)
+    env.pop("IMPRESOS_DB", None)
+    try:
+        salida = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--hijo", str(filas),
+             "--repeticiones", str(repeticiones)],
+            env=env, check=True, capture_output=True, text=True,
+        )
+    except subprocess.CalledProcessError as e:
+        sys.stderr.write(e.stderr)
+        raise
+    finally:
+        shutil.rmtree(carpeta, ignore_errors=True)
+    return json.loads(salida.stdout.strip().splitlines()[-1])
+
+
+def _imprimir(filas: int, resultados: dict, base: dict | None, tolerancia: float) -> list[str]:
+    """Tabla de un tamaño; regresa los casos que empeoraron contra la base."""
+    print(f"\n== {filas:,} filas por libro ==")
+    print(f"{'caso':<28} {'p50 ms':>10} {'p95 ms':>10} {'filas/s':>12} {'pico MB':>8} {'vs base':>8}")
+    regresiones = []
+    for caso, m in resultados.items():
+        cambio = ""
+        previo = (base or {}).get(caso)
+        if previo and previo["p50_ms"] > 0:
+            razon = m["p50_ms"] / previo["p50_ms"]
+            cambio = f"{razon:.2f}x"
+            if razon > 1 + tolerancia:
+                cambio += " !"
+                regresiones.append(f"{filas:,} filas / {caso}: {previo['p50_ms']} -> {m['p50_ms']} ms")
+        filas_s = f"{m['filas_s']:,}" if m["filas_s"] else "-"
+        print(f"{caso:<28} {m['p50_ms']:>10.1f} {m['p95_ms']:>10.1f} {filas_s:>12} "
+              f"{m['pico_mb']:>8.1f} {cambio:>8}")
+    return regresiones
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("filas", nargs="*", type=int, default=TAMAÑOS)
+    parser.add_argument("--backend", choices=["csv", "sqlite"], default="csv")
+    parser.add_argument("--repeticiones", type=int, default=5)
+    parser.add_argument("--comparar", action="store_true", help="comparar contra base.json")
+    parser.add_argument("--tolerancia", type=float, default=0.3,
+                        help="cuánto puede crecer un p50 antes de contar como regresión")
+    parser.add_argument("--guardar-base", action="store_true", help="reescribir base.json")
+    parser.add_argument("--hijo", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.hijo is not None:
+        # Proceso hijo: IMPRESOS_DATA_DIR ya apunta a su carpeta temporal
+        resultados = _casos(args.hijo, args.repeticiones, os.environ["IMPRESOS_DATA_DIR"])
+        print(json.dumps(resultados, ensure_ascii=False))
+        return 0
+
+    base = {}
+    if os.path.exists(BASE_FILE):
+        with open(BASE_FILE, "r", encoding="utf-8") as f:
+            base = json.load(f)
+    if args.comparar and args.backend not in base:
+        print(f"No hay base para el backend {args.backend!r} en {BASE_FILE}; usa --guardar-base.")
+        return 2
+
+    nuevos = {}
+    regresiones = []
+    for filas in args.filas:
+        nuevos[str(filas)] = _correr_tamaño(filas, args.backend, args.repeticiones)
+        previo = base.get(args.backend, {}).get(str(filas)) if args.comparar else None
+        regresiones += _imprimir(filas, nuevos[str(filas)], previo, args.tolerancia)
+
+    if args.guardar_base:
+        base.setdefault(args.backend, {}).update(nuevos)
+        with open(BASE_FILE, "w", encoding="utf-8") as f:
+            json.dump(base, f, ensure_ascii=False, indent=1)
+        print(f"\nBase guardada en {BASE_FILE}")
+
+    if regresiones:
+        print(f"\nRegresiones (p50 más de {args.tolerancia:.0%} arriba de la base):")
+        for linea in regresiones:
+            print(f"  {linea}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
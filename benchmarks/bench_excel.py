@@ -0,0 +1,57 @@
+# benchmarks/bench_excel.py
+"""
+Tiempo de generación del Excel mensual (excel_export.construir_excel)
+para meses de 10k y 100k facturas por libro.
+
+Uso:  python benchmarks/bench_excel.py [filas ...]
+"""
+import os
+import sys
+import time
+import random
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from data_utils import CONTRAPARTE, columnas_ledger  # noqa: E402
+from excel_export import construir_excel  # noqa: E402
+
+
+def mes_sintetico(ledger: str, filas: int, semilla: int = 0) -> pd.DataFrame:
+    """Registros en texto, como llegan de la sesión: "$x,xxx.xx" y dd/mm/YYYY."""
+    rnd = random.Random(semilla)
+    contraparte = CONTRAPARTE[ledger]
+    registros = [
+        {
+            "Año": 2025,
+            "Mes": "Marzo",
+            "Número factura": f"F-{i:07d}",
+            "Fecha emisión": f"{rnd.randint(1, 28):02d}/03/2025",
+            contraparte: f"{contraparte} {rnd.randint(1, 500)}",
+            "Monto MXN": f"${rnd.uniform(10, 50000):,.2f}",
+            "Fecha pago": f"{rnd.randint(1, 28):02d}/04/2025",
+            "Método pago": rnd.choice(["TRANSFERENCIA", "EFECTIVO", "TARJETA"]),
+        }
+        for i in range(filas)
+    ]
+    return pd.DataFrame(registros, columns=columnas_ledger(ledger))
+
+
+def medir(filas: int) -> tuple[float, int]:
+    df_v = mes_sintetico("ventas", filas, 1)
+    df_c = mes_sintetico("compras", filas, 2)
+    inicio = time.perf_counter()
+    contenido = construir_excel("Marzo", 2025, df_v, df_c)
+    return time.perf_counter() - inicio, len(contenido)
+
+
+def main(tamaños: list[int]) -> None:
+    print(f"{'filas/libro':>12} {'segundos':>10} {'MB':>8}")
+    for filas in tamaños:
+        segundos, tamaño = medir(filas)
+        print(f"{filas:>12,} {segundos:>10.2f} {tamaño / 1e6:>8.1f}")
+
+
+if __name__ == "__main__":
+    main([int(a) for a in sys.argv[1:]] or [10_000, 100_000])
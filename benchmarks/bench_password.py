@@ -0,0 +1,79 @@
+# benchmarks/bench_password.py
+"""
+Elige el costo del hash de contraseñas (loginpassword) para esta máquina:
+mide cuánto tarda un login con cada costo, también con una ola de logins
+simultáneos contra el pool de HASH_WORKERS hilos, y recomienda el más alto
+cuyo p95 queda bajo el objetivo.
+
+Uso:  python benchmarks/bench_password.py [--objetivo-ms 250] [--simultaneos 8]
+                                          [--algoritmo scrypt|pbkdf2]
+"""
+import os
+import sys
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from loginpassword import HASH_WORKERS, _en_pool, _hash_password, _verify_password  # noqa: E402
+
+COSTOS = {
+    "scrypt": [{"n": 2**k, "r": 8, "p": 1} for k in range(12, 18)],
+    "pbkdf2": [{"iteraciones": i} for i in (100_000, 200_000, 400_000, 600_000, 900_000, 1_200_000)],
+}
+PRUEBA = "contraseña de prueba"
+VARIABLES = {
+    "scrypt": lambda c: f"IMPRESOS_HASH=scrypt IMPRESOS_SCRYPT_N={c['n']}",
+    "pbkdf2": lambda c: f"IMPRESOS_HASH=pbkdf2 IMPRESOS_PBKDF2_ITER={c['iteraciones']}",
+}
+
+
+def medir(algoritmo: str, costo: dict, simultaneos: int, repeticiones: int = 5) -> tuple[float, float]:
+    """(ms de un login solo, p95 en ms de `simultaneos` logins a la vez por el pool)."""
+    guardado = _hash_password(PRUEBA, algoritmo, costo)
+    solo = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        _verify_password(PRUEBA, guardado)
+        solo.append(time.perf_counter() - inicio)
+
+    def login(_):
+        inicio = time.perf_counter()
+        _en_pool(_verify_password, PRUEBA, guardado)
+        return time.perf_counter() - inicio
+
+    # Cada sesión de Streamlit es un hilo que espera su turno en el pool
+    with ThreadPoolExecutor(max_workers=simultaneos) as sesiones:
+        ola = list(sesiones.map(login, range(simultaneos)))
+    return float(np.median(solo)) * 1000, float(np.percentile(ola, 95)) * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--objetivo-ms", type=float, default=250.0)
+    parser.add_argument("--simultaneos", type=int, default=8)
+    parser.add_argument("--algoritmo", choices=list(COSTOS), default="scrypt")
+    args = parser.parse_args()
+
+    print(f"{args.algoritmo}, pool de {HASH_WORKERS} hilos, "
+          f"{args.simultaneos} logins simultáneos, objetivo p95 {args.objetivo_ms:.0f} ms\n")
+    print(f"{'costo':<28} {'1 login ms':>11} {'ola p95 ms':>11}")
+    elegido = None
+    for costo in COSTOS[args.algoritmo]:
+        solo, ola = medir(args.algoritmo, costo, args.simultaneos)
+        etiqueta = ", ".join(f"{k}={v:,}" for k, v in costo.items())
+        print(f"{etiqueta:<28} {solo:>11.1f} {ola:>11.1f}")
+        if ola <= args.objetivo_ms:
+            elegido = costo
+
+    if elegido is None:
+        print("\nNingún costo cumple el objetivo; sube --objetivo-ms o IMPRESOS_HASH_WORKERS.")
+    else:
+        print(f"\nRecomendado: {VARIABLES[args.algoritmo](elegido)}")
+
+
+if __name__ == "__main__":
+    main()
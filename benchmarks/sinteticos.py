@@ -0,0 +1,95 @@
+# benchmarks/sinteticos.py
+"""
+Libros sintéticos de ventas y compras con la forma de los reales: clientes
+y proveedores con nombres repetidos (pocos concentran muchas facturas),
+montos log-normales, ~20 % de facturas sin pagar y algún monto ilegible
+(como los que dejaban las capturas viejas).
+
+Todo va en texto, como lo guarda la app ("$x,xxx.xx", dd/mm/YYYY), y se
+genera con numpy para que un libro de 1M de filas tarde segundos.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+from data_utils import CONTRAPARTE, MESES, columnas_ledger
+
+CLIENTES = [
+    "CUCEA - UdeG", "CUCSH - UdeG", "CUCEI - UdeG", "ITESO", "Tec de Monterrey GDL",
+    "Gobierno de Jalisco", "Ayuntamiento de Zapopan", "Ayuntamiento de Guadalajara",
+    "Hospital Civil", "IMSS Delegación Jalisco", "Colegio Cervantes", "UNIVA",
+    "Librería Gonzalvo", "Papelería Ñandú", "Grupo Editorial Occidente",
+]
+PROVEEDORES = [
+    "Papelera Tapatía", "Tintas y Barnices de Occidente", "Kodak México",
+    "Distribuidora de Papel Lozano", "Heidelberg México", "CFE", "Telmex",
+    "Cartonera del Bajío", "Refacciones Offset GDL", "Transportes Mendoza",
+]
+METODOS = ["TRANSFERENCIA", "EFECTIVO", "CHEQUE", "TARJETA"]
+
+
+def _nombres(base: list[str], rng: np.random.Generator, n: int) -> np.ndarray:
+    """Base fija más sucursales numeradas, con frecuencia tipo Zipf."""
+    catalogo = np.array(base + [f"{b} {i}" for b in base for i in range(2, 21)])
+    rango = np.minimum(rng.zipf(1.3, n), len(catalogo)) - 1
+    return catalogo[rango]
+
+
+def _fechas(años: np.ndarray, meses: np.ndarray, dias: np.ndarray) -> np.ndarray:
+    return np.char.add(
+        np.char.add(np.char.zfill(dias.astype(str), 2), "/"),
+        np.char.add(np.char.add(np.char.zfill(meses.astype(str), 2), "/"), años.astype(str)),
+    )
+
+
+def libro_sintetico(ledger: str, filas: int, semilla: int = 0,
+                    años: tuple = (2022, 2023, 2024, 2025), inicio: int = 0,
+                    ilegibles: float = 0.001) -> pd.DataFrame:
+    """
+    `filas` registros del libro en texto, repartidos en `años`, en orden de
+    captura aleatorio. Una fracción `ilegibles` lleva un monto que no es número.
+    """
+    rng = np.random.default_rng(semilla)
+    año = rng.choice(np.array(años), filas)
+    mes = rng.integers(1, 13, filas)
+    emision = _fechas(año, mes, rng.integers(1, 29, filas))
+    pago = _fechas(año, mes, rng.integers(1, 29, filas))
+    pago = np.where(rng.random(filas) < 0.2, "", pago)
+
+    montos = np.round(rng.lognormal(8.5, 1.2, filas), 2)
+    texto_montos = np.array([f"${m:,.2f}" for m in montos.tolist()], dtype=object)
+    texto_montos[rng.random(filas) < ilegibles] = "pendiente"
+
+    base = CLIENTES if ledger == "ventas" else PROVEEDORES
+    numeros = np.char.zfill(np.arange(inicio, inicio + filas).astype(str), 7)
+    return pd.DataFrame(
+        {
+            "Año": año,
+            "Mes": np.array(MESES)[mes - 1],
+            "Número factura": np.char.add("F-", numeros),
+            "Fecha emisión": emision,
+            CONTRAPARTE[ledger]: _nombres(base, rng, filas),
+            "Monto MXN": texto_montos,
+            "Fecha pago": pago,
+            "Método pago": rng.choice(np.array(METODOS), filas),
+        },
+        columns=columnas_ledger(ledger),
+    )
+
+
+def registro_sintetico(ledger: str, i: int, semilla: int = 0) -> dict:
+    """Una factura nueva (número único por `i`) como la manda la pantalla de captura."""
+    fila = libro_sintetico(ledger, 1, semilla + i, (2025,), inicio=9_000_000 + i, ilegibles=0)
+    return fila.iloc[0].to_dict()
+
+
+def escribir_libros(carpeta: str, filas: int, semilla: int = 0) -> None:
+    """Escribe ventas_historico.csv y compras_historico.csv con `filas` registros cada uno."""
+    os.makedirs(carpeta, exist_ok=True)
+    for i, (ledger, nombre) in enumerate(
+        [("ventas", "ventas_historico.csv"), ("compras", "compras_historico.csv")]
+    ):
+        libro_sintetico(ledger, filas, semilla + i).to_csv(
+            os.path.join(carpeta, nombre), index=False
+        )
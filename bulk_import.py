@@ -0,0 +1,166 @@
+# bulk_import.py
+"""
+Importación masiva de facturas desde CSV o XLSX.
+
+El archivo se lee por bloques (pandas chunksize / openpyxl read_only), cada
+fila se valida con las mismas reglas que la captura manual
+(data_utils.construir_registro) y las filas válidas de cada bloque se
+escriben al histórico en una sola operación. Así un archivo de 100k filas
+no se carga completo en memoria ni hace 100k escrituras.
+"""
+from typing import NamedTuple
+
+import pandas as pd
+
+from data_utils import (
+    CONTRAPARTE,
+    ErrorValidacion,
+    columnas_ledger,
+    construir_registro,
+    guardar_lote_historico,
+)
+
+TAMAÑO_BLOQUE = 5000
+MAX_ERRORES_REPORTADOS = 1000
+METODO_PAGO_DEFAULT = "TRANSFERENCIA"
+
+
+class ResultadoImportacion(NamedTuple):
+    leidas: int
+    escritas: int
+    duplicadas: int
+    con_error: int
+    errores: list[tuple[int, str]]   # (fila del archivo, mensaje), los primeros MAX_ERRORES_REPORTADOS
+
+
+# Los bloques son listas de (fila en el archivo, valores): el número de fila
+# es el que ve el usuario en su hoja, contando el encabezado y las filas en
+# blanco que se saltan.
+
+def _bloques_csv(archivo, tamaño: int):
+    # skip_blank_lines=False: así el índice sigue a las líneas del archivo
+    for bloque in pd.read_csv(
+        archivo, dtype=str, chunksize=tamaño, keep_default_na=False,
+        skip_blank_lines=False, encoding="utf-8-sig",
+    ):
+        # +2: una línea de encabezado y el índice empieza en 0
+        filas = [
+            (i + 2, fila)
+            for i, fila in zip(bloque.index, bloque.to_dict(orient="records"))
+            if any(v != "" for v in fila.values())
+        ]
+        if filas:
+            yield filas
+
+
+def _bloques_xlsx(archivo, tamaño: int):
+    from openpyxl import load_workbook
+
+    libro = load_workbook(archivo, read_only=True, data_only=True)
+    try:
+        hoja = libro.active
+        filas = hoja.iter_rows(values_only=True)
+        encabezado = [str(c).strip() if c is not None else "" for c in next(filas, [])]
+        bloque = []
+        # el encabezado es la primera fila con datos de la hoja (no siempre la 1)
+        for numero, valores in enumerate(filas, start=(hoja.min_row or 1) + 1):
+            if all(v is None for v in valores):
+                continue
+            bloque.append((numero, dict(zip(encabezado, valores))))
+            if len(bloque) >= tamaño:
+                yield bloque
+                bloque = []
+        if bloque:
+            yield bloque
+    finally:
+        libro.close()
+
+
+def _normalizar_año(valor):
+    """
+    Un año que viene de una hoja de cálculo suele llegar como 2025.0 (número
+    o texto). Si es un entero exacto lo deja como int; si no, lo regresa igual
+    para que construir_registro lo reporte.
+    """
+    if isinstance(valor, bool):
+        return valor
+    if isinstance(valor, str):
+        texto = valor.strip()
+        try:
+            numero = float(texto)
+        except ValueError:
+            return valor
+    elif isinstance(valor, float):
+        numero = valor
+    else:
+        return valor
+    return int(numero) if numero.is_integer() else valor
+
+
+def _validar_encabezado(ledger: str, columnas) -> None:
+    faltan = [
+        c for c in columnas_ledger(ledger)
+        if c not in columnas and c != "Método pago"
+    ]
+    if faltan:
+        raise ErrorValidacion(
+            "Al archivo le faltan columnas: " + ", ".join(faltan) + ".", "error"
+        )
+
+
+def importar_facturas(
+    ledger: str,
+    archivo,
+    nombre: str,
+    tamaño_bloque: int = TAMAÑO_BLOQUE,
+    progreso=None,
+) -> ResultadoImportacion:
+    """
+    Importa facturas de `archivo` (ruta o archivo abierto; CSV o XLSX según
+    `nombre`) al libro `ledger`. Las columnas son las del histórico; "Método
+    pago" es opcional. `progreso(filas_leidas)` se llama después de cada bloque.
+    """
+    if nombre.lower().endswith((".xlsx", ".xlsm")):
+        bloques = _bloques_xlsx(archivo, tamaño_bloque)
+    elif nombre.lower().endswith(".csv"):
+        bloques = _bloques_csv(archivo, tamaño_bloque)
+    else:
+        raise ErrorValidacion("Formato no soportado: sube un archivo .csv o .xlsx.", "error")
+
+    contraparte = CONTRAPARTE[ledger]
+    leidas = escritas = duplicadas = con_error = 0
+    errores: list[tuple[int, str]] = []
+    encabezado_ok = False
+
+    for bloque in bloques:
+        if not encabezado_ok:
+            _validar_encabezado(ledger, bloque[0][1].keys() if bloque else [])
+            encabezado_ok = True
+
+        validos = []
+        for numero, fila in bloque:
+            leidas += 1
+            try:
+                validos.append(construir_registro(
+                    ledger,
+                    _normalizar_año(fila.get("Año")),
+                    fila.get("Mes"),
+                    fila.get("Número factura"),
+                    fila.get(contraparte),
+                    fila.get("Fecha emisión"),
+                    fila.get("Fecha pago"),
+                    fila.get("Monto MXN"),
+                    fila.get("Método pago") or METODO_PAGO_DEFAULT,
+                ))
+            except ErrorValidacion as e:
+                con_error += 1
+                if len(errores) < MAX_ERRORES_REPORTADOS:
+                    errores.append((numero, str(e).replace("**", "")))
+
+        nuevos = guardar_lote_historico(ledger, validos)
+        escritas += len(nuevos)
+        duplicadas += len(validos) - len(nuevos)
+        if progreso is not None:
+            progreso(leidas)
+
+    return ResultadoImportacion(leidas, escritas, duplicadas, con_error, errores)
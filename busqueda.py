@@ -0,0 +1,156 @@
+# busqueda.py
+"""
+Búsqueda por texto en el histórico (cliente/proveedor y número de factura).
+
+El texto se normaliza igual en todos lados: minúsculas, sin acentos y
+partido en palabras de letras y números ("CUCEA - UdeG" -> cucea, udeg;
+"F-58230" -> f, 58230). Cada palabra de la consulta se busca como
+prefijo y todas deben aparecer en el registro.
+
+- Backend CSV: IndiceCSV, un índice invertido en memoria (palabra ->
+  posiciones de fila) con la lista de palabras ordenada para resolver
+  prefijos con bisect. Se arma con la primera búsqueda y en las
+  siguientes se pone al día leyendo sólo los bytes nuevos del CSV, igual
+  que el índice de llaves; guardar no lo toca.
+- Backend SQLite: tabla FTS5 con el mismo tokenizador (ver sqlite_backend);
+  aquí sólo se arma la consulta MATCH.
+"""
+import io
+import os
+import re
+import csv
+import bisect
+import hashlib
+import threading
+import unicodedata
+
+import numpy as np
+
+_PALABRA = re.compile(r"[0-9a-z]+")
+
+# Para reconocer el CSV ya indexado: hash de sus primeros bytes y los
+# bytes justo antes de donde nos quedamos (como el sello del snapshot)
+_LARGO_CABEZA = 4096
+_LARGO_SELLO = 64
+
+
+def normalizar(texto) -> str:
+    """Minúsculas y sin acentos ("Papelería Ñandú" -> "papeleria nandu")."""
+    descompuesto = unicodedata.normalize("NFKD", "" if texto is None else str(texto))
+    return "".join(c for c in descompuesto if not unicodedata.combining(c)).lower()
+
+
+def palabras(texto) -> list[str]:
+    return _PALABRA.findall(normalizar(texto))
+
+
+def consulta_fts(texto) -> str | None:
+    """Consulta MATCH de FTS5: cada palabra como prefijo, todas requeridas."""
+    terminos = palabras(texto)
+    if not terminos:
+        return None
+    return " ".join(f'"{t}"*' for t in terminos)
+
+
+class IndiceCSV:
+    """
+    Índice invertido de un CSV del histórico sobre las columnas `columnas`.
+    Las posiciones son el número de fila de datos (0 = primera después del
+    encabezado), las mismas que en el DataFrame leído con pandas.
+    """
+
+    def __init__(self, file_path: str, columnas: list[str]):
+        self.file_path = file_path
+        self.columnas = columnas
+        self._lock = threading.Lock()
+        self._reiniciar()
+
+    def _reiniciar(self) -> None:
+        self._posiciones: dict[str, list[int]] = {}
+        self._ordenadas: list[str] = []
+        self._campos: list[int] | None = None
+        self._sello = None
+        self.filas = 0
+        self.offset = 0
+
+    @staticmethod
+    def _sello_csv(f, inodo: int, offset: int) -> tuple:
+        """(inodo, hash del inicio, bytes antes de `offset`) del CSV abierto en `f`."""
+        f.seek(0)
+        cabeza = hashlib.sha1(f.read(min(offset, _LARGO_CABEZA))).hexdigest()
+        f.seek(max(0, offset - _LARGO_SELLO))
+        return inodo, cabeza, f.read(min(offset, _LARGO_SELLO))
+
+    def al_dia(self) -> "IndiceCSV":
+        """
+        Indexa lo que se haya agregado al CSV desde la última vez. Si el CSV
+        ya no es el que se indexó (se reemplazó, o se editó antes de donde
+        nos quedamos), las posiciones ya no valen y se indexa desde cero.
+        """
+        with self._lock:
+            try:
+                f = open(self.file_path, "rb")
+            except FileNotFoundError:
+                self._reiniciar()
+                return self
+            with f:
+                info = os.fstat(f.fileno())
+                if info.st_size < self.offset or (
+                    self._sello is not None
+                    and self._sello_csv(f, info.st_ino, self.offset) != self._sello
+                ):
+                    self._reiniciar()
+                f.seek(self.offset)
+                nuevo = f.read()
+                fin = nuevo.rfind(b"\n") + 1  # sólo líneas completas
+                if fin == 0:
+                    return self
+                sello = self._sello_csv(f, info.st_ino, self.offset + fin)
+            lector = csv.reader(io.StringIO(nuevo[:fin].decode("utf-8-sig"), newline=""))
+            if self._campos is None:
+                encabezado = next(lector, [])
+                self._campos = [encabezado.index(c) for c in self.columnas if c in encabezado]
+            for valores in lector:
+                if not valores:
+                    continue  # pandas también se salta las líneas vacías
+                for i in self._campos:
+                    if i < len(valores):
+                        for palabra in palabras(valores[i]):
+                            self._agregar(palabra, self.filas)
+                self.filas += 1
+            self.offset += fin
+            self._sello = sello
+        return self
+
+    def _agregar(self, palabra: str, fila: int) -> None:
+        filas = self._posiciones.get(palabra)
+        if filas is None:
+            self._posiciones[palabra] = [fila]
+            bisect.insort(self._ordenadas, palabra)
+        elif filas[-1] != fila:
+            filas.append(fila)
+
+    def _con_prefijo(self, prefijo: str) -> np.ndarray:
+        i = bisect.bisect_left(self._ordenadas, prefijo)
+        grupos = []
+        while i < len(self._ordenadas) and self._ordenadas[i].startswith(prefijo):
+            grupos.append(self._posiciones[self._ordenadas[i]])
+            i += 1
+        if not grupos:
+            return np.empty(0, dtype=np.int64)
+        if len(grupos) == 1:
+            return np.asarray(grupos[0], dtype=np.int64)
+        return np.unique(np.concatenate([np.asarray(g, dtype=np.int64) for g in grupos]))
+
+    def buscar(self, texto) -> np.ndarray:
+        """Posiciones (ordenadas) de las filas que tienen todas las palabras como prefijo."""
+        with self._lock:
+            resultado = None
+            for termino in palabras(texto):
+                filas = self._con_prefijo(termino)
+                resultado = filas if resultado is None else np.intersect1d(
+                    resultado, filas, assume_unique=True
+                )
+                if len(resultado) == 0:
+                    break
+            return resultado if resultado is not None else np.arange(self.filas)
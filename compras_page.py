@@ -2,7 +2,14 @@ import streamlit as st
 import pandas as pd
 from datetime import date
 
-from data_utils import guardar_compra_historica, cargar_compras_historicas
+from bulk_import import importar_facturas
+from data_utils import (
+    ErrorValidacion,
+    construir_registro,
+    parse_monto,
+    pendientes_de_escribir,
+    guardar_compra_historica,
+)
 
 
 # =========================
@@ -21,8 +28,6 @@ def init_state_compras():
     ss.setdefault("c_month", "Selecciona mes")
     ss.setdefault("c_metodo_pago", "TRANSFERENCIA")
 
-    ss.setdefault("compras_historicas", [])
-
 
 # =========================
 # Formatear monto con $ + miles + punto decimal
@@ -36,15 +41,8 @@ def formatear_monto_compras():
         ss["c_monto_mxn"] = "$"
         return
 
-    limpio = (
-        texto.replace("$", "")
-        .replace(",", "")
-        .strip()
-    )
-
-    try:
-        valor = float(limpio)
-    except ValueError:
+    valor = parse_monto(texto)
+    if valor is None:
         ss["c_error"] = "Revisa el formato del monto. Ejemplo válido: 18015.74 o 18,015.74"
         return
 
@@ -72,62 +70,28 @@ def guardar_compra():
         if key in ss:
             del ss[key]
 
-    # ---- VALIDACIONES (warnings) ----
-    if mes == "Selecciona mes":
-        ss["c_warning"] = "Falta seleccionar el **mes** de la compra."
-        return
-
-    if not numero_factura:
-        ss["c_warning"] = "Falta el **número de factura** de la compra."
-        return
-
-    if not proveedor:
-        ss["c_warning"] = "Falta el **proveedor** de la compra."
-        return
-
-    if fecha_emision is None or fecha_pago is None:
-        ss["c_warning"] = "Faltan la **fecha de emisión** y/o la **fecha de pago**."
-        return
-
-    monto_limpio = (
-        monto_texto.replace("$", "")
-        .replace(",", "")
-        .strip()
-    )
-
-    if monto_limpio == "":
-        ss["c_warning"] = "Falta capturar el **monto** de la compra."
-        return
-
+    # ---- VALIDACIONES (mismas reglas que la importación masiva) ----
     try:
-        monto_float = float(monto_limpio)
-    except ValueError:
-        ss["c_error"] = "Formato de monto inválido. Ejemplo válido: 18015.74 o 18,015.74"
+        nuevo_registro = construir_registro(
+            "compras",
+            año,
+            mes,
+            numero_factura,
+            proveedor,
+            fecha_emision,
+            fecha_pago,
+            monto_texto,
+            metodo_pago,
+        )
+    except ErrorValidacion as e:
+        ss["c_error" if e.nivel == "error" else "c_warning"] = str(e)
         return
 
-    fecha_emision_str = fecha_emision.strftime("%d/%m/%Y")
-    fecha_pago_str = fecha_pago.strftime("%d/%m/%Y")
-    monto_formateado = f"${monto_float:,.2f}"
-
-    nuevo_registro = {
-        "Año": año,
-        "Mes": mes,
-        "Número factura": numero_factura,
-        "Fecha emisión": fecha_emision_str,
-        "Proveedor": proveedor,
-        "Monto MXN": monto_formateado,
-        "Fecha pago": fecha_pago_str,
-        "Método pago": metodo_pago,
-    }
-
     # 1) Guardar en la sesión (para mostrar tabla en la página)
     ss["compras"].append(nuevo_registro)
 
     # 2) Guardar en histórico CSV
-    guardar_compra_historica(nuevo_registro)
-
-    # 3) Actualizar histórico en memoria
-    ss["compras_historicas"] = cargar_compras_historicas()
+    guardado = guardar_compra_historica(nuevo_registro)
 
     # Reset para la siguiente compra (solo dejamos el año)
     ss["c_month"] = "Selecciona mes"
@@ -137,7 +101,49 @@ def guardar_compra():
     ss["c_fecha_emision"] = None
     ss["c_fecha_pago"] = None
 
-    ss["c_ok"] = "Factura de compra guardada en el resumen ✅"
+    if guardado.nuevo is False:
+        ss["c_ok"] = "Factura agregada al resumen ✅ (ya estaba en el histórico, no se duplicó)"
+    else:
+        ss["c_ok"] = "Factura de compra guardada en el resumen ✅"
+
+
+# =========================
+# Importación masiva (CSV / XLSX)
+# =========================
+def importacion_compras():
+    with st.expander("📤 Importar facturas de compra desde archivo (CSV o XLSX)"):
+        st.caption(
+            "Columnas: Año, Mes, Número factura, Fecha emisión (dd/mm/aaaa), "
+            "Proveedor, Monto MXN y, opcional, Método pago. "
+            "Las facturas importadas van directo al histórico."
+        )
+        archivo = st.file_uploader(
+            "Archivo de facturas",
+            type=["csv", "xlsx"],
+            key="c_archivo_importacion",
+        )
+        if archivo is None or not st.button("Importar facturas", key="c_btn_importar"):
+            return
+
+        try:
+            with st.spinner("Importando facturas…"):
+                resultado = importar_facturas("compras", archivo, archivo.name)
+        except ErrorValidacion as e:
+            st.error(str(e))
+            return
+
+        st.success(
+            f"{resultado.escritas:,} de {resultado.leidas:,} facturas importadas al histórico ✅"
+        )
+        if resultado.duplicadas:
+            st.info(f"{resultado.duplicadas:,} ya existían en el histórico y se omitieron.")
+        if resultado.con_error:
+            st.warning(f"{resultado.con_error:,} filas con errores no se importaron:")
+            st.dataframe(
+                pd.DataFrame(resultado.errores, columns=["Fila", "Error"]),
+                use_container_width=True,
+                hide_index=True,
+            )
 
 
 # =========================
@@ -163,6 +169,11 @@ def compras_page():
         st.success(ss["c_ok"])
         del ss["c_ok"]
 
+    # Escritura diferida: cuántas facturas siguen en cola para el histórico
+    en_cola = pendientes_de_escribir("compras")
+    if en_cola:
+        st.caption(f"⏳ {en_cola} factura(s) de compra en cola para guardarse en el histórico.")
+
     st.markdown("### Captura de nueva factura de compra")
 
     col1, col2, col3 = st.columns(3)
@@ -249,6 +260,8 @@ def compras_page():
             else:
                 st.info("No hay facturas de compra para eliminar.")
 
+    importacion_compras()
+
     # ===== Tabla con lo capturado =====
     st.markdown("### Facturas de compra capturadas en esta sesión")
 
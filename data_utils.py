@@ -1,54 +1,1750 @@
 # data_utils.py
 import os
+import io
+import csv
+import re
+import json
+import math
+import time
+import uuid
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import date, datetime
+from typing import NamedTuple
+
+import numpy as np
 import pandas as pd
 
-# Carpeta donde se guardan los CSV
+from busqueda import IndiceCSV
+from rendimiento import tramo
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+logger = logging.getLogger(__name__)
+
+# Carpeta donde se guardan los CSV (IMPRESOS_DATA_DIR la cambia, p. ej. en benchmarks)
 BASE_DIR = os.path.dirname(__file__)
-DATA_DIR = os.path.join(BASE_DIR, "data")
+DATA_DIR = os.environ.get("IMPRESOS_DATA_DIR", os.path.join(BASE_DIR, "data"))
 os.makedirs(DATA_DIR, exist_ok=True)
 
 VENTAS_FILE = os.path.join(DATA_DIR, "ventas_historico.csv")
 COMPRAS_FILE = os.path.join(DATA_DIR, "compras_historico.csv")
 
+# Backend de almacenamiento: "csv" (default) o "sqlite"
+STORAGE_BACKEND = os.environ.get("IMPRESOS_STORAGE", "csv").lower()
+DB_FILE = os.environ.get("IMPRESOS_DB", os.path.join(DATA_DIR, "impresos.db"))
+
+# Totales por año/mes/tipo que se mantienen al guardar (ver "AGREGADOS")
+AGREGADOS_FILE = os.path.join(DATA_DIR, "agregados.json")
+
+# Escritura diferida: los guardados van a un diario y un hilo los pasa
+# al histórico por lotes (ver write_queue.py)
+ESCRITURA_DIFERIDA = os.environ.get("IMPRESOS_ESCRITURA_DIFERIDA", "0") == "1"
+
+# Segundos que un escritor espera el bloqueo antes de rendirse
+LOCK_TIMEOUT = float(os.environ.get("IMPRESOS_LOCK_TIMEOUT", "15"))
+
+# Copia tipada en Parquet junto a cada CSV para cargas en frío rápidas
+# (ver "SNAPSHOT PARQUET"); requiere pyarrow
+SNAPSHOTS = os.environ.get("IMPRESOS_SNAPSHOT", "1") == "1"
+
+# ------------ ESQUEMA DE LOS LIBROS ------------
+
+MESES = [
+    "Enero", "Febrero", "Marzo", "Abril",
+    "Mayo", "Junio", "Julio", "Agosto",
+    "Septiembre", "Octubre", "Noviembre", "Diciembre",
+]
+
+# "ventas" y "compras" sólo difieren en la columna de la contraparte
+TIPOS = {"ventas": "Ventas", "compras": "Compras"}
+CONTRAPARTE = {"ventas": "Cliente", "compras": "Proveedor"}
+
+
+def columnas_ledger(ledger: str) -> list[str]:
+    return [
+        "Año", "Mes", "Número factura", "Fecha emisión",
+        CONTRAPARTE[ledger], "Monto MXN", "Fecha pago", "Método pago",
+    ]
+
+
+def _csv_file(ledger: str) -> str:
+    return VENTAS_FILE if ledger == "ventas" else COMPRAS_FILE
+
+
+# ------------ ESQUEMA TIPADO ------------
+#
+# Al cargar, cada libro se convierte una sola vez a tipos reales:
+#   Año            Int16 (nulo si el texto no es un año: nunca 0)
+#   Mes            categórico ordenado (Enero..Diciembre)
+#   Fecha emisión  datetime64
+#   Fecha pago     datetime64
+#   Monto MXN      float64 (pesos)
+#   Cliente / Proveedor, Método pago  categóricos
+# El formato "$18,015.74" / "dd/mm/YYYY" sólo se aplica al mostrar o exportar
+# (ver formatear_ledger).
+
+FORMATO_FECHA = "%d/%m/%Y"
+
+# Filas por bloque al recorrer un libro completo (exportaciones)
+BLOQUE_LECTURA = 20000
+
+# Ordenes del Histórico paginado: nombre -> columnas (None = orden de captura)
+ORDEN_HISTORICO = {
+    "Captura": None,
+    "Periodo": ["Año", "Mes"],
+    "Fecha emisión": ["Fecha emisión"],
+    "Fecha pago": ["Fecha pago"],
+    "Monto MXN": ["Monto MXN"],
+    "Número factura": ["Número factura"],
+}
+
+
+# "$18,015.74" -> "18015.74": quitamos signo, comas de miles y espacios
+_MONTO_LIMPIAR = r"[$,\s]"
+
+
+def parse_montos(serie: pd.Series) -> tuple[pd.Series, int]:
+    """
+    Convierte toda una columna de montos ("$18,015.74", "18015.74", 18015.74)
+    a float64 en una sola pasada.
+    Regresa (valores, invalidos): los vacíos y los que no son número quedan
+    como NaN, y `invalidos` cuenta sólo los que traían texto no numérico
+    (incluidos "nan", "inf" y los que se desbordan, como "1e400").
+    """
+    texto = serie.astype("string").str.replace(_MONTO_LIMPIAR, "", regex=True)
+    valores = pd.to_numeric(texto, errors="coerce").astype("float64")
+    valores = valores.where(np.isfinite(valores))
+    vacios = texto.isna() | (texto == "")
+    invalidos = int((valores.isna() & ~vacios).sum())
+    return valores, invalidos
+
+
+# Columna auxiliar con el texto original de los montos ilegibles
+# ("pendiente"), al lado de su NaN. Sólo la agrega consultar_bloques del
+# backend CSV, para que las exportaciones en texto los copien tal cual;
+# formatear_ledger la usa en lugar del monto vacío y la quita.
+MONTO_ORIGINAL = "_monto_original"
+
+
+def parse_monto(texto) -> float | None:
+    """
+    Versión para un solo valor (formularios). None si está vacío o no es un
+    número finito: float() acepta "nan", "inf" y "1e400" (-> inf).
+    """
+    limpio = re.sub(_MONTO_LIMPIAR, "", "" if texto is None else str(texto))
+    if limpio == "":
+        return None
+    try:
+        monto = float(limpio)
+    except ValueError:
+        return None
+    return monto if math.isfinite(monto) else None
+
+
+def _parse_años(serie: pd.Series) -> pd.Series:
+    """
+    Columna Año -> Int16. Lo que no es un año entero ("2O25", "", 2025.5)
+    queda nulo: esas filas se ven en el histórico pero no forman un año 0
+    en los totales ni en los selectores.
+    """
+    años = pd.to_numeric(serie, errors="coerce")
+    años = años.where((años % 1 == 0) & años.between(1, 9999))
+    return años.astype("Int16")
+
+
+def tipar_ledger(df: pd.DataFrame, ledger: str) -> pd.DataFrame:
+    """
+    Registros en texto (CSV o captura) -> DataFrame con el esquema tipado.
+    En df.attrs["montos_invalidos"] queda cuántos montos no se pudieron leer.
+    """
+    contraparte = CONTRAPARTE[ledger]
+    df = df.reindex(columns=columnas_ledger(ledger))
+    montos, invalidos = parse_montos(df["Monto MXN"])
+    out = pd.DataFrame({
+        "Año": _parse_años(df["Año"]),
+        "Mes": pd.Categorical(df["Mes"], categories=MESES, ordered=True),
+        "Número factura": df["Número factura"].astype("string"),
+        "Fecha emisión": pd.to_datetime(
+            df["Fecha emisión"], format=FORMATO_FECHA, errors="coerce"
+        ),
+        contraparte: df[contraparte].astype("category"),
+        "Monto MXN": montos,
+        "Fecha pago": pd.to_datetime(
+            df["Fecha pago"], format=FORMATO_FECHA, errors="coerce"
+        ),
+        "Método pago": df["Método pago"].astype("category"),
+    })
+    # Los montos ilegibles quedan en NaN (no suman) y se reportan aquí
+    out.attrs["montos_invalidos"] = invalidos
+    return out
+
+
+def ledger_vacio(ledger: str) -> pd.DataFrame:
+    return tipar_ledger(pd.DataFrame(columns=columnas_ledger(ledger)), ledger)
+
+
+def formatear_ledger(df: pd.DataFrame) -> pd.DataFrame:
+    """Copia para mostrar/exportar: montos "$x,xxx.xx" y fechas "dd/mm/YYYY"."""
+    out = df.copy()
+    original = out.pop(MONTO_ORIGINAL) if MONTO_ORIGINAL in out.columns else None
+    for col in out.columns:
+        serie = out[col]
+        if col == "Monto MXN" and pd.api.types.is_numeric_dtype(serie):
+            out[col] = serie.map("${:,.2f}".format, na_action="ignore")
+        elif pd.api.types.is_datetime64_any_dtype(serie):
+            out[col] = serie.dt.strftime(FORMATO_FECHA).fillna("")
+        elif isinstance(serie.dtype, pd.CategoricalDtype):
+            out[col] = serie.astype(object).fillna("")
+        elif col == "Año":
+            out[col] = serie.astype("string").fillna("")
+    if original is not None:
+        out["Monto MXN"] = out["Monto MXN"].where(original.isna(), original)
+    return out.fillna("")
+
+
+# ------------ FILTROS POR RANGO ------------
+
+class Rangos(NamedTuple):
+    """
+    Filtros por rango sobre las columnas tipadas (extremos incluidos,
+    None = sin límite). `sin_pago` deja sólo las facturas sin fecha de pago.
+    "Sin pagar con más de 30 días" = Rangos(emision_hasta=hoy - 30 días, sin_pago=True).
+    """
+
+    emision_desde: date | None = None
+    emision_hasta: date | None = None
+    pago_desde: date | None = None
+    pago_hasta: date | None = None
+    monto_min: float | None = None
+    monto_max: float | None = None
+    sin_pago: bool = False
+
+    def activos(self) -> bool:
+        return any(v not in (None, False) for v in self)
+
+    def limites(self):
+        """(columna, desde, hasta) de cada rango con algún extremo."""
+        for col, desde, hasta in (
+            ("Fecha emisión", self.emision_desde, self.emision_hasta),
+            ("Fecha pago", self.pago_desde, self.pago_hasta),
+            ("Monto MXN", self.monto_min, self.monto_max),
+        ):
+            if desde is not None or hasta is not None:
+                yield col, desde, hasta
+
+
+def _valor_rango(col: str, valor):
+    """Extremo del rango en el tipo de la columna (datetime64 o float)."""
+    if valor is None:
+        return None
+    return float(valor) if col == "Monto MXN" else np.datetime64(pd.Timestamp(valor))
+
+
+def filtrar_rangos(df: pd.DataFrame, rangos: "Rangos | None") -> pd.DataFrame:
+    """Aplica `rangos` a un DataFrame tipado (un bloque, una consulta ya filtrada)."""
+    if rangos is None or not rangos.activos():
+        return df
+    mascara = np.ones(len(df), dtype=bool)
+    for col, desde, hasta in rangos.limites():
+        valores = df[col].to_numpy()
+        if desde is not None:
+            mascara &= valores >= _valor_rango(col, desde)
+        if hasta is not None:
+            mascara &= valores <= _valor_rango(col, hasta)
+    if rangos.sin_pago:
+        mascara &= df["Fecha pago"].isna().to_numpy()
+    return df[mascara]
+
+
+# ------------ VALIDACIÓN DE FACTURAS ------------
+#
+# Las mismas reglas para la captura de una factura (páginas Ventas/Compras)
+# y para la importación masiva desde archivo.
+
+class ErrorValidacion(ValueError):
+    """Dato faltante o inválido en una factura. `nivel`: "warning" o "error"."""
+
+    def __init__(self, mensaje: str, nivel: str = "warning"):
+        super().__init__(mensaje)
+        self.nivel = nivel
+
+
+_MENSAJES = {
+    "ventas": {
+        "mes": "Falta seleccionar el **mes** de la venta.",
+        "numero": "Falta el **número de factura**.",
+        "contraparte": "Falta el **cliente** de la factura.",
+        "monto": "Falta capturar el **monto** de la factura.",
+    },
+    "compras": {
+        "mes": "Falta seleccionar el **mes** de la compra.",
+        "numero": "Falta el **número de factura** de la compra.",
+        "contraparte": "Falta el **proveedor** de la compra.",
+        "monto": "Falta capturar el **monto** de la compra.",
+    },
+}
+
+
+def _a_fecha(valor):
+    """date/datetime o texto "dd/mm/YYYY" -> date. None si viene vacío."""
+    if valor is None or pd.isna(valor):
+        return None
+    if isinstance(valor, datetime):
+        return valor.date()
+    if isinstance(valor, date):
+        return valor
+    texto = str(valor).strip()
+    if texto == "":
+        return None
+    try:
+        # equivalente a strptime(FORMATO_FECHA) pero mucho más rápido por fila
+        dia, mes, año = texto.split("/")
+        if len(año) != 4:
+            raise ValueError(texto)
+        return date(int(año), int(mes), int(dia))
+    except ValueError:
+        raise ErrorValidacion(
+            f"Fecha inválida: {texto!r}. Usa el formato dd/mm/aaaa.", "error"
+        )
+
+
+def construir_registro(
+    ledger: str,
+    año,
+    mes,
+    numero_factura,
+    contraparte,
+    fecha_emision,
+    fecha_pago,
+    monto,
+    metodo_pago,
+) -> dict:
+    """
+    Valida los datos de una factura y regresa el registro listo para
+    guardar (monto "$x,xxx.xx", fechas "dd/mm/YYYY").
+    Lanza ErrorValidacion con el mensaje para el usuario si falta algo.
+    """
+    mensajes = _MENSAJES[ledger]
+
+    mes = "" if mes is None else str(mes).strip()
+    if mes not in MESES:
+        if mes in ("", "Selecciona mes"):
+            raise ErrorValidacion(mensajes["mes"])
+        raise ErrorValidacion(f"Mes inválido: {mes!r}.", "error")
+
+    numero_factura = "" if numero_factura is None else str(numero_factura).strip()
+    if not numero_factura:
+        raise ErrorValidacion(mensajes["numero"])
+
+    contraparte = "" if contraparte is None else str(contraparte).strip()
+    if not contraparte:
+        raise ErrorValidacion(mensajes["contraparte"])
+
+    fecha_emision = _a_fecha(fecha_emision)
+    fecha_pago = _a_fecha(fecha_pago)
+    if fecha_emision is None or fecha_pago is None:
+        raise ErrorValidacion("Faltan la **fecha de emisión** y/o la **fecha de pago**.")
+
+    monto_texto = "" if monto is None else str(monto).strip()
+    if monto_texto.replace("$", "").strip() == "":
+        raise ErrorValidacion(mensajes["monto"])
+    monto_float = parse_monto(monto_texto)
+    if monto_float is None:
+        raise ErrorValidacion(
+            "Formato de monto inválido. Ejemplo válido: 18015.74 o 18,015.74", "error"
+        )
+
+    try:
+        año = int(año)
+    except (TypeError, ValueError):
+        raise ErrorValidacion(f"Año inválido: {año!r}.", "error")
+
+    return {
+        "Año": año,
+        "Mes": mes,
+        "Número factura": numero_factura,
+        "Fecha emisión": fecha_emision.strftime(FORMATO_FECHA),
+        CONTRAPARTE[ledger]: contraparte,
+        "Monto MXN": f"${monto_float:,.2f}",
+        "Fecha pago": fecha_pago.strftime(FORMATO_FECHA),
+        "Método pago": metodo_pago,
+    }
+
+
+# ------------ CACHÉ DE LECTURA (compartida entre sesiones) ------------
+
+_FALTA = object()
+
+
+class _LedgerCache:
+    """
+    Caché de proceso para los libros ya parseados.
+    Cada entrada guarda la "firma" del archivo (mtime + tamaño); si la firma
+    cambia, la siguiente lectura vuelve a cargar. Es segura entre hilos:
+    Streamlit corre cada sesión en su propio hilo.
+
+    El candado general sólo cubre leer o instalar entradas; cada carga corre
+    con el candado de su clave, así una consulta de usuarios no espera a que
+    otra sesión termine de parsear un libro, y dos sesiones que piden el
+    mismo libro frío lo cargan una sola vez.
+
+    Lo que regresa se comparte entre sesiones: no hay que modificarlo.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entradas: dict[str, tuple] = {}
+        # RLock por clave: un cargador puede volver a pedir su propia clave
+        self._cargando: dict[str, threading.RLock] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _vigente(self, clave: str, firma):
+        # _FALTA y no None: None también se cachea (p. ej. "no hay snapshot")
+        entrada = self._entradas.get(clave)
+        return entrada[1] if entrada is not None and entrada[0] == firma else _FALTA
+
+    def vigente(self, clave: str, firma):
+        """El valor guardado si su firma coincide, sin cargar nada (None si no)."""
+        with self._lock:
+            valor = self._vigente(clave, firma)
+        return None if valor is _FALTA else valor
+
+    def obtener(self, clave: str, firma, cargar):
+        with self._lock:
+            valor = self._vigente(clave, firma)
+            if valor is not _FALTA:
+                self.hits += 1
+                return valor
+            candado = self._cargando.setdefault(clave, threading.RLock())
+
+        with candado:
+            with self._lock:
+                # otra sesión pudo cargarlo mientras esperábamos
+                valor = self._vigente(clave, firma)
+                if valor is not _FALTA:
+                    self.hits += 1
+                    return valor
+                self.misses += 1
+            valor = cargar()
+            with self._lock:
+                self._entradas[clave] = (firma, valor)
+            return valor
+
+    def invalidar(self, clave: str | None = None) -> None:
+        with self._lock:
+            if clave is None:
+                self._entradas.clear()
+            else:
+                self._entradas.pop(clave, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entradas": len(self._entradas),
+            }
+
+
+_CACHE = _LedgerCache()
+
 
-def _append_row(file_path: str, row: dict):
+def _firma_archivo(file_path: str):
+    """(mtime, tamaño) del archivo, o None si no existe."""
+    try:
+        st = os.stat(file_path)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def cache_stats() -> dict:
+    """Contadores de la caché de lectura (hits, misses, entradas)."""
+    return _CACHE.stats()
+
+
+def leer_con_cache(file_path: str, cargar):
     """
-    Agrega un registro al CSV.
-    - Si el archivo existe, concatena y elimina duplicados exactos.
-    - Si no existe, lo crea con la primera fila.
+    `cargar()` una sola vez por versión del archivo: el resultado se comparte
+    entre sesiones mientras el archivo no cambie (mtime + tamaño), así que
+    no hay que modificarlo.
     """
-    df_new = pd.DataFrame([row])
+    return _CACHE.obtener(file_path, _firma_archivo(file_path), cargar)
+
+
+def invalidar_cache(file_path: str) -> None:
+    """Descarta lo cacheado de `file_path` (después de reescribirlo)."""
+    _CACHE.invalidar(file_path)
+
+
+# ------------ ESCRITURA SEGURA (bloqueo + reemplazo atómico) ------------
+
+# Bloqueos que ya tiene cada hilo, para que sean reentrantes
+# (flock sobre otro descriptor en el mismo proceso se bloquearía a sí mismo).
+_LOCKS_TOMADOS = threading.local()
+
 
-    if os.path.exists(file_path):
-        df = pd.read_csv(file_path, dtype=str)
-        df = pd.concat([df, df_new], ignore_index=True).drop_duplicates()
+def _intentar_lock(f) -> None:
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
     else:
-        df = df_new
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+
+
+def _soltar_lock(f) -> None:
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+    else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+@contextmanager
+def bloqueo_archivo(file_path: str, timeout: float | None = None):
+    """
+    Bloqueo exclusivo sobre "<archivo>.lock", válido entre procesos y entre
+    hilos (cada sesión de Streamlit es un hilo). Si otro escritor lo tiene,
+    reintenta con espera creciente y lanza TimeoutError al pasar `timeout`.
+    """
+    tomados = getattr(_LOCKS_TOMADOS, "rutas", None)
+    if tomados is None:
+        tomados = _LOCKS_TOMADOS.rutas = set()
+    if file_path in tomados:
+        yield
+        return
+
+    timeout = LOCK_TIMEOUT if timeout is None else timeout
+    limite = time.monotonic() + timeout
+    espera = 0.005
+    with open(file_path + ".lock", "a+") as f:
+        while True:
+            try:
+                _intentar_lock(f)
+                break
+            except OSError:
+                if time.monotonic() >= limite:
+                    raise TimeoutError(
+                        f"No se pudo bloquear {os.path.basename(file_path)} "
+                        f"después de {timeout:.0f}s; otro usuario está guardando."
+                    )
+                time.sleep(espera)
+                espera = min(espera * 2, 0.25)
+
+        tomados.add(file_path)
+        try:
+            yield
+        finally:
+            tomados.discard(file_path)
+            _soltar_lock(f)
+
+
+def escribir_atomico(file_path: str, escribir, modo: str = "w", **open_kwargs) -> None:
+    """
+    Escribe a un temporal en la misma carpeta, hace fsync y lo renombra encima
+    del original: quien lea ve el archivo viejo o el nuevo, nunca uno a medias.
+    `escribir(f)` recibe el archivo temporal abierto.
+    """
+    tmp = f"{file_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp, modo, **open_kwargs) as f:
+            escribir(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, file_path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def agregar_sincronizado(file_path: str, texto: str) -> None:
+    """Agrega texto al final del archivo y espera a que llegue a disco."""
+    with open(file_path, "a", newline="", encoding="utf-8") as f:
+        f.write(texto)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+# ------------ ÍNDICE DE LLAVES (duplicados) ------------
+
+# Por cada CSV guardamos en memoria el conjunto de llaves (hash de la fila)
+# que ya están escritas y hasta qué byte de "<csv>.keys" lo hemos leído.
+# El índice vive en disco para no releer el CSV cada vez que arranca el
+# proceso, y como es de sólo-agregar, cada escritor lee únicamente lo que
+# otros procesos agregaron desde su última vez.
+#
+# "<csv>.keys.sello" ata el índice al CSV que describe (tamaño, hash de
+# los primeros bytes y los últimos bytes) y se reescribe en cada guardado.
+# Si el CSV se editó a mano, se reemplazó o se borró, el sello ya no
+# coincide y el índice se rehace desde el CSV (o se descarta si no hay
+# CSV): si no, una fila borrada a mano contaría como duplicada para siempre.
+_KEY_INDEX: dict[str, dict] = {}
+
+_LARGO_CABEZA = 4096
+_LARGO_COLA = 64
+
+
+def _index_path(file_path: str) -> str:
+    return file_path + ".keys"
+
+
+def _sello_index_path(file_path: str) -> str:
+    return file_path + ".keys.sello"
+
+
+def _sello_csv(file_path: str) -> dict | None:
+    """Tamaño, hash del inicio y últimos bytes del CSV, o None si no existe."""
+    try:
+        with open(file_path, "rb") as f:
+            cabeza = f.read(_LARGO_CABEZA)
+            tamaño = f.seek(0, os.SEEK_END)
+            f.seek(max(0, tamaño - _LARGO_COLA))
+            cola = f.read(_LARGO_COLA)
+    except FileNotFoundError:
+        return None
+    return {
+        "tamaño": tamaño,
+        "cabeza": hashlib.sha1(cabeza).hexdigest(),
+        "cola": cola.hex(),
+    }
+
+
+def _leer_sello_index(file_path: str) -> dict | None:
+    try:
+        with open(_sello_index_path(file_path), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _escribir_sello_index(file_path: str, sello: dict) -> None:
+    escribir_atomico(
+        _sello_index_path(file_path), lambda f: json.dump(sello, f), encoding="utf-8"
+    )
+
+
+def _row_key(values: list[str]) -> str:
+    """Llave de una fila: hash de todos sus valores (duplicado exacto)."""
+    return hashlib.sha1("\x1f".join(values).encode("utf-8")).hexdigest()
+
+
+def _row_values(row: dict, header: list[str]) -> list[str]:
+    """Valores de la fila en el orden del encabezado, todos como texto."""
+    return ["" if row.get(col) is None else str(row.get(col)) for col in header]
+
+
+def _read_header(file_path: str) -> list[str]:
+    with open(file_path, "r", newline="", encoding="utf-8") as f:
+        return next(csv.reader(f), [])
+
+
+def _construir_key_index(file_path: str, sello: dict) -> None:
+    """Genera "<csv>.keys" (y su sello) a partir del CSV existente."""
+    keys = set()
+    with open(file_path, "r", newline="", encoding="utf-8") as f:
+        reader = csv.reader(f)
+        next(reader, None)  # encabezado
+        for values in reader:
+            keys.add(_row_key(values))
+    escribir_atomico(
+        _index_path(file_path),
+        lambda f: f.writelines(k + "\n" for k in keys),
+        encoding="utf-8",
+    )
+    _escribir_sello_index(file_path, sello)
+
+
+def _load_key_index(file_path: str) -> set[str]:
+    """
+    Devuelve el índice de llaves del CSV, al día con lo que hay en disco.
+    Debe llamarse con el bloqueo del CSV tomado.
+    """
+    idx_path = _index_path(file_path)
+    sello = _sello_csv(file_path)
+    if sello is None:
+        # Sin CSV no hay filas: un índice viejo haría pasar todo por duplicado
+        for ruta in (idx_path, _sello_index_path(file_path)):
+            if os.path.exists(ruta):
+                os.remove(ruta)
+        _KEY_INDEX[file_path] = {"keys": set(), "offset": 0, "inodo": None}
+        return _KEY_INDEX[file_path]["keys"]
+
+    if not os.path.exists(idx_path) or _leer_sello_index(file_path) != sello:
+        _construir_key_index(file_path, sello)
+
+    info = os.stat(idx_path)
+    entrada = _KEY_INDEX.get(file_path)
+    if entrada is None or entrada["inodo"] != info.st_ino or info.st_size < entrada["offset"]:
+        # el índice se regeneró (aquí o en otro proceso): lo leemos desde cero
+        entrada = _KEY_INDEX[file_path] = {"keys": set(), "offset": 0, "inodo": info.st_ino}
+
+    with open(idx_path, "rb") as f:
+        f.seek(entrada["offset"])
+        nuevo = f.read()
+    fin = nuevo.rfind(b"\n") + 1  # sólo líneas completas
+    entrada["keys"].update(k.decode("ascii") for k in nuevo[:fin].split())
+    entrada["offset"] += fin
+    return entrada["keys"]
+
+
+def _append_rows(file_path: str, rows: list[dict]) -> list[dict]:
+    """
+    Agrega registros al final del CSV sin reescribirlo.
+    - Si el archivo no existe, lo crea con encabezado + filas.
+    - Los duplicados exactos (contra el archivo o dentro del mismo lote)
+      se detectan con el índice de llaves, no leyendo todo el archivo.
+    - Todo ocurre con el bloqueo del CSV tomado y el lote se sincroniza a
+      disco (fsync) de una sola vez, así dos cajas guardando a la vez no se
+      pisan y un corte no deja el archivo truncado.
+    Devuelve los registros que sí se escribieron.
+    """
+    if not rows:
+        return []
+
+    with bloqueo_archivo(file_path):
+        existe = os.path.exists(file_path) and os.path.getsize(file_path) > 0
+        header = _read_header(file_path) if existe else list(rows[0].keys())
+        keys = _load_key_index(file_path)
+
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator="\n")
+        if not existe:
+            writer.writerow(header)
+
+        escritos, nuevas_keys = [], []
+        for row in rows:
+            values = _row_values(row, header)
+            key = _row_key(values)
+            if key in keys:
+                continue
+            keys.add(key)
+            writer.writerow(values)
+            escritos.append(row)
+            nuevas_keys.append(key)
+
+        if not escritos:
+            return []
+
+        # Si alguien editó el CSV a mano y quedó sin salto de línea final,
+        # lo agregamos antes de las filas nuevas para no pegarlas a la anterior.
+        texto = ""
+        if existe:
+            with open(file_path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) not in (b"\n", b"\r"):
+                    texto = "\n"
+
+        agregar_sincronizado(file_path, texto + buffer.getvalue())
+        agregar_sincronizado(_index_path(file_path), "".join(k + "\n" for k in nuevas_keys))
+        _escribir_sello_index(file_path, _sello_csv(file_path))
+
+    _CACHE.invalidar(file_path)
+    return escritos
+
+
+def _append_row(file_path: str, row: dict) -> bool:
+    """Agrega un registro. True si se escribió, False si era duplicado."""
+    return bool(_append_rows(file_path, [row]))
+
+
+# ------------ SNAPSHOT PARQUET (particionado por año) ------------
+#
+# Junto a cada CSV vive la carpeta "<csv>.anios/" con el libro ya tipado,
+# un Parquet por año ("2025.<version>.parquet") con la columna "_fila"
+# (posición de la fila en el CSV), y "_meta.json" con:
+#   - la firma del CSV que cubre (mtime + tamaño = offset) y los últimos
+#     bytes antes de ese punto (sello), para detectar si el CSV se
+#     reescribió en lugar de sólo crecer;
+#   - por año: archivo y número de filas.
+# Al cargar:
+#   - snapshot al día            -> se leen los Parquet (memory map), sin parsear texto;
+#   - el CSV sólo creció         -> Parquet + las filas nuevas del final del CSV;
+#   - no hay snapshot o no cuadra -> CSV completo.
+# En los dos últimos casos el snapshot se rehace en un hilo de fondo con
+# lo que ya se cargó; como el CSV sólo crece, los años que no recibieron
+# filas nuevas conservan su archivo. Las consultas de un año abren sólo la
+# partición de ese año, y las de pocas columnas (totales, años, meses)
+# leen sólo esas columnas.
+
+_LARGO_SELLO = 64
+# Sube cuando cambia el esquema tipado: los snapshots anteriores se ignoran
+# (el 1 guardaba los años ilegibles como 0)
+_ESQUEMA_SNAPSHOT = 2
+# Partición de las filas sin año legible
+_SIN_AÑO = "sin_año"
+_SNAPSHOTS_EN_CURSO: set[str] = set()
+_SNAPSHOTS_LOCK = threading.Lock()
+
 
-    df.to_csv(file_path, index=False)
+def _snapshot_dir(file_path: str) -> str:
+    return file_path + ".anios"
+
+
+def _sello(file_path: str, offset: int) -> str:
+    with open(file_path, "rb") as f:
+        f.seek(max(0, offset - _LARGO_SELLO))
+        return f.read(min(offset, _LARGO_SELLO)).hex()
+
+
+def _meta_snapshot(file_path: str) -> dict | None:
+    """_meta.json del snapshot si sigue siendo un prefijo del CSV, si no None."""
+    if not SNAPSHOTS:
+        return None
+    meta_path = os.path.join(_snapshot_dir(file_path), "_meta.json")
+
+    def cargar():
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    meta = _CACHE.obtener(meta_path, _firma_archivo(meta_path), cargar)
+    if meta is None or meta.get("esquema") != _ESQUEMA_SNAPSHOT or not os.path.exists(file_path):
+        return None
+    mtime, tamaño = _firma_archivo(file_path)
+    offset = meta["offset"]
+    if offset > tamaño or (offset == tamaño and meta["mtime"] != mtime):
+        return None
+    if _sello(file_path, offset) != meta["sello"]:
+        return None
+    return meta
+
+
+def _concat_tipados(partes: list[pd.DataFrame], ignore_index: bool = False) -> pd.DataFrame:
+    """Concat de partes del mismo libro conservando los categóricos."""
+    con_filas = [p for p in partes if not p.empty] or partes[:1]
+    df = pd.concat(con_filas, ignore_index=ignore_index)
+    for col in df.columns:
+        if isinstance(partes[0][col].dtype, pd.CategoricalDtype) and not isinstance(
+            df[col].dtype, pd.CategoricalDtype
+        ):
+            df[col] = df[col].astype("category")
+    df.attrs["montos_invalidos"] = sum(p.attrs.get("montos_invalidos", 0) for p in partes)
+    return df
+
+
+def _leer_particiones(file_path: str, meta: dict, años=None, columnas=None) -> pd.DataFrame | None:
+    """
+    Las particiones de `años` (todas si None), con la posición en el CSV
+    como índice. None si falta pyarrow o algún archivo no se pudo leer.
+    """
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        return None
+    carpeta = _snapshot_dir(file_path)
+    cols = None if columnas is None else [*columnas, "_fila"]
+    partes = []
+    try:
+        for año, info in meta["particiones"].items():
+            if años is not None and año not in {str(a) for a in años}:
+                continue
+            tabla = pq.read_table(os.path.join(carpeta, info["archivo"]), columns=cols, memory_map=True)
+            partes.append(tabla.to_pandas().set_index("_fila"))
+    except Exception:
+        # otro proceso rehizo el snapshot entre leer _meta.json y los archivos
+        return None
+    if not partes:
+        return None
+    df = _concat_tipados(partes)
+    df.index.name = None
+    return df
+
+
+def _cola_csv(file_path: str, ledger: str, offset: int, tamaño: int, primera: int) -> pd.DataFrame:
+    """Filas del CSV entre `offset` y `tamaño` (las agregadas tras el snapshot), tipadas."""
+    with open(file_path, "rb") as f:
+        encabezado = f.readline()
+        f.seek(offset)
+        nuevo = f.read(tamaño - offset)
+    cola = tipar_ledger(pd.read_csv(io.BytesIO(encabezado + nuevo), dtype=str, encoding="utf-8"), ledger)
+    cola.index = pd.RangeIndex(primera, primera + len(cola))
+    return cola
+
+
+def _escribir_snapshot(file_path: str, df: pd.DataFrame, firma: tuple, previo: dict | None) -> None:
+    """
+    Escribe las particiones que cambiaron y luego _meta.json (reemplazo atómico).
+    `previo` es el meta del que se partió al cargar, si era un prefijo válido.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    mtime, offset = firma
+    actual = _meta_snapshot(file_path)
+    if actual is not None and (actual["offset"], actual["mtime"]) == (offset, mtime):
+        return  # otra carga ya lo dejó al día
+    carpeta = _snapshot_dir(file_path)
+    os.makedirs(carpeta, exist_ok=True)
+    version = uuid.uuid4().hex[:8]
+    anteriores = (previo or {}).get("particiones", {})
+    particiones = {}
+    for año, grupo in df.groupby("Año", sort=True, dropna=False):
+        clave = _SIN_AÑO if pd.isna(año) else str(int(año))
+        info = anteriores.get(clave)
+        if info is not None and info["filas"] == len(grupo):
+            particiones[clave] = info   # sin filas nuevas: el mismo archivo
+            continue
+        archivo = f"{clave}.{version}.parquet"
+        tabla = pa.Table.from_pandas(grupo.assign(_fila=grupo.index.to_numpy()), preserve_index=False)
+        escribir_atomico(
+            os.path.join(carpeta, archivo), lambda f: pq.write_table(tabla, f), modo="wb"
+        )
+        particiones[clave] = {"archivo": archivo, "filas": len(grupo)}
+    meta = {
+        "esquema": _ESQUEMA_SNAPSHOT,
+        "offset": offset,
+        "mtime": mtime,
+        "sello": _sello(file_path, offset),
+        "filas": len(df),
+        "montos_invalidos": int(df.attrs.get("montos_invalidos", 0)),
+        "particiones": particiones,
+    }
+    escribir_atomico(
+        os.path.join(carpeta, "_meta.json"),
+        lambda f: json.dump(meta, f, ensure_ascii=False, indent=1),
+        encoding="utf-8",
+    )
+    # Archivos que ya no usa nadie (con margen para quien esté leyendo el meta anterior)
+    vigentes = {info["archivo"] for info in particiones.values()} | {"_meta.json"}
+    for nombre in os.listdir(carpeta):
+        ruta = os.path.join(carpeta, nombre)
+        try:
+            if nombre not in vigentes and time.time() - os.path.getmtime(ruta) > 60:
+                os.remove(ruta)
+        except OSError:
+            pass
+
+
+def _refrescar_snapshot(file_path: str, df: pd.DataFrame, firma: tuple, previo: dict | None) -> None:
+    """Rehace el snapshot en un hilo de fondo (uno a la vez por archivo)."""
+    if not SNAPSHOTS:
+        return
+    with _SNAPSHOTS_LOCK:
+        if file_path in _SNAPSHOTS_EN_CURSO:
+            return
+        _SNAPSHOTS_EN_CURSO.add(file_path)
+
+    def escribir():
+        try:
+            _escribir_snapshot(file_path, df, firma, previo)
+        except ImportError:
+            pass
+        except Exception:
+            logger.exception("No se pudo escribir el snapshot de %s", file_path)
+        finally:
+            with _SNAPSHOTS_LOCK:
+                _SNAPSHOTS_EN_CURSO.discard(file_path)
+
+    threading.Thread(target=escribir, name="impresos-snapshot", daemon=True).start()
+
+
+@tramo("cargar libro")
+def _cargar_csv_tipado(file_path: str, ledger: str) -> pd.DataFrame:
+    """El libro tipado completo, desde el snapshot cuando se puede (ver arriba)."""
+    firma = _firma_archivo(file_path)
+    tamaño = firma[1]
+    meta = _meta_snapshot(file_path)
+    df = _leer_particiones(file_path, meta) if meta is not None else None
+    if df is not None:
+        # Las particiones vienen por año: se regresan al orden del CSV
+        df = df.sort_index()
+        df.attrs["montos_invalidos"] = meta["montos_invalidos"]
+        if meta["offset"] == tamaño:
+            return df.reset_index(drop=True)
+        cola = _cola_csv(file_path, ledger, meta["offset"], tamaño, meta["filas"])
+        df = _concat_tipados([df, cola], ignore_index=True)
+    else:
+        meta = None
+        df = tipar_ledger(pd.read_csv(file_path, dtype=str), ledger)
+    # Si el CSV cambió mientras leíamos no sabemos hasta dónde llegamos: no se guarda
+    if _firma_archivo(file_path) == firma:
+        _refrescar_snapshot(file_path, df, firma, meta)
+    return df
+
+
+def _columnas_csv(file_path: str, columnas: list[str], leer_todo) -> pd.DataFrame:
+    """
+    Sólo `columnas` del libro: del libro completo si ya está en caché, si no
+    del snapshot (sólo esas columnas) cuando está al día, y si no, completo.
+    """
+    firma = _firma_archivo(file_path)
+    completo = _CACHE.vigente(file_path, firma)
+    if completo is not None:
+        return completo[columnas]
+
+    def cargar():
+        meta = _meta_snapshot(file_path)
+        if meta is not None and meta["offset"] == firma[1]:
+            df = _leer_particiones(file_path, meta, columnas=columnas)
+            if df is not None:
+                df = df.sort_index().reset_index(drop=True)
+                df.attrs["montos_invalidos"] = meta["montos_invalidos"]
+                return df
+        return leer_todo()[columnas]
+
+    return _CACHE.obtener(f"{file_path}#cols:{','.join(columnas)}", firma, cargar)
+
+
+def _año_csv(file_path: str, ledger: str, año: int, leer_todo) -> pd.DataFrame:
+    """
+    Las filas de un año con su posición en el CSV como índice: del libro
+    completo si ya está en caché, si no sólo de la partición de ese año
+    (más las filas de ese año agregadas tras el snapshot).
+    """
+    firma = _firma_archivo(file_path)
+    completo = _CACHE.vigente(file_path, firma)
+    if completo is not None:
+        return completo[completo["Año"] == año]
+
+    def cargar():
+        meta = _meta_snapshot(file_path)
+        if meta is not None:
+            if str(año) not in meta["particiones"]:
+                df = ledger_vacio(ledger)
+            else:
+                df = _leer_particiones(file_path, meta, años=[año])
+            if df is not None:
+                if meta["offset"] < firma[1]:
+                    cola = _cola_csv(file_path, ledger, meta["offset"], firma[1], meta["filas"])
+                    df = _concat_tipados([df, cola[cola["Año"] == año]])
+                return df
+        df = leer_todo()
+        return df[df["Año"] == año]
+
+    return _CACHE.obtener(f"{file_path}#año:{año}", firma, cargar)
+
+
+# ------------ BACKENDS ------------
+
+class CSVBackend:
+    """Un CSV por libro. Filtra en pandas sobre el libro (o sobre la partición de un año)."""
+
+    nombre = "csv"
+
+    def __init__(self):
+        # Índice de búsqueda por libro (cliente/proveedor y número de factura)
+        self._indices = {
+            ledger: IndiceCSV(_csv_file(ledger), [CONTRAPARTE[ledger], "Número factura"])
+            for ledger in TIPOS
+        }
+
+    def guardar(self, ledger: str, row: dict) -> bool:
+        return _append_row(_csv_file(ledger), row)
+
+    def guardar_muchos(self, ledger: str, rows: list[dict]) -> list[dict]:
+        return _append_rows(_csv_file(ledger), rows)
+
+    def _leer(self, ledger: str) -> pd.DataFrame:
+        """CSV completo ya tipado, desde la caché mientras el archivo no cambie."""
+        file_path = _csv_file(ledger)
+
+        def cargar():
+            if not os.path.exists(file_path):
+                return ledger_vacio(ledger)
+            return _cargar_csv_tipado(file_path, ledger)
+
+        return _CACHE.obtener(file_path, _firma_archivo(file_path), cargar)
+
+    def _columnas(self, ledger: str, columnas: list[str]) -> pd.DataFrame:
+        file_path = _csv_file(ledger)
+        if not os.path.exists(file_path):
+            return ledger_vacio(ledger)[columnas]
+        return _columnas_csv(file_path, columnas, lambda: self._leer(ledger))
+
+    def _leer_año(self, ledger: str, año) -> pd.DataFrame | None:
+        """
+        Las filas de un año (con su posición en el CSV como índice) sin cargar
+        el libro completo, o None si el libro completo ya está en caché y
+        conviene usar sus índices.
+        """
+        file_path = _csv_file(ledger)
+        if año is None or not os.path.exists(file_path):
+            return None
+        if _CACHE.vigente(file_path, _firma_archivo(file_path)) is not None:
+            return None
+        return _año_csv(file_path, ledger, int(año), lambda: self._leer(ledger))
+
+    def _filtrar_año(self, ledger: str, df: pd.DataFrame, mes=None, texto=None,
+                     rangos: Rangos | None = None) -> pd.DataFrame:
+        """Filtros de mes, texto y rangos sobre las filas de un año."""
+        if mes is not None:
+            df = df[df["Mes"] == mes]
+        if texto:
+            df = df[np.isin(df.index.to_numpy(), self.buscar(ledger, texto))]
+        return filtrar_rangos(df, rangos)
+
+    def firma(self, ledger: str):
+        return _firma_archivo(_csv_file(ledger))
+
+    @staticmethod
+    def _filtrar(df: pd.DataFrame, ledger: str, año=None, mes=None, contraparte=None) -> pd.DataFrame:
+        if año is not None:
+            df = df[df["Año"] == int(año)]
+        if mes is not None:
+            df = df[df["Mes"] == mes]
+        if contraparte is not None:
+            df = df[df[CONTRAPARTE[ledger]] == contraparte]
+        return df
+
+    def consultar(self, ledger: str, año=None, mes=None, contraparte=None) -> pd.DataFrame:
+        df = self._leer_año(ledger, año)
+        if df is not None:
+            return self._filtrar(df, ledger, None, mes, contraparte).reset_index(drop=True)
+        return self._filtrar(self._leer(ledger), ledger, año, mes, contraparte)
+
+    def consultar_bloques(self, ledger: str, año=None, mes=None, texto=None,
+                          rangos: Rangos | None = None, tamaño: int = BLOQUE_LECTURA):
+        """
+        Como consultar(), pero leyendo el CSV por bloques de `tamaño` filas
+        (sin pasar por la caché): nunca hay más de un bloque en memoria.
+        """
+        file_path = _csv_file(ledger)
+        if not os.path.exists(file_path):
+            return
+        encontradas = self.buscar(ledger, texto) if texto else None
+        inicio = 0
+        for bloque in pd.read_csv(file_path, dtype=str, chunksize=tamaño):
+            df = tipar_ledger(bloque, ledger)
+            if df.attrs["montos_invalidos"]:
+                df[MONTO_ORIGINAL] = bloque["Monto MXN"].where(df["Monto MXN"].isna())
+            if encontradas is not None:
+                df = df[np.isin(np.arange(inicio, inicio + len(df)), encontradas)]
+            inicio += len(bloque)
+            df = filtrar_rangos(self._filtrar(df, ledger, año, mes), rangos)
+            if not df.empty:
+                yield df
+
+    def buscar(self, ledger: str, texto) -> np.ndarray:
+        """
+        Posiciones de las filas cuyo cliente/proveedor o número de factura
+        coincide. El índice se arma (y se pone al día) aquí y no al guardar:
+        tokenizar el libro no debe correr con el bloqueo de escritura tomado.
+        """
+        return self._indices[ledger].al_dia().buscar(texto)
+
+    def _rango(self, ledger: str, col: str) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Índice ordenado de una columna de fecha o monto: (valores ordenados,
+        posición de cada uno), sin nulos. Se arma una vez por versión del libro.
+        """
+        file_path = _csv_file(ledger)
+
+        def cargar():
+            serie = self._leer(ledger)[col]
+            validas = np.flatnonzero(serie.notna().to_numpy())
+            valores = serie.to_numpy()[validas]
+            orden = np.argsort(valores, kind="stable")
+            return valores[orden], validas[orden]
+
+        return _CACHE.obtener(f"{file_path}#rango:{col}", _firma_archivo(file_path), cargar)
+
+    def _mascara_rangos(self, ledger: str, n: int, rangos: Rangos) -> np.ndarray:
+        """Filas dentro de todos los rangos, resuelto con búsqueda binaria sobre los índices."""
+        mascara = np.ones(n, dtype=bool)
+        for col, desde, hasta in rangos.limites():
+            valores, posiciones = self._rango(ledger, col)
+            ini = 0 if desde is None else np.searchsorted(valores, _valor_rango(col, desde), "left")
+            fin = len(valores) if hasta is None else np.searchsorted(
+                valores, _valor_rango(col, hasta), "right"
+            )
+            dentro = np.zeros(n, dtype=bool)
+            seleccion = posiciones[ini:fin]
+            dentro[seleccion[seleccion < n]] = True
+            mascara &= dentro
+        return mascara
+
+    def _mascara(self, ledger: str, df: pd.DataFrame, año=None, mes=None, texto=None,
+                 rangos: Rangos | None = None) -> np.ndarray:
+        mascara = np.ones(len(df), dtype=bool)
+        if año is not None:
+            mascara &= (df["Año"] == int(año)).to_numpy(dtype=bool, na_value=False)
+        if mes is not None:
+            mascara &= (df["Mes"] == mes).to_numpy()
+        if texto:
+            encontradas = np.zeros(len(df), dtype=bool)
+            pos = self.buscar(ledger, texto)
+            # el índice puede ir una escritura adelante de la caché del libro
+            encontradas[pos[pos < len(df)]] = True
+            mascara &= encontradas
+        if rangos is not None and rangos.activos():
+            mascara &= self._mascara_rangos(ledger, len(df), rangos)
+            if rangos.sin_pago:
+                mascara &= df["Fecha pago"].isna().to_numpy()
+        return mascara
+
+    def años(self, ledger: str) -> list[int]:
+        file_path = _csv_file(ledger)
+        meta = _meta_snapshot(file_path) if os.path.exists(file_path) else None
+        if meta is not None and meta["offset"] == _firma_archivo(file_path)[1]:
+            # Los años del snapshot al día son sus particiones: no se lee nada más
+            return sorted(int(a) for a in meta["particiones"] if a != _SIN_AÑO)
+        return sorted(int(a) for a in self._columnas(ledger, ["Año"])["Año"].dropna().unique())
+
+    def montos_invalidos(self, ledger: str) -> int:
+        return self._columnas(ledger, ["Monto MXN"]).attrs.get("montos_invalidos", 0)
+
+    def meses(self, ledger: str) -> list[str]:
+        presentes = set(self._columnas(ledger, ["Mes"])["Mes"].dropna())
+        return [m for m in MESES if m in presentes]
+
+    def totales(self, ledger: str, rangos: Rangos | None = None) -> pd.DataFrame:
+        """Suma, conteo, mínimo y máximo del monto por (Año, Mes)."""
+        if rangos is not None and rangos.activos():
+            df = self._leer(ledger)
+            df = df[self._mascara(ledger, df, rangos=rangos)]
+        else:
+            # Sin rangos bastan tres columnas (del snapshot, sin cargar el libro)
+            df = self._columnas(ledger, ["Año", "Mes", "Monto MXN"])
+        return (
+            df
+            .groupby(["Año", "Mes"], observed=True)["Monto MXN"]
+            .agg(suma="sum", n="count", minimo="min", maximo="max")
+            .reset_index()
+        )
+
+    def contar(self, ledger: str, año=None, mes=None, texto=None,
+               rangos: Rangos | None = None) -> int:
+        """
+        Filas que cumplen el filtro, desde un conteo por (Año, Mes) cacheado
+        (o, con `texto` o `rangos`, desde los índices de búsqueda y de rango).
+        """
+        if texto or (rangos is not None and rangos.activos()):
+            df = self._leer_año(ledger, año)
+            if df is not None:
+                return len(self._filtrar_año(ledger, df, mes, texto, rangos))
+            df = self._leer(ledger)
+            return int(self._mascara(ledger, df, año, mes, texto, rangos).sum())
+        file_path = _csv_file(ledger)
+        conteos = _CACHE.obtener(
+            f"{file_path}#conteos",
+            _firma_archivo(file_path),
+            # dropna=False: las filas sin año o mes legible también cuentan para el total
+            lambda: self._columnas(ledger, ["Año", "Mes"])
+            .groupby(["Año", "Mes"], observed=True, dropna=False).size(),
+        )
+        if año is not None:
+            conteos = conteos[conteos.index.get_level_values("Año") == int(año)]
+        if mes is not None:
+            conteos = conteos[conteos.index.get_level_values("Mes") == mes]
+        return int(conteos.sum())
+
+    def _posiciones(self, ledger: str, orden: str, ascendente: bool):
+        """Posiciones del libro completo ya ordenadas (cacheadas por orden y firma)."""
+        file_path = _csv_file(ledger)
+
+        def cargar():
+            df = self._leer(ledger)
+            cols = ORDEN_HISTORICO[orden]
+            if cols is None:
+                pos = np.arange(len(df))
+                return pos if ascendente else pos[::-1]
+            return (
+                df[cols].reset_index(drop=True)
+                .sort_values(cols, ascending=ascendente, kind="stable", na_position="last")
+                .index.to_numpy()
+            )
+
+        return _CACHE.obtener(
+            f"{file_path}#orden:{orden}:{ascendente}", _firma_archivo(file_path), cargar
+        )
+
+    def pagina(self, ledger: str, año=None, mes=None, orden: str = "Captura",
+               ascendente: bool = True, offset: int = 0, limite: int = 50,
+               texto=None, rangos: Rangos | None = None) -> pd.DataFrame:
+        """Sólo las filas [offset, offset + limite) del filtro, en el orden pedido."""
+        df = self._leer_año(ledger, año)
+        if df is not None:
+            # Un solo año: se ordena en memoria sólo lo que pasó los filtros
+            df = self._filtrar_año(ledger, df, mes, texto, rangos)
+            cols = ORDEN_HISTORICO[orden]
+            if cols is None:
+                df = df.sort_index(ascending=ascendente)
+            else:
+                df = df.sort_index().sort_values(
+                    cols, ascending=ascendente, kind="stable", na_position="last"
+                )
+            return df.iloc[offset:offset + limite]
+        df = self._leer(ledger)
+        pos = self._posiciones(ledger, orden, ascendente)
+        mascara = self._mascara(ledger, df, año, mes, texto, rangos)
+        pos = pos[mascara[pos]]
+        return df.iloc[pos[offset:offset + limite]]
+
+
+_BACKEND = None
+_BACKEND_LOCK = threading.Lock()
+
+
+def get_backend():
+    """Regresa el backend configurado en IMPRESOS_STORAGE (una instancia por proceso)."""
+    global _BACKEND
+    with _BACKEND_LOCK:
+        if _BACKEND is not None:
+            return _BACKEND
+        if STORAGE_BACKEND == "sqlite":
+            from sqlite_backend import SQLiteBackend
+            _BACKEND = SQLiteBackend(DB_FILE)
+        elif STORAGE_BACKEND == "csv":
+            _BACKEND = CSVBackend()
+        else:
+            raise ValueError(f"IMPRESOS_STORAGE desconocido: {STORAGE_BACKEND!r}")
+        return _BACKEND
+
+
+# ------------ AGREGADOS (totales materializados) ------------
+#
+# agregados.json guarda, por "Año|Mes|Tipo", la suma, el conteo, el mínimo
+# y el máximo del monto (en centavos). Cada guardado lo actualiza en su
+# lugar, así que Análisis sólo lee unas decenas de filas sin importar el
+# tamaño del histórico. También guarda la firma de cada libro: si alguien
+# modificó un libro por fuera, se reconstruye solo.
+
+def _firma_json(firma):
+    # tuplas -> listas, para comparar contra lo que viene del JSON
+    return json.loads(json.dumps(firma))
+
+
+def _leer_agregados_json() -> dict | None:
+    def cargar():
+        if not os.path.exists(AGREGADOS_FILE):
+            return None
+        try:
+            with tramo("leer agregados.json"), open(AGREGADOS_FILE, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    return _CACHE.obtener(AGREGADOS_FILE, _firma_archivo(AGREGADOS_FILE), cargar)
+
+
+def _escribir_agregados_json(data: dict) -> None:
+    escribir_atomico(
+        AGREGADOS_FILE,
+        lambda f: json.dump(data, f, ensure_ascii=False, indent=1),
+        encoding="utf-8",
+    )
+    _CACHE.invalidar(AGREGADOS_FILE)
+
+
+def _agregados_al_dia() -> dict | None:
+    """El contenido de agregados.json si coincide con los libros actuales, si no None."""
+    data = _leer_agregados_json()
+    if data is None:
+        return None
+    backend = get_backend()
+    fuente = data.get("fuente", {})
+    if data.get("backend") != backend.nombre:
+        return None
+    for ledger in TIPOS:
+        if fuente.get(ledger) != _firma_json(backend.firma(ledger)):
+            return None
+    return data
+
+
+def reconstruir_agregados(forzar: bool = False) -> int:
+    """
+    Recalcula agregados.json desde los libros completos. Regresa cuántos grupos quedaron.
+    Si al tomar el bloqueo ya está al día (otro lector lo reconstruyó, o el
+    guardado que lo tenía tomado terminó de actualizarlo) no recalcula nada,
+    salvo con `forzar`.
+    """
+    backend = get_backend()
+    with bloqueo_archivo(AGREGADOS_FILE):
+        data = None if forzar else _agregados_al_dia()
+        if data is not None:
+            return len(data["grupos"])
+        grupos = {}
+        for ledger, tipo in TIPOS.items():
+            for fila in backend.totales(ledger).itertuples(index=False):
+                if fila.n == 0:
+                    continue
+                grupos[f"{int(fila.Año)}|{fila.Mes}|{tipo}"] = {
+                    "suma_c": int(round(fila.suma * 100)),
+                    "n": int(fila.n),
+                    "min_c": int(round(fila.minimo * 100)),
+                    "max_c": int(round(fila.maximo * 100)),
+                }
+        _escribir_agregados_json({
+            "backend": backend.nombre,
+            "fuente": {l: _firma_json(backend.firma(l)) for l in TIPOS},
+            "invalidos": {l: backend.montos_invalidos(l) for l in TIPOS},
+            "grupos": grupos,
+        })
+        return len(grupos)
+
+
+@tramo("guardar")
+def guardar_lote_historico(ledger: str, rows: list[dict]) -> list[dict]:
+    """
+    Escribe varios registros de un libro en una sola operación y actualiza
+    los agregados en su lugar. El bloqueo de agregados.json cubre ambas
+    cosas, para que otro proceso no intercale su guardado entre el libro y
+    los totales. Regresa los registros que sí entraron (no duplicados).
+    """
+    backend = get_backend()
+    with bloqueo_archivo(AGREGADOS_FILE):
+        data = _agregados_al_dia()
+        escritos = backend.guardar_muchos(ledger, rows)
+        if not escritos:
+            return []
+        if data is None:
+            reconstruir_agregados()
+            return escritos
+
+        invalidos = dict(data.get("invalidos", {}))
+        grupos = dict(data["grupos"])
+        for row in escritos:
+            monto = parse_monto(row.get("Monto MXN"))
+            if monto is None:
+                invalidos[ledger] = invalidos.get(ledger, 0) + 1
+                continue
+            clave = f"{int(row['Año'])}|{row['Mes']}|{TIPOS[ledger]}"
+            centavos = int(round(monto * 100))
+            g = grupos.get(clave)
+            if g is None:
+                g = {"suma_c": 0, "n": 0, "min_c": centavos, "max_c": centavos}
+            grupos[clave] = {
+                "suma_c": g["suma_c"] + centavos,
+                "n": g["n"] + 1,
+                "min_c": min(g["min_c"], centavos),
+                "max_c": max(g["max_c"], centavos),
+            }
+
+        fuente = dict(data["fuente"])
+        fuente[ledger] = _firma_json(backend.firma(ledger))
+        _escribir_agregados_json({
+            "backend": data["backend"],
+            "fuente": fuente,
+            "invalidos": invalidos,
+            "grupos": grupos,
+        })
+        return escritos
+
+
+class Guardado(NamedTuple):
+    """Resultado de guardar una factura en el histórico."""
+
+    registro: dict   # la fila tal como queda en el histórico (texto, orden de columnas)
+    version: str     # token de versión del libro después de guardar
+    nuevo: bool | None  # False si era un duplicado exacto y no se escribió;
+                        # None con escritura diferida (se sabe hasta vaciar la cola)
+
+
+def version_historico(ledger: str) -> str:
+    """
+    Token corto que cambia cada vez que cambia el libro. Sirve para saber si
+    lo que una sesión ya mostró sigue al día sin volver a cargar el histórico.
+    """
+    firma = json.dumps(get_backend().firma(ledger))
+    return hashlib.sha1(firma.encode("utf-8")).hexdigest()[:12]
+
+
+def _guardar(ledger: str, row: dict) -> Guardado:
+    registro = {
+        col: "" if row.get(col) is None else str(row.get(col))
+        for col in columnas_ledger(ledger)
+    }
+    if ESCRITURA_DIFERIDA:
+        # En cola: la versión es la del libro al momento de encolar y todavía
+        # no se sabe si era duplicado
+        from write_queue import encolar
+        encolar(ledger, row)
+        nuevo = None
+    else:
+        nuevo = bool(guardar_lote_historico(ledger, [row]))
+    return Guardado(registro, version_historico(ledger), nuevo)
+
+
+def pendientes_de_escribir(ledger: str | None = None) -> int:
+    """Registros en espera en el diario (0 si la escritura diferida está apagada)."""
+    if not ESCRITURA_DIFERIDA:
+        return 0
+    from write_queue import pendientes
+    return pendientes(ledger)
+
+
+def flush_pendientes() -> int:
+    """Fuerza a escribir lo pendiente (al cerrar sesión o apagar)."""
+    if not ESCRITURA_DIFERIDA:
+        return 0
+    from write_queue import flush_pendientes as _flush
+    return _flush()
+
+
+@tramo("agregados")
+def cargar_agregados() -> pd.DataFrame:
+    """
+    Totales por (Año, Mes, Tipo): Monto_num (suma), Facturas, Mínimo, Máximo.
+    Sale de agregados.json; si falta o está desfasado, se reconstruye.
+    """
+    data = _agregados_al_dia()
+    if data is None:
+        reconstruir_agregados()
+        data = _leer_agregados_json() or {"grupos": {}}
+
+    filas = []
+    for clave, g in data["grupos"].items():
+        año, mes, tipo = clave.split("|")
+        filas.append((
+            int(año), mes, tipo,
+            g["suma_c"] / 100, g["n"], g["min_c"] / 100, g["max_c"] / 100,
+        ))
+    df = pd.DataFrame(
+        filas,
+        columns=["Año", "Mes", "Tipo", "Monto_num", "Facturas", "Mínimo", "Máximo"],
+    )
+    df["Mes"] = pd.Categorical(df["Mes"], categories=MESES, ordered=True)
+    return df.sort_values(["Año", "Mes", "Tipo"], ignore_index=True)
 
 
 # ------------ VENTAS ------------
 
-def guardar_venta_historica(row: dict):
-    _append_row(VENTAS_FILE, row)
+def guardar_venta_historica(row: dict) -> Guardado:
+    return _guardar("ventas", row)
+
+
+def _cargar_registros(ledger: str) -> list[dict]:
+    backend = get_backend()
+    registros = _CACHE.obtener(
+        f"{backend.nombre}:{ledger}#records",
+        backend.firma(ledger),
+        lambda: formatear_ledger(backend.consultar(ledger)).to_dict(orient="records"),
+    )
+    # copia superficial: la lista cacheada no cambia si alguien hace .extend()
+    return list(registros)
 
 
 def cargar_ventas_historicas() -> list[dict]:
-    if not os.path.exists(VENTAS_FILE):
-        return []
-    df = pd.read_csv(VENTAS_FILE, dtype=str).fillna("")
-    return df.to_dict(orient="records")
+    """Registros en el formato de captura (texto). Para analizar usa cargar_ventas_df."""
+    return _cargar_registros("ventas")
+
+
+def cargar_ventas_df() -> pd.DataFrame:
+    """Libro de ventas con el esquema tipado, listo para agregar."""
+    return get_backend().consultar("ventas")
 
 
 # ------------ COMPRAS ------------
 
-def guardar_compra_historica(row: dict):
-    _append_row(COMPRAS_FILE, row)
+def guardar_compra_historica(row: dict) -> Guardado:
+    return _guardar("compras", row)
 
 
 def cargar_compras_historicas() -> list[dict]:
-    if not os.path.exists(COMPRAS_FILE):
-        return []
-    df = pd.read_csv(COMPRAS_FILE, dtype=str).fillna("")
-    return df.to_dict(orient="records")
\ No newline at end of file
+    """Registros en el formato de captura (texto). Para analizar usa cargar_compras_df."""
+    return _cargar_registros("compras")
+
+
+def cargar_compras_df() -> pd.DataFrame:
+    """Libro de compras con el esquema tipado, listo para agregar."""
+    return get_backend().consultar("compras")
+
+
+# ------------ CONSULTAS PARA LAS PÁGINAS ------------
+
+def _ledgers_de(tipo=None) -> list[str]:
+    """Libros a consultar según el tipo ("Ventas", "Compras" o None = ambos)."""
+    return [l for l, t in TIPOS.items() if tipo is None or t == tipo]
+
+
+@tramo("consultar histórico")
+def consultar_historico(año=None, mes=None, tipo=None) -> pd.DataFrame:
+    """
+    Ventas y compras unificadas (columna "Tipo"), tipadas, pidiendo al
+    backend sólo las filas del año/mes/tipo indicados.
+    """
+    df_list = []
+    for ledger in _ledgers_de(tipo):
+        df = get_backend().consultar(ledger, año=año, mes=mes)
+        if not df.empty:
+            df_list.append(df.assign(Tipo=TIPOS[ledger]))
+    return _unir(df_list)
+
+
+def _unir(df_list: list[pd.DataFrame]) -> pd.DataFrame:
+    if not df_list:
+        return pd.DataFrame()
+    df = pd.concat(df_list, ignore_index=True)
+    # concat de categóricos con distintas categorías regresa object
+    for col in ["Tipo", "Método pago", "Cliente", "Proveedor"]:
+        if col in df.columns:
+            df[col] = df[col].astype("category")
+    return df
+
+
+@tramo("contar histórico")
+def contar_historico(año=None, mes=None, tipo=None, texto=None,
+                     rangos: Rangos | None = None) -> int:
+    """Total de registros del filtro sin traer las filas (índice / conteo cacheado)."""
+    return sum(
+        get_backend().contar(ledger, año=año, mes=mes, texto=texto, rangos=rangos)
+        for ledger in _ledgers_de(tipo)
+    )
+
+
+@tramo("página histórico")
+def pagina_historico(año=None, mes=None, tipo=None, orden: str = "Captura",
+                     ascendente: bool = True, offset: int = 0, limite: int = 50,
+                     texto=None, rangos: Rangos | None = None) -> pd.DataFrame:
+    """
+    Una página del histórico filtrado, ordenada por ORDEN_HISTORICO[orden].
+    `texto` busca en cliente/proveedor y número de factura (ver busqueda.py)
+    y `rangos` filtra por fechas y monto (ver Rangos).
+    Cada backend ordena y recorta; aquí sólo se juntan ventas y compras:
+    en orden de captura van ventas y luego compras, y para los demás se
+    mezclan las primeras offset + limite filas de cada libro.
+    """
+    ledgers = _ledgers_de(tipo)
+    backend = get_backend()
+    if ORDEN_HISTORICO[orden] is None:
+        if not ascendente:
+            ledgers = ledgers[::-1]
+        df_list = []
+        for ledger in ledgers:
+            n = backend.contar(ledger, año=año, mes=mes, texto=texto, rangos=rangos)
+            if offset < n and limite > 0:
+                df = backend.pagina(
+                    ledger, año, mes, orden, ascendente, offset, limite, texto, rangos
+                )
+                df_list.append(df.assign(Tipo=TIPOS[ledger]))
+                limite -= len(df)
+            offset = max(0, offset - n)
+        return _unir(df_list).reindex(columns=columnas_historico(tipo))
+
+    df_list = [
+        backend.pagina(ledger, año, mes, orden, ascendente, 0, offset + limite, texto, rangos)
+        .assign(Tipo=TIPOS[ledger])
+        for ledger in ledgers
+    ]
+    df = _unir([d for d in df_list if not d.empty])
+    if len(ledgers) > 1 and not df.empty:
+        df = df.sort_values(
+            ORDEN_HISTORICO[orden], ascending=ascendente, kind="stable", na_position="last"
+        )
+    return df.iloc[offset:offset + limite].reset_index(drop=True).reindex(
+        columns=columnas_historico(tipo)
+    )
+
+
+def columnas_historico(tipo=None) -> list[str]:
+    """Columnas de consultar_historico() para ese tipo, en el mismo orden."""
+    cols = []
+    for ledger in _ledgers_de(tipo):
+        cols += [c for c in columnas_ledger(ledger) + ["Tipo"] if c not in cols]
+    return cols
+
+
+def historico_por_bloques(año=None, mes=None, tipo=None, texto=None,
+                          rangos: Rangos | None = None, tamaño: int = BLOQUE_LECTURA):
+    """
+    Lo mismo que consultar_historico(), en bloques de a lo más `tamaño` filas
+    leídos directo del backend. Todos los bloques traen las mismas columnas
+    (columnas_historico), para poder escribirlos uno tras otro, más
+    MONTO_ORIGINAL en los que tienen montos ilegibles.
+    """
+    cols = columnas_historico(tipo)
+    for ledger in _ledgers_de(tipo):
+        for df in get_backend().consultar_bloques(
+            ledger, año=año, mes=mes, texto=texto, rangos=rangos, tamaño=tamaño
+        ):
+            extra = [MONTO_ORIGINAL] if MONTO_ORIGINAL in df.columns else []
+            yield df.assign(Tipo=TIPOS[ledger]).reindex(columns=cols + extra)
+
+
+def años_historicos() -> list[int]:
+    return sorted({a for ledger in TIPOS for a in get_backend().años(ledger)})
+
+
+def meses_historicos() -> list[str]:
+    presentes = {m for ledger in TIPOS for m in get_backend().meses(ledger)}
+    return [m for m in MESES if m in presentes]
+
+
+def montos_invalidos() -> int:
+    """Cuántos montos del histórico no se pudieron interpretar como número."""
+    data = _agregados_al_dia()
+    if data is None:
+        reconstruir_agregados()
+        data = _leer_agregados_json() or {}
+    return sum(data.get("invalidos", {}).values())
+
+
+@tramo("totales históricos")
+def totales_historicos(rangos: Rangos | None = None) -> pd.DataFrame:
+    """
+    Totales por (Año, Mes, Tipo) para las gráficas de Análisis. Sin rangos
+    salen de los agregados; con rangos los calcula el backend sólo sobre las
+    filas que caen dentro.
+    """
+    if rangos is None or not rangos.activos():
+        return cargar_agregados()
+    df_list = []
+    for ledger, tipo in TIPOS.items():
+        df = get_backend().totales(ledger, rangos)
+        if not df.empty:
+            df_list.append(df.assign(Tipo=tipo))
+    if not df_list:
+        return pd.DataFrame(
+            columns=["Año", "Mes", "Tipo", "Monto_num", "Facturas", "Mínimo", "Máximo"]
+        )
+    df = pd.concat(df_list, ignore_index=True).rename(columns={
+        "suma": "Monto_num", "n": "Facturas", "minimo": "Mínimo", "maximo": "Máximo",
+    })
+    df["Mes"] = pd.Categorical(df["Mes"].astype(str), categories=MESES, ordered=True)
+    df["Año"] = df["Año"].astype(int)
+    return df[["Año", "Mes", "Tipo", "Monto_num", "Facturas", "Mínimo", "Máximo"]].sort_values(
+        ["Año", "Mes", "Tipo"], ignore_index=True
+    )
+
+
+# ------------ MIGRACIÓN CSV -> SQLITE ------------
+
+def importar_csv_a_sqlite(db_path: str = DB_FILE) -> dict:
+    """
+    Copia los CSV actuales a la base SQLite (se puede correr varias veces:
+    los registros repetidos se ignoran). Regresa cuántas filas entraron por
+    libro y cuántas se omitieron por tener un monto, año o mes ilegible.
+    """
+    from sqlite_backend import SQLiteBackend
+
+    csv_backend = CSVBackend()
+    destino = SQLiteBackend(db_path)
+    resultado = {}
+    for ledger in TIPOS:
+        df = csv_backend.consultar(ledger)
+        validas = df[df["Monto MXN"].notna() & df["Año"].notna() & df["Mes"].notna()]
+        rows = formatear_ledger(validas).to_dict(orient="records")
+        resultado[ledger] = len(destino.guardar_muchos(ledger, rows))
+        resultado[f"{ledger}_omitidas"] = len(df) - len(validas)
+    return resultado
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Utilerías del histórico de Impresos")
+    sub = parser.add_subparsers(dest="comando", required=True)
+
+    p_sql = sub.add_parser("migrar-sqlite", help="Importa los CSV a la base SQLite")
+    p_sql.add_argument("--db", default=DB_FILE)
+
+    sub.add_parser(
+        "reconstruir-agregados",
+        help="Recalcula agregados.json desde el histórico completo",
+    )
+
+    args = parser.parse_args()
+    if args.comando == "migrar-sqlite":
+        print(importar_csv_a_sqlite(args.db))
+    elif args.comando == "reconstruir-agregados":
+        print(f"{reconstruir_agregados(forzar=True)} grupos")
@@ -0,0 +1,337 @@
+# excel_export.py
+"""
+Generación de los archivos Excel del resumen.
+
+Se escribe directo con xlsxwriter en modo constant_memory: cada fila se
+escribe una sola vez, en orden, con el formato de su columna (texto,
+número, moneda o fecha) y se va a disco en cuanto se completa, así que un
+mes de 100k facturas no vive entero dentro del libro.
+
+Los montos van como números con formato de moneda (se pueden sumar en
+Excel) y las fechas como fechas reales.
+
+Además del resumen mensual hay un consolidado anual del histórico: una
+hoja por mes y una hoja de resumen con fórmulas de Excel.
+
+Los libros ya generados se guardan en una caché LRU de proceso, con tope
+de memoria, por (año, mes, hash de las filas): dos sesiones con los mismos
+datos descargan los mismos bytes sin volver a generarlos.
+"""
+import io
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+import xlsxwriter
+
+from xlsxwriter.utility import xl_range, xl_rowcol_to_cell
+
+from data_utils import MESES, TIPOS, get_backend, ledger_vacio, tipar_ledger, version_historico
+from rendimiento import tramo
+
+FORMATO_MONEDA = '"$"#,##0.00'
+FORMATO_FECHA_XLSX = "dd/mm/yyyy"
+ANCHO_COLUMNA = 15
+_EPOCA_EXCEL = pd.Timestamp("1899-12-30")
+
+# Tope de memoria de la caché de libros generados
+CACHE_EXCEL_MB = float(os.environ.get("IMPRESOS_CACHE_EXCEL_MB", "64"))
+
+
+def _formatos(libro) -> dict:
+    return {
+        "titulo": libro.add_format({"bold": True, "font_size": 16, "align": "left"}),
+        "sub": libro.add_format({"bold": True, "font_size": 12, "align": "left"}),
+        "header": libro.add_format({"bold": True, "bg_color": "#D9D9D9", "border": 1}),
+        "normal": libro.add_format({"border": 1}),
+        "moneda": libro.add_format({"border": 1, "num_format": FORMATO_MONEDA}),
+        "fecha": libro.add_format({"border": 1, "num_format": FORMATO_FECHA_XLSX}),
+        "total": libro.add_format(
+            {"bold": True, "border": 1, "top": 2, "num_format": FORMATO_MONEDA}
+        ),
+        "total_texto": libro.add_format({"bold": True, "border": 1, "top": 2}),
+    }
+
+
+def _tipado(df: pd.DataFrame, ledger: str) -> pd.DataFrame:
+    """Acepta registros en texto (sesión) o ya tipados (histórico)."""
+    if "Monto MXN" in df.columns and pd.api.types.is_numeric_dtype(df["Monto MXN"]):
+        return df
+    return tipar_ledger(df, ledger)
+
+
+def _columnas(hoja, df: pd.DataFrame, formatos: dict) -> list[tuple]:
+    """
+    Por columna: (valores como lista de Python, función de escritura, formato).
+    Los nulos quedan en None y se escriben como celda vacía con borde.
+    """
+    columnas = []
+    for col in df.columns:
+        serie = df[col]
+        nulos = serie.isna().to_numpy()
+        if pd.api.types.is_datetime64_any_dtype(serie):
+            # Número de serie de Excel calculado en bloque; write_datetime lo haría celda por celda
+            valores = ((serie - _EPOCA_EXCEL) / pd.Timedelta(days=1)).tolist()
+            escribir, formato = hoja.write_number, formatos["fecha"]
+        elif pd.api.types.is_numeric_dtype(serie):
+            formato = formatos["moneda"] if col == "Monto MXN" else formatos["normal"]
+            valores, escribir = serie.tolist(), hoja.write_number
+        else:
+            valores = serie.astype(object).tolist()
+            escribir, formato = hoja.write_string, formatos["normal"]
+            nulos = nulos | (serie.astype(object) == "").to_numpy()
+        if nulos.any():
+            valores = [None if n else v for v, n in zip(valores, nulos)]
+        columnas.append((valores, escribir, formato))
+    return columnas
+
+
+def escribir_bloque(hoja, fila: int, titulo: str, df: pd.DataFrame, formatos: dict) -> int:
+    """
+    Escribe título, encabezados y filas de `df` a partir de `fila`.
+    Regresa la fila siguiente a la última escrita.
+    """
+    hoja.write(fila, 0, titulo, formatos["sub"])
+    if df.empty:
+        return fila + 1
+
+    hoja.write_row(fila + 1, 0, list(df.columns), formatos["header"])
+    columnas = _columnas(hoja, df, formatos)
+    en_blanco = hoja.write_blank
+    inicio = fila + 2
+    for i in range(len(df)):
+        r = inicio + i
+        for c, (valores, escribir, formato) in enumerate(columnas):
+            valor = valores[i]
+            if valor is None:
+                en_blanco(r, c, None, formato)
+            else:
+                escribir(r, c, valor, formato)
+    return inicio + len(df)
+
+
+def nuevo_libro(output, grande: bool = True):
+    """Workbook de xlsxwriter; con `grande` usa constant_memory (escribir fila por fila, en orden)."""
+    return xlsxwriter.Workbook(output, {"constant_memory": grande})
+
+
+def _hoja_mes(hoja, titulo: str, df_v, df_c, formatos: dict) -> dict:
+    """
+    Hoja con la distribución del resumen mensual. Regresa el rango de
+    montos de cada bloque ("ventas"/"compras" -> rango A1 o None).
+    """
+    hoja.set_column(0, 7, ANCHO_COLUMNA)
+    hoja.write(0, 0, titulo, formatos["titulo"])
+
+    fila_inicio_ing = 2
+    escribir_bloque(hoja, fila_inicio_ing, "INGRESOS", df_v, formatos)
+
+    # Misma distribución que antes: EGRESOS deja dos filas libres tras INGRESOS
+    fila_inicio_egr = fila_inicio_ing + 4 + max(len(df_v), 1)
+    escribir_bloque(hoja, fila_inicio_egr, "EGRESOS", df_c, formatos)
+
+    rangos = {}
+    for ledger, df, inicio in (("ventas", df_v, fila_inicio_ing), ("compras", df_c, fila_inicio_egr)):
+        if df.empty:
+            rangos[ledger] = None
+        else:
+            col = list(df.columns).index("Monto MXN")
+            rangos[ledger] = xl_range(inicio + 2, col, inicio + 1 + len(df), col)
+    return rangos
+
+
+@tramo("Excel mensual")
+def construir_excel(mes_sel, año_sel, df_v_mes, df_c_mes) -> bytes:
+    """Excel del resumen mensual: hoja "Resumen" con bloques INGRESOS y EGRESOS."""
+    output = io.BytesIO()
+    libro = nuevo_libro(output)
+    formatos = _formatos(libro)
+    _hoja_mes(
+        libro.add_worksheet("Resumen"),
+        f"Impresos / {mes_sel} {año_sel}",
+        _tipado(df_v_mes, "ventas"),
+        _tipado(df_c_mes, "compras"),
+        formatos,
+    )
+    libro.close()
+    return output.getvalue()
+
+
+@tramo("Excel anual")
+def construir_excel_anual(año_sel, meses: list[str] | None = None, progreso=None) -> bytes:
+    """
+    Consolidado del histórico de un año: una hoja por mes con movimientos
+    (misma distribución que el resumen mensual) y una hoja "Resumen <año>"
+    con INGRESOS, EGRESOS y balance por mes como fórmulas de Excel.
+
+    Cada libro se lee una sola vez para todo el año y se reparte por mes
+    con un solo groupby; `meses` limita el reporte a esos meses.
+    `progreso(fraccion)`, si se da, se llama al empezar cada mes.
+    """
+    meses = [m for m in MESES if meses is None or m in meses]
+    por_mes = {}
+    for ledger in TIPOS:
+        df = get_backend().consultar(ledger, año=año_sel)
+        por_mes[ledger] = {
+            mes: grupo for mes, grupo in df.groupby("Mes", observed=True, sort=True)
+        }
+
+    output = io.BytesIO()
+    libro = nuevo_libro(output)
+    formatos = _formatos(libro)
+    # La hoja resumen va primero en el libro aunque se escriba al final
+    resumen = libro.add_worksheet(f"Resumen {año_sel}")
+
+    filas_resumen = []
+    for i, mes in enumerate(meses, 1):
+        if progreso is not None:
+            progreso((i - 1) / len(meses))
+        df_v = por_mes["ventas"].get(mes)
+        df_c = por_mes["compras"].get(mes)
+        if df_v is None and df_c is None:
+            filas_resumen.append((mes, None, 0.0, None, 0.0))
+            continue
+        df_v = df_v if df_v is not None else ledger_vacio("ventas")
+        df_c = df_c if df_c is not None else ledger_vacio("compras")
+        rangos = _hoja_mes(
+            libro.add_worksheet(mes), f"Impresos / {mes} {año_sel}", df_v, df_c, formatos
+        )
+        filas_resumen.append((
+            mes,
+            rangos["ventas"], round(float(df_v["Monto MXN"].sum()), 2),
+            rangos["compras"], round(float(df_c["Monto MXN"].sum()), 2),
+        ))
+
+    _hoja_resumen_anual(resumen, año_sel, filas_resumen, formatos)
+    libro.close()
+    return output.getvalue()
+
+
+def _hoja_resumen_anual(hoja, año_sel, filas: list[tuple], formatos: dict) -> None:
+    """Mes | Ingresos | Egresos | Balance, con SUM() a las hojas de cada mes y fila de totales."""
+    hoja.set_column(0, 0, ANCHO_COLUMNA)
+    hoja.set_column(1, 3, 18)
+    hoja.write(0, 0, f"Impresos / Resumen {año_sel}", formatos["titulo"])
+    hoja.write_row(2, 0, ["Mes", "Ingresos", "Egresos", "Balance"], formatos["header"])
+
+    fila = 3
+    for mes, rango_v, total_v, rango_c, total_c in filas:
+        hoja.write_string(fila, 0, mes, formatos["normal"])
+        for col, rango, total in ((1, rango_v, total_v), (2, rango_c, total_c)):
+            if rango is None:
+                hoja.write_number(fila, col, 0, formatos["moneda"])
+            else:
+                # El valor calculado va como resultado en caché para visores que no recalculan
+                hoja.write_formula(fila, col, f"=SUM('{mes}'!{rango})", formatos["moneda"], total)
+        hoja.write_formula(
+            fila, 3,
+            f"={xl_rowcol_to_cell(fila, 1)}-{xl_rowcol_to_cell(fila, 2)}",
+            formatos["moneda"], round(total_v - total_c, 2),
+        )
+        fila += 1
+
+    ingresos = sum(f[2] for f in filas)
+    egresos = sum(f[4] for f in filas)
+    hoja.write_string(fila, 0, "Total", formatos["total_texto"])
+    for col, total in ((1, ingresos), (2, egresos), (3, ingresos - egresos)):
+        hoja.write_formula(
+            fila, col, f"=SUM({xl_range(3, col, fila - 1, col)})", formatos["total"], round(total, 2)
+        )
+
+
+# ------------ CACHÉ DE LIBROS GENERADOS ------------
+
+class _CacheLibros:
+    """
+    LRU de libros ya generados (bytes), compartida entre sesiones.
+    Al pasar de `max_bytes` se sacan los menos usados; un libro más grande
+    que el tope no se guarda.
+    """
+
+    def __init__(self, max_bytes: int):
+        self._lock = threading.Lock()
+        self._libros: OrderedDict[tuple, bytes] = OrderedDict()
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def obtener(self, clave: tuple) -> bytes | None:
+        with self._lock:
+            contenido = self._libros.get(clave)
+            if contenido is None:
+                self.misses += 1
+                return None
+            self._libros.move_to_end(clave)
+            self.hits += 1
+            return contenido
+
+    def guardar(self, clave: tuple, contenido: bytes) -> None:
+        if len(contenido) > self.max_bytes:
+            return
+        with self._lock:
+            anterior = self._libros.pop(clave, None)
+            if anterior is not None:
+                self.bytes -= len(anterior)
+            self._libros[clave] = contenido
+            self.bytes += len(contenido)
+            while self.bytes > self.max_bytes:
+                _, sacado = self._libros.popitem(last=False)
+                self.bytes -= len(sacado)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entradas": len(self._libros),
+                "bytes": self.bytes,
+            }
+
+
+_LIBROS = _CacheLibros(int(CACHE_EXCEL_MB * 1024 * 1024))
+
+
+def _hash_filas(*dfs: pd.DataFrame) -> str:
+    h = hashlib.sha1()
+    for df in dfs:
+        h.update("|".join(map(str, df.columns)).encode("utf-8"))
+        h.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return h.hexdigest()
+
+
+def clave_excel(mes_sel, año_sel, df_v_mes, df_c_mes) -> tuple:
+    """(año, mes, hash de las filas): la misma clave para los mismos datos."""
+    return (año_sel, mes_sel, _hash_filas(df_v_mes, df_c_mes))
+
+
+def excel_mensual(mes_sel, año_sel, df_v_mes, df_c_mes, clave: tuple | None = None) -> bytes:
+    """construir_excel con caché: sólo genera si esa clave no está guardada."""
+    clave = clave or clave_excel(mes_sel, año_sel, df_v_mes, df_c_mes)
+    contenido = _LIBROS.obtener(clave)
+    if contenido is None:
+        contenido = construir_excel(mes_sel, año_sel, df_v_mes, df_c_mes)
+        _LIBROS.guardar(clave, contenido)
+    return contenido
+
+
+def clave_excel_anual(año_sel) -> tuple:
+    """Clave del consolidado anual: cambia en cuanto cambia cualquiera de los dos libros."""
+    return ("anual", año_sel, *(version_historico(ledger) for ledger in TIPOS))
+
+
+def excel_anual(año_sel, clave: tuple | None = None, progreso=None) -> bytes:
+    """construir_excel_anual con caché."""
+    clave = clave or clave_excel_anual(año_sel)
+    contenido = _LIBROS.obtener(clave)
+    if contenido is None:
+        contenido = construir_excel_anual(año_sel, progreso=progreso)
+        _LIBROS.guardar(clave, contenido)
+    return contenido
+
+
+def cache_excel_stats() -> dict:
+    """Contadores de la caché de libros (hits, misses, entradas, bytes)."""
+    return _LIBROS.stats()
@@ -0,0 +1,345 @@
+# export_jobs.py
+"""
+Exportaciones en segundo plano (Excel y CSV).
+
+Generar un archivo grande dentro de la corrida del script congela la
+página. Aquí cada exportación es un trabajo que corre en un pool de hilos
+del proceso (EXPORT_WORKERS): la página sólo lo encola, muestra el avance
+y pone el botón de descarga cuando el archivo ya está listo.
+
+Los trabajos se identifican por una clave (la misma que usa la caché de
+Excel): si dos sesiones piden la misma exportación se comparten el
+trabajo y el archivo. Los archivos terminados quedan en data/exports y se
+borran pasados EXPORT_TTL_MIN minutos.
+
+El histórico se exporta por bloques directo del backend (CSV, CSV con
+gzip o Parquet), así que generarlo no ocupa más memoria con un libro más
+grande. En CSV los montos ilegibles ("pendiente") salen con su texto
+original; en Parquet el monto es numérico y esos quedan nulos.
+
+Para servir la descarga Streamlit necesita los bytes en memoria: el
+archivo se lee sólo cuando el usuario pide descargarlo, no en cada rerun.
+"""
+import os
+import gzip
+import time
+import uuid
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import streamlit as st
+
+from data_utils import (
+    DATA_DIR,
+    columnas_historico,
+    escribir_atomico,
+    formatear_ledger,
+    historico_por_bloques,
+)
+from rendimiento import tramo
+
+logger = logging.getLogger(__name__)
+
+EXPORTS_DIR = os.path.join(DATA_DIR, "exports")
+EXPORT_WORKERS = int(os.environ.get("IMPRESOS_EXPORT_WORKERS", "2"))
+EXPORT_TTL_MIN = float(os.environ.get("IMPRESOS_EXPORT_TTL_MIN", "30"))
+
+MIME_XLSX = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+MIME_CSV = "text/csv"
+
+# Formatos del histórico: nombre -> (extensión, mime)
+FORMATOS_HISTORICO = {
+    "CSV": (".csv", MIME_CSV),
+    "CSV comprimido (gzip)": (".csv.gz", "application/gzip"),
+    "Parquet": (".parquet", "application/vnd.apache.parquet"),
+}
+
+EN_COLA, GENERANDO, LISTO, ERROR = "en cola", "generando", "listo", "error"
+
+
+class _Trabajo:
+    """Una exportación: estado, avance (0..1) y archivo generado."""
+
+    def __init__(self, clave: tuple, nombre: str, mime: str, ext: str):
+        self.id = uuid.uuid4().hex
+        self.clave = clave
+        self.nombre = nombre
+        self.mime = mime
+        self.ruta = os.path.join(EXPORTS_DIR, f"{self.id}{ext}")
+        self.estado = EN_COLA
+        self.progreso = 0.0
+        self.error = None
+        self.bytes = None
+        self.creado = time.time()
+        self.terminado = None
+
+    def resumen(self) -> dict:
+        return {
+            "id": self.id,
+            "nombre": self.nombre,
+            "mime": self.mime,
+            "estado": self.estado,
+            "progreso": self.progreso,
+            "error": self.error,
+            "bytes": self.bytes,
+            "creado": self.creado,
+            "terminado": self.terminado,
+        }
+
+
+class _Exportaciones:
+    """Tabla de trabajos + pool de hilos (uno por proceso, compartido entre sesiones)."""
+
+    def __init__(self, workers: int):
+        self._lock = threading.Lock()
+        self._trabajos: dict[str, _Trabajo] = {}
+        self._por_clave: dict[tuple, str] = {}
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="impresos-export")
+
+    def enviar(self, clave: tuple, nombre: str, mime: str, construir) -> str:
+        """
+        Encola `construir(ruta, progreso)` si no hay ya un trabajo vivo con esa
+        clave. `construir` escribe el archivo en `ruta` y puede llamar
+        `progreso(fraccion)`. Regresa el id del trabajo.
+        """
+        self.limpiar_vencidos()
+        with self._lock:
+            actual = self._trabajos.get(self._por_clave.get(clave))
+            if actual is not None and actual.estado != ERROR:
+                return actual.id
+            ext = nombre[nombre.find("."):] if "." in nombre else ""
+            trabajo = _Trabajo(clave, nombre, mime, ext)
+            self._trabajos[trabajo.id] = trabajo
+            self._por_clave[clave] = trabajo.id
+        self._pool.submit(self._correr, trabajo, construir)
+        return trabajo.id
+
+    def _correr(self, trabajo: _Trabajo, construir) -> None:
+        trabajo.estado = GENERANDO
+
+        def progreso(fraccion: float) -> None:
+            trabajo.progreso = min(max(float(fraccion), 0.0), 1.0)
+
+        try:
+            os.makedirs(EXPORTS_DIR, exist_ok=True)
+            construir(trabajo.ruta, progreso)
+            trabajo.bytes = os.path.getsize(trabajo.ruta)
+        except Exception as e:
+            logger.exception("Falló la exportación %s", trabajo.nombre)
+            trabajo.error = str(e)
+            trabajo.estado = ERROR
+        else:
+            trabajo.progreso = 1.0
+            trabajo.estado = LISTO
+        trabajo.terminado = time.time()
+
+    def buscar(self, clave: tuple) -> dict | None:
+        with self._lock:
+            trabajo = self._trabajos.get(self._por_clave.get(clave))
+            return trabajo.resumen() if trabajo is not None else None
+
+    def estado(self, trabajo_id: str) -> dict | None:
+        with self._lock:
+            trabajo = self._trabajos.get(trabajo_id)
+            return trabajo.resumen() if trabajo is not None else None
+
+    def leer(self, trabajo_id: str) -> bytes | None:
+        with self._lock:
+            trabajo = self._trabajos.get(trabajo_id)
+            if trabajo is None or trabajo.estado != LISTO:
+                return None
+            ruta = trabajo.ruta
+        try:
+            with open(ruta, "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            # Alguien borró el archivo: que se pueda volver a pedir
+            trabajo.error = "el archivo generado ya no existe"
+            trabajo.estado = ERROR
+            return None
+
+    def limpiar_vencidos(self) -> int:
+        """Quita los trabajos terminados hace más de EXPORT_TTL_MIN y sus archivos."""
+        limite = time.time() - EXPORT_TTL_MIN * 60
+        with self._lock:
+            vencidos = [
+                t for t in self._trabajos.values()
+                if t.terminado is not None and t.terminado < limite
+            ]
+            for t in vencidos:
+                del self._trabajos[t.id]
+                if self._por_clave.get(t.clave) == t.id:
+                    del self._por_clave[t.clave]
+            vivos = {os.path.basename(t.ruta) for t in self._trabajos.values()}
+        borrados = 0
+        if os.path.isdir(EXPORTS_DIR):
+            # También lo que haya quedado de corridas anteriores del proceso
+            for nombre in os.listdir(EXPORTS_DIR):
+                ruta = os.path.join(EXPORTS_DIR, nombre)
+                try:
+                    if nombre not in vivos and os.path.getmtime(ruta) < limite:
+                        os.remove(ruta)
+                        borrados += 1
+                except OSError:
+                    pass
+        return borrados
+
+    def stats(self) -> dict:
+        with self._lock:
+            por_estado = {}
+            for t in self._trabajos.values():
+                por_estado[t.estado] = por_estado.get(t.estado, 0) + 1
+            return {"trabajos": len(self._trabajos), **por_estado}
+
+
+_EXPORTACIONES = _Exportaciones(EXPORT_WORKERS)
+
+
+def enviar_exportacion(clave: tuple, nombre: str, mime: str, construir) -> str:
+    """Encola una exportación (o reutiliza la que ya existe para esa clave)."""
+    return _EXPORTACIONES.enviar(clave, nombre, mime, construir)
+
+
+def buscar_exportacion(clave: tuple) -> dict | None:
+    """Estado del trabajo vigente para esa clave, o None si nadie la ha pedido."""
+    return _EXPORTACIONES.buscar(clave)
+
+
+def estado_exportacion(trabajo_id: str) -> dict | None:
+    return _EXPORTACIONES.estado(trabajo_id)
+
+
+def leer_exportacion(trabajo_id: str) -> bytes | None:
+    """Bytes del archivo generado, o None si todavía no está listo (o ya venció)."""
+    return _EXPORTACIONES.leer(trabajo_id)
+
+
+def limpiar_exportaciones() -> int:
+    return _EXPORTACIONES.limpiar_vencidos()
+
+
+def exportaciones_stats() -> dict:
+    """Trabajos en la tabla, por estado."""
+    return _EXPORTACIONES.stats()
+
+
+def escribir_bytes(ruta: str, contenido: bytes) -> None:
+    """Para exportaciones que ya tienen el archivo en memoria (p. ej. de la caché de Excel)."""
+    escribir_atomico(ruta, lambda f: f.write(contenido), modo="wb")
+
+
+def _escribir_csv_bloques(f, bloques, progreso) -> None:
+    for i, bloque in enumerate(bloques):
+        formatear_ledger(bloque).to_csv(f, index=False, header=i == 0)
+        progreso(len(bloque))
+
+
+def _esquema_parquet(cols: list[str]):
+    import pyarrow as pa
+
+    tipos = {
+        "Año": pa.int16(),
+        "Monto MXN": pa.float64(),
+        "Fecha emisión": pa.timestamp("us"),
+        "Fecha pago": pa.timestamp("us"),
+    }
+    return pa.schema([(c, tipos.get(c, pa.string())) for c in cols])
+
+
+def _escribir_parquet_bloques(ruta: str, cols: list[str], bloques, progreso) -> None:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    esquema = _esquema_parquet(cols)
+    # Mismo esquema para todos los bloques: los categóricos van como texto
+    with pq.ParquetWriter(ruta, esquema, compression="zstd") as writer:
+        for bloque in bloques:
+            bloque = bloque[cols].astype({
+                c: object for c in cols
+                if esquema.field(c).type == pa.string()
+            })
+            writer.write_table(pa.Table.from_pandas(bloque, schema=esquema, preserve_index=False))
+            progreso(len(bloque))
+
+
+@tramo("exportar histórico")
+def escribir_historico(ruta: str, formato: str, año=None, mes=None, tipo=None, texto=None,
+                       rangos=None, total: int | None = None, progreso=None) -> None:
+    """
+    Escribe el histórico filtrado en `ruta` en uno de FORMATOS_HISTORICO,
+    bloque por bloque desde el backend. `total` (filas esperadas) sólo se
+    usa para reportar el avance.
+    """
+    escritas = 0
+
+    def avance(n: int) -> None:
+        nonlocal escritas
+        escritas += n
+        if progreso is not None and total:
+            progreso(escritas / total)
+
+    bloques = historico_por_bloques(año=año, mes=mes, tipo=tipo, texto=texto, rangos=rangos)
+    if formato == "Parquet":
+        _escribir_parquet_bloques(ruta, columnas_historico(tipo), bloques, avance)
+    elif formato == "CSV comprimido (gzip)":
+        with gzip.open(ruta, "wt", newline="", encoding="utf-8-sig") as f:
+            _escribir_csv_bloques(f, bloques, avance)
+    elif formato == "CSV":
+        with open(ruta, "w", newline="", encoding="utf-8-sig") as f:
+            _escribir_csv_bloques(f, bloques, avance)
+    else:
+        raise ValueError(f"Formato de exportación desconocido: {formato!r}")
+
+
+# ------------ UI ------------
+
+def panel_exportacion(clave: tuple, nombre: str, mime: str, construir,
+                      generar: str, descargar: str, key: str, al_descargar=None) -> None:
+    """
+    Botón para pedir la exportación, barra de avance mientras se genera y
+    botón de descarga cuando termina. Mientras hay un trabajo en curso sólo
+    se vuelve a correr este fragmento (cada segundo), no la página entera.
+    El archivo terminado se lee hasta que el usuario pulsa `descargar`, y
+    sólo para esa corrida. `al_descargar` se pasa como on_click del botón
+    de descarga.
+    """
+    trabajo = buscar_exportacion(clave)
+    if trabajo is None or trabajo["estado"] == ERROR:
+        if trabajo is not None:
+            st.error(f"No se pudo generar el archivo: {trabajo['error']}")
+        if not st.button(generar, key=f"{key}_generar", use_container_width=True):
+            return
+        enviar_exportacion(clave, nombre, mime, construir)
+        trabajo = buscar_exportacion(clave)
+
+    en_curso = trabajo["estado"] in (EN_COLA, GENERANDO)
+
+    @st.fragment(run_every=1.0 if en_curso else None)
+    def _estado():
+        info = estado_exportacion(trabajo["id"])
+        if info is None:
+            st.rerun(scope="app")
+        if info["estado"] in (EN_COLA, GENERANDO):
+            st.progress(info["progreso"], text=f"Generando {info['nombre']}… ({info['estado']})")
+            return
+        if en_curso:
+            # Ya terminó: una corrida completa para dejar de consultar
+            st.rerun(scope="app")
+        # Los bytes sólo en la corrida del clic; en la siguiente vuelve a ser este botón
+        if not st.button(descargar, key=f"{key}_pedir", use_container_width=True):
+            return
+        contenido = leer_exportacion(info["id"])
+        if contenido is None:
+            st.rerun(scope="app")
+        st.download_button(
+            label=f"⬇️ Guardar {info['nombre']} ({(info['bytes'] or 0) / 1e6:,.1f} MB)",
+            data=contenido,
+            file_name=info["nombre"],
+            mime=info["mime"],
+            key=f"{key}_descargar",
+            on_click="ignore" if al_descargar is None else al_descargar,
+            use_container_width=True,
+        )
+
+    _estado()
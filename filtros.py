@@ -0,0 +1,52 @@
+# filtros.py
+"""
+Controles de filtro que comparten varias páginas. Viven aquí y no en una
+página para que importarlos no corra el código de otra página.
+"""
+from datetime import date, timedelta
+
+import streamlit as st
+
+from data_utils import Rangos
+
+
+def _rango_fechas(valor) -> tuple:
+    """st.date_input con rango regresa (), (desde,) o (desde, hasta)."""
+    valor = tuple(valor) if isinstance(valor, (tuple, list)) else ()
+    return (valor + (None, None))[:2]
+
+
+def filtros_rango(key: str) -> Rangos:
+    """Filtros por fecha de emisión, fecha de pago y monto (Histórico y Análisis)."""
+    with st.expander("🔎 Filtros por rango (fechas y montos)"):
+        col1, col2 = st.columns(2)
+        with col1:
+            emision = st.date_input("Fecha de emisión", value=(), format="DD/MM/YYYY",
+                                    key=f"{key}_emision")
+            monto_min = st.number_input("Monto mínimo", min_value=0.0, value=None,
+                                        step=1000.0, key=f"{key}_monto_min")
+            sin_pagar_dias = st.number_input(
+                "Sin pagar con más de (días)", min_value=0, value=None, step=1,
+                key=f"{key}_sin_pagar",
+                help="Facturas sin fecha de pago emitidas hace más de estos días.",
+            )
+        with col2:
+            pago = st.date_input("Fecha de pago", value=(), format="DD/MM/YYYY",
+                                 key=f"{key}_pago")
+            monto_max = st.number_input("Monto máximo", min_value=0.0, value=None,
+                                        step=1000.0, key=f"{key}_monto_max")
+
+    emision_desde, emision_hasta = _rango_fechas(emision)
+    pago_desde, pago_hasta = _rango_fechas(pago)
+    if sin_pagar_dias is not None:
+        limite = date.today() - timedelta(days=int(sin_pagar_dias) + 1)
+        emision_hasta = limite if emision_hasta is None else min(emision_hasta, limite)
+    return Rangos(
+        emision_desde=emision_desde,
+        emision_hasta=emision_hasta,
+        pago_desde=pago_desde,
+        pago_hasta=pago_hasta,
+        monto_min=monto_min,
+        monto_max=monto_max,
+        sin_pago=sin_pagar_dias is not None,
+    )
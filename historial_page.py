@@ -1,10 +1,19 @@
 import streamlit as st
-import pandas as pd
 
 from data_utils import (
-    cargar_ventas_historicas,
-    cargar_compras_historicas,
+    ORDEN_HISTORICO,
+    TIPOS,
+    años_historicos,
+    meses_historicos,
+    contar_historico,
+    formatear_ledger,
+    pagina_historico,
+    version_historico,
 )
+from export_jobs import FORMATOS_HISTORICO, escribir_historico, panel_exportacion
+from filtros import filtros_rango
+
+TAMAÑOS_PAGINA = [25, 50, 100, 250]
 
 
 def historial_page():
@@ -14,31 +23,14 @@ def historial_page():
         "guardadas en el sistema."
     )
 
-    ventas_hist = cargar_ventas_historicas()
-    compras_hist = cargar_compras_historicas()
+    años_disp = años_historicos()
 
-    if not ventas_hist and not compras_hist:
+    if not años_disp:
         st.info("Todavía no hay historial guardado. Captura ventas y compras primero.")
         return
 
-    # Unificamos datos igual que en análisis
-    df_list = []
-
-    if ventas_hist:
-        df_v = pd.DataFrame(ventas_hist).copy()
-        df_v["Tipo"] = "Ventas"
-        df_list.append(df_v)
-
-    if compras_hist:
-        df_c = pd.DataFrame(compras_hist).copy()
-        df_c["Tipo"] = "Compras"
-        df_list.append(df_c)
-
-    df_all = pd.concat(df_list, ignore_index=True)
-
     # Filtros arriba para que lo puedas explorar tranquilo
-    años_disp = sorted(df_all["Año"].unique())
-    tipos_disp = sorted(df_all["Tipo"].unique())
+    tipos_disp = ["Compras", "Ventas"]
 
     col1, col2, col3 = st.columns(3)
     with col1:
@@ -50,37 +42,89 @@ def historial_page():
         )
 
     with col3:
-        mes_disp = sorted(df_all["Mes"].dropna().unique().tolist())
+        mes_disp = meses_historicos()
         mes_sel = st.selectbox(
             "Filtrar por mes", ["Todos"] + mes_disp, key="hist_mes"
         )
 
-    df_f = df_all.copy()
-
-    if año_sel != "Todos":
-        df_f = df_f[df_f["Año"] == año_sel]
-
-    if tipo_sel != "Todos":
-        df_f = df_f[df_f["Tipo"] == tipo_sel]
-
-    if mes_sel != "Todos":
-        df_f = df_f[df_f["Mes"] == mes_sel]
+    # Búsqueda por prefijo en cliente/proveedor y número de factura,
+    # resuelta con el índice de búsqueda del backend
+    texto = st.text_input(
+        "Buscar",
+        placeholder="Cliente, proveedor o número de factura (p. ej. CUCEA, 58230)",
+        key="hist_buscar",
+    ).strip()
+    rangos = filtros_rango("hist")
+
+    filtros = {
+        "año": None if año_sel == "Todos" else año_sel,
+        "mes": None if mes_sel == "Todos" else mes_sel,
+        "tipo": None if tipo_sel == "Todos" else tipo_sel,
+        "texto": texto or None,
+        "rangos": rangos if rangos.activos() else None,
+    }
 
     st.markdown("---")
     st.markdown("### Detalle histórico filtrado")
 
-    if df_f.empty:
+    # El total sale de un conteo del backend, sin traer las filas
+    total = contar_historico(**filtros)
+    if total == 0:
         st.warning("No hay registros que coincidan con los filtros seleccionados.")
         return
 
-    st.dataframe(df_f, use_container_width=True)
+    col_orden, col_dir, col_tam, col_pag = st.columns([2, 1, 1, 1])
+    with col_orden:
+        orden = st.selectbox("Ordenar por", list(ORDEN_HISTORICO), key="hist_orden")
+    with col_dir:
+        descendente = st.toggle("Descendente", key="hist_desc")
+    with col_tam:
+        tamaño = st.selectbox("Filas por página", TAMAÑOS_PAGINA, index=1, key="hist_tamaño")
+
+    # Si cambian filtros, orden o tamaño volvemos a la primera página
+    ss = st.session_state
+    vista = (año_sel, mes_sel, tipo_sel, texto, rangos, orden, descendente, tamaño)
+    n_paginas = (total + tamaño - 1) // tamaño
+    if ss.get("hist_vista_prev") != vista:
+        ss["hist_vista_prev"] = vista
+        ss["hist_pagina"] = 1
+    elif ss.get("hist_pagina", 1) > n_paginas:
+        ss["hist_pagina"] = n_paginas
+    with col_pag:
+        pagina = st.number_input(
+            f"Página (de {n_paginas:,})", min_value=1, max_value=n_paginas, step=1,
+            key="hist_pagina",
+        )
+
+    # Sólo la página visible se lee del backend y se manda al navegador
+    offset = (pagina - 1) * tamaño
+    df_pagina = pagina_historico(
+        **filtros, orden=orden, ascendente=not descendente, offset=offset, limite=tamaño
+    )
+    # El formato "$x,xxx.xx" / "dd/mm/aaaa" sólo se aplica para mostrar
+    st.dataframe(formatear_ledger(df_pagina), use_container_width=True, hide_index=True)
+    st.caption(f"Registros {offset + 1:,}–{offset + len(df_pagina):,} de {total:,}")
 
-    # Botón opcional para descargar todo el histórico
+    # Botón opcional para descargar todo el histórico. El archivo se arma en
+    # segundo plano leyendo el backend por bloques, con los mismos filtros,
+    # y se comparte con otras sesiones que pidan lo mismo.
     st.markdown("")
-    csv = df_f.to_csv(index=False).encode("utf-8-sig")
-    st.download_button(
-        "💾 Descargar histórico filtrado (CSV)",
-        data=csv,
-        file_name="historial_impresos_mendieta.csv",
-        mime="text/csv",
-    )
\ No newline at end of file
+    formato = st.radio(
+        "Formato de descarga", list(FORMATOS_HISTORICO), horizontal=True, key="hist_formato"
+    )
+    ext, mime = FORMATOS_HISTORICO[formato]
+    clave = (
+        "historico", formato, año_sel, mes_sel, tipo_sel, texto, rangos,
+        *(version_historico(ledger) for ledger in TIPOS),
+    )
+    panel_exportacion(
+        clave,
+        f"historial_impresos_mendieta{ext}",
+        mime,
+        lambda ruta, progreso: escribir_historico(
+            ruta, formato, total=total, progreso=progreso, **filtros
+        ),
+        generar=f"💾 Preparar histórico filtrado ({formato})",
+        descargar=f"💾 Descargar histórico filtrado ({formato})",
+        key="export_hist",
+    )
@@ -2,7 +2,14 @@ import streamlit as st
 import pandas as pd
 from datetime import date
 
-from data_utils import guardar_venta_historica, cargar_ventas_historicas
+from bulk_import import importar_facturas
+from data_utils import (
+    ErrorValidacion,
+    construir_registro,
+    parse_monto,
+    pendientes_de_escribir,
+    guardar_venta_historica,
+)
 
 
 # =========================
@@ -21,9 +28,6 @@ def init_state_ventas():
     ss.setdefault("month", "Selecciona mes")
     ss.setdefault("metodo_pago", "TRANSFERENCIA")
 
-    # histórico (se rellenará desde CSV en análisis, pero por si quieres usarlo aquí)
-    ss.setdefault("ventas_historicas", [])
-
 
 # =========================
 # Formatear monto con $ + miles + punto decimal
@@ -38,16 +42,8 @@ def formatear_monto():
         ss["monto_mxn"] = "$"
         return
 
-    # quitar símbolo $, comas y espacios
-    limpio = (
-        texto.replace("$", "")
-        .replace(",", "")
-        .strip()
-    )
-
-    try:
-        valor = float(limpio)
-    except ValueError:
+    valor = parse_monto(texto)
+    if valor is None:
         # error de formato → lo marcamos pero no reventamos
         ss["form_error"] = "Revisa el formato del monto. Ejemplo válido: 18015.74 o 18,015.74"
         return
@@ -77,63 +73,28 @@ def guardar_factura():
         if key in ss:
             del ss[key]
 
-    # ---- VALIDACIONES (warnings) ----
-    if mes == "Selecciona mes":
-        ss["form_warning"] = "Falta seleccionar el **mes** de la venta."
-        return
-
-    if not numero_factura:
-        ss["form_warning"] = "Falta el **número de factura**."
-        return
-
-    if not cliente:
-        ss["form_warning"] = "Falta el **cliente** de la factura."
-        return
-
-    if fecha_emision is None or fecha_pago is None:
-        ss["form_warning"] = "Faltan la **fecha de emisión** y/o la **fecha de pago**."
-        return
-
-    monto_limpio = (
-        monto_texto.replace("$", "")
-        .replace(",", "")
-        .strip()
-    )
-
-    if monto_limpio == "":
-        ss["form_warning"] = "Falta capturar el **monto** de la factura."
-        return
-
+    # ---- VALIDACIONES (mismas reglas que la importación masiva) ----
     try:
-        monto_float = float(monto_limpio)
-    except ValueError:
-        ss["form_error"] = "Formato de monto inválido. Ejemplo válido: 18015.74 o 18,015.74"
+        nuevo_registro = construir_registro(
+            "ventas",
+            año,
+            mes,
+            numero_factura,
+            cliente,
+            fecha_emision,
+            fecha_pago,
+            monto_texto,
+            metodo_pago,
+        )
+    except ErrorValidacion as e:
+        ss["form_error" if e.nivel == "error" else "form_warning"] = str(e)
         return
 
-    # ---- Construimos el registro ----
-    fecha_emision_str = fecha_emision.strftime("%d/%m/%Y")
-    fecha_pago_str = fecha_pago.strftime("%d/%m/%Y")
-    monto_formateado = f"${monto_float:,.2f}"
-
-    nuevo_registro = {
-        "Año": año,
-        "Mes": mes,
-        "Número factura": numero_factura,
-        "Fecha emisión": fecha_emision_str,
-        "Cliente": cliente,
-        "Monto MXN": monto_formateado,
-        "Fecha pago": fecha_pago_str,
-        "Método pago": metodo_pago,
-    }
-
     # 1) Guardar en la sesión (para mostrar en la tabla de la página Ventas)
     ss["ingresos"].append(nuevo_registro)
 
     # 2) Guardar en el histórico (CSV permanente)
-    guardar_venta_historica(nuevo_registro)
-
-    # 3) Actualizar histórico en memoria (por si lo quieres usar en otro lado)
-    ss["ventas_historicas"] = cargar_ventas_historicas()
+    guardado = guardar_venta_historica(nuevo_registro)
 
     # ===== reset para la siguiente factura =====
     ss["month"] = "Selecciona mes"
@@ -144,7 +105,49 @@ def guardar_factura():
     ss["fecha_pago"] = None
     # método de pago se mantiene por comodidad
 
-    ss["mensaje_ok"] = "Factura de venta guardada en el resumen ✅"
+    if guardado.nuevo is False:
+        ss["mensaje_ok"] = "Factura agregada al resumen ✅ (ya estaba en el histórico, no se duplicó)"
+    else:
+        ss["mensaje_ok"] = "Factura de venta guardada en el resumen ✅"
+
+
+# =========================
+# Importación masiva (CSV / XLSX)
+# =========================
+def importacion_ventas():
+    with st.expander("📤 Importar facturas de venta desde archivo (CSV o XLSX)"):
+        st.caption(
+            "Columnas: Año, Mes, Número factura, Fecha emisión (dd/mm/aaaa), "
+            "Cliente, Monto MXN y, opcional, Método pago. "
+            "Las facturas importadas van directo al histórico."
+        )
+        archivo = st.file_uploader(
+            "Archivo de facturas",
+            type=["csv", "xlsx"],
+            key="archivo_importacion",
+        )
+        if archivo is None or not st.button("Importar facturas", key="btn_importar"):
+            return
+
+        try:
+            with st.spinner("Importando facturas…"):
+                resultado = importar_facturas("ventas", archivo, archivo.name)
+        except ErrorValidacion as e:
+            st.error(str(e))
+            return
+
+        st.success(
+            f"{resultado.escritas:,} de {resultado.leidas:,} facturas importadas al histórico ✅"
+        )
+        if resultado.duplicadas:
+            st.info(f"{resultado.duplicadas:,} ya existían en el histórico y se omitieron.")
+        if resultado.con_error:
+            st.warning(f"{resultado.con_error:,} filas con errores no se importaron:")
+            st.dataframe(
+                pd.DataFrame(resultado.errores, columns=["Fila", "Error"]),
+                use_container_width=True,
+                hide_index=True,
+            )
 
 
 # =========================
@@ -170,6 +173,11 @@ def ingresos_page():
         st.success(ss["mensaje_ok"])
         del ss["mensaje_ok"]
 
+    # Escritura diferida: cuántas facturas siguen en cola para el histórico
+    en_cola = pendientes_de_escribir("ventas")
+    if en_cola:
+        st.caption(f"⏳ {en_cola} factura(s) de venta en cola para guardarse en el histórico.")
+
     st.markdown("### Captura de nueva factura de venta")
 
     # ===== Layout en columnas =====
@@ -257,6 +265,8 @@ def ingresos_page():
             else:
                 st.info("No hay facturas de venta para eliminar.")
 
+    importacion_ventas()
+
     # ===== Tabla con lo capturado =====
     st.markdown("### Facturas de venta capturadas en esta sesión")
 
@@ -1,84 +1,153 @@
 # ============================
 #  LOGIN / AUTH IMPRESOS
 # ============================
-import json
+import os
+import hmac
+import base64
 import hashlib
-from pathlib import Path
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 import streamlit as st
 
-# Archivo JSON de usuarios
-USERS_FILE = Path("data/usuarios.json")
-USERS_FILE.parent.mkdir(parents=True, exist_ok=True)
+from rendimiento import tramo
+from usuarios import get_store
 
+logger = logging.getLogger(__name__)
 
-# ---------- utils de storage ----------
 
-def _load_users() -> dict:
-    """Carga usuarios desde el JSON."""
-    if not USERS_FILE.exists():
-        return {}
+# ---------- contraseñas ----------
+#
+# Hash con sal y costo ajustable, guardado como texto autodescriptivo:
+#   scrypt$<n>$<r>$<p>$<sal>$<hash>          (default)
+#   pbkdf2_sha256$<iteraciones>$<sal>$<hash>
+# Los hashes viejos (SHA-256 en hex, sin sal) se siguen aceptando y se
+# reemplazan por uno nuevo en cuanto el usuario entra bien; lo mismo si se
+# sube el costo. El costo se elige con benchmarks/bench_password.py.
+#
+# Calcular un hash tarda a propósito: corre en un pool de HASH_WORKERS
+# hilos (hashlib suelta el GIL), así que una ola de logins al inicio del
+# turno hace fila ahí en lugar de frenar los reruns de las demás sesiones.
+
+HASH_ALGORITMO = os.environ.get("IMPRESOS_HASH", "scrypt").lower()
+SCRYPT_N = int(os.environ.get("IMPRESOS_SCRYPT_N", str(2**14)))
+SCRYPT_R = int(os.environ.get("IMPRESOS_SCRYPT_R", "8"))
+SCRYPT_P = int(os.environ.get("IMPRESOS_SCRYPT_P", "1"))
+PBKDF2_ITERACIONES = int(os.environ.get("IMPRESOS_PBKDF2_ITER", "600000"))
+HASH_WORKERS = int(os.environ.get("IMPRESOS_HASH_WORKERS", "2"))
+
+_LARGO_SAL = 16
+_LARGO_HASH = 32
+
+_HASH_POOL = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix="impresos-hash")
+_REHASH_EN_CURSO: set[str] = set()
+_REHASH_LOCK = threading.Lock()
 
-    try:
-        with open(USERS_FILE, "r", encoding="utf-8") as f:
-            data = json.load(f)
-    except Exception:
-        return {}
-
-    # Normalizamos estructura:
-    # username -> {password, role, nombre, apellidos, email, telefono, pais}
-    users = {}
-    for user, info in data.items():
-        if isinstance(info, str):
-            users[user] = {
-                "password": info,
-                "role": "user",
-                "nombre": "",
-                "apellidos": "",
-                "email": "",
-                "telefono": "",
-                "pais": "",
-            }
-        elif isinstance(info, dict):
-            pwd_hash = (
-                info.get("password_hash")
-                or info.get("password")
-                or ""
-            )
-            users[user] = {
-                "password": pwd_hash,
-                "role": info.get("role", "user"),
-                "nombre": info.get("nombre", ""),
-                "apellidos": info.get("apellidos", ""),
-                "email": info.get("email", ""),
-                "telefono": info.get("telefono", ""),
-                "pais": info.get("pais", ""),
-            }
-    return users
 
+def _b64(datos: bytes) -> str:
+    return base64.b64encode(datos).decode("ascii")
 
-def _save_users(users: dict) -> None:
-    """Guarda usuarios en el JSON."""
-    with open(USERS_FILE, "w", encoding="utf-8") as f:
-        json.dump(users, f, indent=2, ensure_ascii=False)
 
+def _scrypt(password: str, sal: bytes, n: int, r: int, p: int) -> bytes:
+    return hashlib.scrypt(
+        password.encode("utf-8"), salt=sal, n=n, r=r, p=p,
+        maxmem=256 * n * r + 1024 * 1024, dklen=_LARGO_HASH,
+    )
 
-def _hash_password(password: str) -> str:
-    return hashlib.sha256(password.encode("utf-8")).hexdigest()
+
+def _pbkdf2(password: str, sal: bytes, iteraciones: int) -> bytes:
+    return hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), sal, iteraciones, _LARGO_HASH)
+
+
+@tramo("hash contraseña")
+def _hash_password(password: str, algoritmo: str | None = None, costo: dict | None = None) -> str:
+    """
+    Hash nuevo con sal aleatoria. Sin argumentos usa la configuración
+    (IMPRESOS_HASH y su costo); el benchmark pasa otros para compararlos.
+    """
+    algoritmo = algoritmo or HASH_ALGORITMO
+    costo = costo or {}
+    sal = os.urandom(_LARGO_SAL)
+    if algoritmo == "scrypt":
+        n = costo.get("n", SCRYPT_N)
+        r = costo.get("r", SCRYPT_R)
+        p = costo.get("p", SCRYPT_P)
+        return f"scrypt${n}${r}${p}${_b64(sal)}${_b64(_scrypt(password, sal, n, r, p))}"
+    if algoritmo == "pbkdf2":
+        iteraciones = costo.get("iteraciones", PBKDF2_ITERACIONES)
+        return (
+            f"pbkdf2_sha256${iteraciones}${_b64(sal)}$"
+            f"{_b64(_pbkdf2(password, sal, iteraciones))}"
+        )
+    raise ValueError(f"IMPRESOS_HASH desconocido: {algoritmo!r}")
 
 
+@tramo("verificar contraseña")
 def _verify_password(password: str, stored_hash: str) -> bool:
-    return _hash_password(password) == (stored_hash or "")
+    """Compara en tiempo constante contra cualquiera de los formatos guardados."""
+    partes = (stored_hash or "").split("$")
+    try:
+        if partes[0] == "scrypt" and len(partes) == 6:
+            n, r, p = (int(x) for x in partes[1:4])
+            esperado = base64.b64decode(partes[5])
+            calculado = _scrypt(password, base64.b64decode(partes[4]), n, r, p)
+        elif partes[0] == "pbkdf2_sha256" and len(partes) == 4:
+            esperado = base64.b64decode(partes[3])
+            calculado = _pbkdf2(password, base64.b64decode(partes[2]), int(partes[1]))
+        elif len(partes) == 1 and partes[0]:
+            # Formato viejo: SHA-256 en hex, sin sal
+            esperado = partes[0].encode("ascii")
+            calculado = hashlib.sha256(password.encode("utf-8")).hexdigest().encode("ascii")
+        else:
+            return False
+    except (ValueError, UnicodeEncodeError):
+        return False
+    return hmac.compare_digest(calculado, esperado)
+
+
+def _necesita_rehash(stored_hash: str) -> bool:
+    """True si el hash no es del algoritmo y costo configurados (incluye los viejos)."""
+    partes = (stored_hash or "").split("$")
+    if HASH_ALGORITMO == "scrypt":
+        return partes[:4] != ["scrypt", str(SCRYPT_N), str(SCRYPT_R), str(SCRYPT_P)]
+    return partes[:2] != ["pbkdf2_sha256", str(PBKDF2_ITERACIONES)]
+
+
+def _en_pool(fn, *args):
+    """Corre un hash en el pool y espera el resultado (la sesión espera; las demás no)."""
+    return _HASH_POOL.submit(fn, *args).result()
+
+
+def _rehash(username: str, password: str) -> None:
+    try:
+        get_store().actualizar(username, password=_hash_password(password))
+    except Exception:
+        logger.exception("No se pudo actualizar el hash de %s", username)
+    finally:
+        with _REHASH_LOCK:
+            _REHASH_EN_CURSO.discard(username)
+
+
+def _rehash_si_hace_falta(username: str, password: str, stored_hash: str) -> None:
+    """Tras un login correcto, cambia un hash viejo o de costo distinto, en segundo plano."""
+    if not _necesita_rehash(stored_hash):
+        return
+    with _REHASH_LOCK:
+        if username in _REHASH_EN_CURSO:
+            return
+        _REHASH_EN_CURSO.add(username)
+    _HASH_POOL.submit(_rehash, username, password)
 
 
 # ---------- helpers públicos ----------
 
 def get_user_role(username: str) -> str:
-    """Devuelve el rol del usuario leyendo directo del JSON."""
+    """Devuelve el rol del usuario (un lookup en el directorio, ver usuarios.py)."""
     if not username:
         return "user"
-    users = _load_users()
-    return users.get(username, {}).get("role", "user")
+    info = get_store().obtener(username)
+    return "user" if info is None else info.get("role", "user")
 
 
 # ---------- PANTALLA DE LOGIN / REGISTRO ----------
@@ -97,8 +166,8 @@ def login_page():
     if "auth_mode" not in ss:
         ss["auth_mode"] = "login"  # "primer_usuario", "login", "registro", "forgot"
 
-    users = _load_users()
-    hay_usuarios = len(users) > 0
+    store = get_store()
+    hay_usuarios = store.hay_usuarios()
 
     # Si no hay usuarios → forzamos modo "primer usuario admin"
     if not hay_usuarios:
@@ -170,19 +239,17 @@ def login_page():
                     error_msg = "Usuario y contraseña son obligatorios."
                 elif pwd != pwd2:
                     error_msg = "Las contraseñas no coinciden."
-                elif username in users:
+                elif not store.agregar(username, {
+                    "password": _en_pool(_hash_password, pwd),
+                    "role": "admin",
+                    "nombre": "",
+                    "apellidos": "",
+                    "email": "",
+                    "telefono": "",
+                    "pais": "",
+                }):
                     error_msg = "Ese usuario ya existe. Elige otro."
                 else:
-                    users[username] = {
-                        "password": _hash_password(pwd),
-                        "role": "admin",
-                        "nombre": "",
-                        "apellidos": "",
-                        "email": "",
-                        "telefono": "",
-                        "pais": "",
-                    }
-                    _save_users(users)
                     ss["logged_in"] = True
                     ss["authenticated"] = True
                     ss["current_user"] = username
@@ -207,17 +274,17 @@ def login_page():
                 if st.button("Entrar al panel", use_container_width=True):
                     if not usuario or not pwd:
                         error_msg = "Usuario y contraseña son obligatorios."
-                    elif usuario not in users:
+                    elif (info := store.obtener(usuario)) is None:
                         error_msg = "Usuario no encontrado."
                     else:
-                        stored = users[usuario]["password"]
-                        if not _verify_password(pwd, stored):
+                        if not _en_pool(_verify_password, pwd, info["password"]):
                             error_msg = "Contraseña incorrecta."
                         else:
+                            _rehash_si_hace_falta(usuario, pwd, info["password"])
                             ss["logged_in"] = True
                             ss["authenticated"] = True
                             ss["current_user"] = usuario
-                            ss["current_role"] = users[usuario].get("role", "user")
+                            ss["current_role"] = info.get("role", "user")
                             st.success("Bienvenido. Cargando el panel…")
                             st.rerun()
 
@@ -261,19 +328,17 @@ def login_page():
                         error_msg = "Usuario y contraseña son obligatorios."
                     elif new_pwd != new_pwd2:
                         error_msg = "Las contraseñas no coinciden."
-                    elif new_user in users:
+                    elif not store.agregar(new_user, {
+                        "password": _en_pool(_hash_password, new_pwd),
+                        "role": "user",
+                        "nombre": nombre,
+                        "apellidos": apellidos,
+                        "email": email,
+                        "telefono": telefono,
+                        "pais": pais,
+                    }):
                         error_msg = "Ese usuario ya existe. Elige otro."
                     else:
-                        users[new_user] = {
-                            "password": _hash_password(new_pwd),
-                            "role": "user",
-                            "nombre": nombre,
-                            "apellidos": apellidos,
-                            "email": email,
-                            "telefono": telefono,
-                            "pais": pais,
-                        }
-                        _save_users(users)
                         st.success(
                             "Cuenta creada. Ahora inicia sesión con tu nuevo usuario."
                         )
@@ -0,0 +1,144 @@
+# rendimiento.py
+"""
+Tiempos por tramo dentro de cada rerun (cargar, filtrar, agrupar, gráficas,
+Excel, lectura de JSON...).
+
+    with tramo("cargar libro"):
+        ...
+
+    @tramo("Excel mensual")
+    def construir_excel(...):
+        ...
+
+Cada tramo guarda sus últimas PERF_VENTANA duraciones en memoria del
+proceso (compartidas entre sesiones), de donde salen p50/p95 para la
+página "Rendimiento" del admin. Medir cuesta dos perf_counter y un
+append, así que queda prendido siempre; IMPRESOS_PERF=0 lo apaga.
+
+Con IMPRESOS_PERF_LOG=<archivo> además se agrega una línea JSON por
+tramo medido ({"ts", "tramo", "ms"}) para analizarlo fuera de la app.
+"""
+import os
+import json
+import time
+import logging
+import threading
+from collections import deque
+from contextlib import ContextDecorator
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+PERF_ACTIVO = os.environ.get("IMPRESOS_PERF", "1") == "1"
+PERF_VENTANA = int(os.environ.get("IMPRESOS_PERF_VENTANA", "500"))
+PERF_LOG = os.environ.get("IMPRESOS_PERF_LOG", "")
+
+
+class _Tiempos:
+    """Duraciones recientes por tramo, más conteo y tiempo total desde el arranque."""
+
+    def __init__(self, ventana: int):
+        self._lock = threading.Lock()
+        self._ventana = ventana
+        self._muestras: dict[str, deque] = {}
+        self._totales: dict[str, list] = {}   # tramo -> [n, segundos]
+        self._log_lock = threading.Lock()
+
+    def registrar(self, nombre: str, segundos: float) -> None:
+        with self._lock:
+            muestras = self._muestras.get(nombre)
+            if muestras is None:
+                muestras = self._muestras[nombre] = deque(maxlen=self._ventana)
+                self._totales[nombre] = [0, 0.0]
+            muestras.append(segundos)
+            total = self._totales[nombre]
+            total[0] += 1
+            total[1] += segundos
+        if PERF_LOG:
+            self._escribir_log(nombre, segundos)
+
+    def _escribir_log(self, nombre: str, segundos: float) -> None:
+        linea = json.dumps(
+            {"ts": round(time.time(), 3), "tramo": nombre, "ms": round(segundos * 1000, 3)},
+            ensure_ascii=False,
+        )
+        try:
+            with self._log_lock, open(PERF_LOG, "a", encoding="utf-8") as f:
+                f.write(linea + "\n")
+        except OSError:
+            logger.exception("No se pudo escribir en %s", PERF_LOG)
+
+    def resumen(self) -> list[dict]:
+        """Una fila por tramo: n, p50/p95/máx de la ventana (ms) y total acumulado (s)."""
+        with self._lock:
+            copia = {nombre: np.fromiter(m, dtype=float) for nombre, m in self._muestras.items()}
+            totales = {nombre: tuple(t) for nombre, t in self._totales.items()}
+        filas = []
+        for nombre, muestras in copia.items():
+            ms = muestras * 1000
+            filas.append({
+                "tramo": nombre,
+                "n": totales[nombre][0],
+                "p50_ms": round(float(np.percentile(ms, 50)), 2),
+                "p95_ms": round(float(np.percentile(ms, 95)), 2),
+                "max_ms": round(float(ms.max()), 2),
+                "total_s": round(totales[nombre][1], 3),
+            })
+        return sorted(filas, key=lambda f: f["total_s"], reverse=True)
+
+    def muestras(self) -> dict[str, list[float]]:
+        """Las duraciones de la ventana (ms), para exportar."""
+        with self._lock:
+            return {
+                nombre: [round(s * 1000, 3) for s in m] for nombre, m in self._muestras.items()
+            }
+
+    def reiniciar(self) -> None:
+        with self._lock:
+            self._muestras.clear()
+            self._totales.clear()
+
+
+_TIEMPOS = _Tiempos(PERF_VENTANA)
+
+
+class tramo(ContextDecorator):
+    """Mide un bloque (`with tramo(...)`) o cada llamada a una función (`@tramo(...)`)."""
+
+    def __init__(self, nombre: str):
+        self.nombre = nombre
+        self._inicios = threading.local()
+
+    def __enter__(self):
+        # Una pila por hilo: el mismo decorador puede estar activo en varias sesiones
+        pila = getattr(self._inicios, "pila", None)
+        if pila is None:
+            pila = self._inicios.pila = []
+        pila.append(time.perf_counter())
+        return self
+
+    def __exit__(self, *exc):
+        inicio = self._inicios.pila.pop()
+        if PERF_ACTIVO:
+            _TIEMPOS.registrar(self.nombre, time.perf_counter() - inicio)
+        return False
+
+
+def resumen_tiempos() -> list[dict]:
+    return _TIEMPOS.resumen()
+
+
+def exportar_tiempos() -> dict:
+    """Resumen y muestras crudas en un dict listo para json.dump."""
+    return {
+        "generado": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "pid": os.getpid(),
+        "ventana": PERF_VENTANA,
+        "resumen": _TIEMPOS.resumen(),
+        "muestras_ms": _TIEMPOS.muestras(),
+    }
+
+
+def reiniciar_tiempos() -> None:
+    _TIEMPOS.reiniciar()
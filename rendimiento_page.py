@@ -0,0 +1,71 @@
+import json
+
+import streamlit as st
+import pandas as pd
+
+from data_utils import cache_stats, pendientes_de_escribir
+from excel_export import cache_excel_stats
+from export_jobs import exportaciones_stats
+from rendimiento import (
+    PERF_ACTIVO,
+    PERF_LOG,
+    PERF_VENTANA,
+    exportar_tiempos,
+    reiniciar_tiempos,
+    resumen_tiempos,
+)
+
+
+def rendimiento_page():
+    st.title("⏱️ Rendimiento")
+    st.caption(
+        "Tiempos por tramo de los reruns de este proceso (todas las sesiones), "
+        f"sobre las últimas {PERF_VENTANA} mediciones de cada uno."
+    )
+
+    if not PERF_ACTIVO:
+        st.info("La medición está apagada (IMPRESOS_PERF=0).")
+
+    filas = resumen_tiempos()
+    if not filas:
+        st.info("Todavía no hay mediciones. Navega por la app y vuelve aquí.")
+    else:
+        df = pd.DataFrame(filas).rename(columns={
+            "tramo": "Tramo", "n": "Veces", "p50_ms": "p50 (ms)", "p95_ms": "p95 (ms)",
+            "max_ms": "Máx (ms)", "total_s": "Total (s)",
+        })
+        st.dataframe(df, use_container_width=True, hide_index=True)
+        st.markdown("#### p95 por tramo (ms)")
+        st.bar_chart(df.set_index("Tramo")["p95 (ms)"].sort_values(ascending=False).head(15))
+
+    # Cachés y trabajos en segundo plano
+    st.markdown("---")
+    st.markdown("### Cachés y colas")
+    libros, excel, exportaciones = cache_stats(), cache_excel_stats(), exportaciones_stats()
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Caché de libros", f"{libros['hits']:,} hits", f"{libros['misses']:,} misses",
+                delta_color="off")
+    col2.metric("Caché de Excel", f"{excel['hits']:,} hits", f"{excel['bytes'] / 1e6:.1f} MB",
+                delta_color="off")
+    col3.metric("Exportaciones", f"{sum(exportaciones.values()):,}",
+                ", ".join(f"{n} {estado}" for estado, n in exportaciones.items()) or None,
+                delta_color="off")
+    col4.metric("Guardados en cola", f"{pendientes_de_escribir():,}")
+
+    # Exportar para analizar fuera de la app
+    st.markdown("---")
+    col_a, col_b = st.columns(2)
+    with col_a:
+        st.download_button(
+            "💾 Descargar tiempos (JSON)",
+            data=json.dumps(exportar_tiempos(), ensure_ascii=False, indent=1),
+            file_name="rendimiento_impresos.json",
+            mime="application/json",
+            use_container_width=True,
+        )
+    with col_b:
+        if st.button("🔄 Reiniciar mediciones", use_container_width=True):
+            reiniciar_tiempos()
+            st.rerun()
+    if PERF_LOG:
+        st.caption(f"Además se registra cada medición en `{PERF_LOG}` (una línea JSON por tramo).")
@@ -1,6 +1,13 @@
 import streamlit as st
 import pandas as pd
-import io
+
+from excel_export import (
+    clave_excel,
+    clave_excel_anual,
+    excel_anual,
+    excel_mensual,
+)
+from export_jobs import MIME_XLSX, escribir_bytes, panel_exportacion
 
 # =========================================
 # Helpers de estado para la pestaña Resumen
@@ -11,103 +18,27 @@ def init_state_resumen():
     ss.setdefault("resumen_año_prev", None)
     ss.setdefault("resumen_ocultar_tablas", False)
 
-    # Listas donde guardaremos el histórico para la pestaña Análisis
-    ss.setdefault("ventas_historicas", [])   # registros ya enviados a Análisis
-    ss.setdefault("compras_historicas", [])
-
 
 # =========================================
-# Construir archivo Excel en memoria
+# Consolidado anual (desde el histórico)
 # =========================================
-def construir_excel(mes_sel, año_sel, df_v_mes, df_c_mes):
-    output = io.BytesIO()
-
-    with pd.ExcelWriter(output, engine="xlsxwriter") as writer:
-        workbook = writer.book
-
-        # Formatos
-        formato_titulo = workbook.add_format(
-            {"bold": True, "font_size": 16, "align": "left"}
-        )
-        formato_sub = workbook.add_format(
-            {"bold": True, "font_size": 12, "align": "left"}
+def reporte_anual(año_sel):
+    with st.expander(f"📚 Reporte anual {año_sel} (histórico)"):
+        st.caption(
+            "Un solo Excel con una hoja por mes y una hoja de resumen con "
+            "ingresos, egresos y balance por mes (con fórmulas)."
         )
-        formato_header = workbook.add_format(
-            {"bold": True, "bg_color": "#D9D9D9", "border": 1}
+        clave = clave_excel_anual(año_sel)
+        # Se genera en segundo plano; la página sigue respondiendo mientras tanto
+        panel_exportacion(
+            clave,
+            f"Reporte_Impresos_{año_sel}.xlsx",
+            MIME_XLSX,
+            lambda ruta, progreso: escribir_bytes(ruta, excel_anual(año_sel, clave, progreso)),
+            generar="📄 Generar reporte anual",
+            descargar="⬇️ Descargar reporte anual",
+            key="export_anual",
         )
-        formato_normal = workbook.add_format({"border": 1})
-
-        # ===== Hoja principal =====
-        hoja = workbook.add_worksheet("Resumen")
-
-        # Título
-        titulo = f"Impresos / {mes_sel} {año_sel}"
-        hoja.write(0, 0, titulo, formato_titulo)
-
-        # ===== Bloque INGRESOS =====
-        fila_inicio_ing = 2
-        hoja.write(fila_inicio_ing, 0, "INGRESOS", formato_sub)
-
-        if not df_v_mes.empty:
-            df_v_mes_excel = df_v_mes.copy()
-            df_v_mes_excel.to_excel(
-                writer,
-                sheet_name="Resumen",
-                startrow=fila_inicio_ing + 2,
-                startcol=0,
-                index=False,
-                header=False
-            )
-
-            # Encabezados
-            for col, nombre_col in enumerate(df_v_mes.columns):
-                hoja.write(fila_inicio_ing + 1, col, nombre_col, formato_header)
-
-            filas_v = len(df_v_mes)
-            for fila in range(fila_inicio_ing + 2, fila_inicio_ing + 2 + filas_v):
-                for col in range(len(df_v_mes.columns)):
-                    hoja.write(
-                        fila,
-                        col,
-                        df_v_mes.iloc[fila - (fila_inicio_ing + 2), col],
-                        formato_normal,
-                    )
-
-        # ===== Bloque EGRESOS =====
-        fila_inicio_egr = fila_inicio_ing + 4 + max(len(df_v_mes), 1)
-        hoja.write(fila_inicio_egr, 0, "EGRESOS", formato_sub)
-
-        if not df_c_mes.empty:
-            df_c_mes_excel = df_c_mes.copy()
-            df_c_mes_excel.to_excel(
-                writer,
-                sheet_name="Resumen",
-                startrow=fila_inicio_egr + 2,
-                startcol=0,
-                index=False,
-                header=False
-            )
-
-            # Encabezados
-            for col, nombre_col in enumerate(df_c_mes.columns):
-                hoja.write(fila_inicio_egr + 1, col, nombre_col, formato_header)
-
-            filas_c = len(df_c_mes)
-            for fila in range(fila_inicio_egr + 2, fila_inicio_egr + 2 + filas_c):
-                for col in range(len(df_c_mes.columns)):
-                    hoja.write(
-                        fila,
-                        col,
-                        df_c_mes.iloc[fila - (fila_inicio_egr + 2), col],
-                        formato_normal,
-                    )
-
-        # Ajustar ancho de columnas
-        for col in range(0, 8):
-            hoja.set_column(col, col, 15)
-
-    output.seek(0)
-    return output.getvalue()
 
 
 # =========================================
@@ -140,6 +71,8 @@ def resumen_excel_page():
         ss["resumen_año_prev"] = año_sel
         ss["resumen_mes_prev"] = mes_sel
 
+    reporte_anual(año_sel)
+
     st.markdown(f"## Resumen para: **{mes_sel} {año_sel}** 🔁")
 
     # ===== DataFrames a partir de lo capturado en la sesión =====
@@ -195,35 +128,33 @@ def resumen_excel_page():
         return
 
     # ===== Botón: Descargar Excel =====
-    excel_bytes = construir_excel(mes_sel, año_sel, df_v_mes, df_c_mes)
-    nombre_archivo = f"Resumen_Impresos_{mes_sel}_{año_sel}.xlsx"
-
-    descargado = st.download_button(
-        label="⬇️ Descargar Excel",
-        data=excel_bytes,
-        file_name=nombre_archivo,
-        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        use_container_width=True,
-    )
+    # El libro sólo se genera cuando lo piden y en segundo plano; si ya se
+    # generó para estos mismos datos (en esta u otra sesión) se reutiliza.
+    clave = clave_excel(mes_sel, año_sel, df_v_mes, df_c_mes)
 
-    # Si quieres que solo el download oculte tablas, deja esto.
-    if descargado:
+    def _ocultar_tablas():
+        # Si quieres que solo el download oculte tablas, deja esto.
         ss["resumen_ocultar_tablas"] = True
 
+    panel_exportacion(
+        clave,
+        f"Resumen_Impresos_{mes_sel}_{año_sel}.xlsx",
+        MIME_XLSX,
+        lambda ruta, progreso: escribir_bytes(
+            ruta, excel_mensual(mes_sel, año_sel, df_v_mes, df_c_mes, clave)
+        ),
+        generar="📄 Generar Excel",
+        descargar="⬇️ Descargar Excel",
+        key="export_mes",
+        al_descargar=_ocultar_tablas,
+    )
+
     st.markdown("")
 
     # ===== Botón: mandar info a Análisis y limpiar tablas =====
     if st.button("➡️ Ir a Análisis", use_container_width=True):
-        # Nos aseguramos de que existan las listas históricas
-        ss.setdefault("ventas_historicas", [])
-        ss.setdefault("compras_historicas", [])
-
-        # 1) Pasar registros del mes actual a histórico (Análisis)
-        if not df_v_mes.empty:
-            ss["ventas_historicas"].extend(df_v_mes.to_dict(orient="records"))
-
-        if not df_c_mes.empty:
-            ss["compras_historicas"].extend(df_c_mes.to_dict(orient="records"))
+        # 1) Los registros ya están en el histórico desde que se capturaron;
+        #    Análisis los lee de ahí, no hace falta copiarlos a la sesión.
 
         # 2) Quitar esas filas de las listas principales (ingresos/compras)
         ss["ingresos"] = [
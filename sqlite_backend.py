@@ -0,0 +1,355 @@
+# sqlite_backend.py
+"""
+Backend SQLite (stdlib) para el histórico de ventas y compras.
+
+Ambos libros viven en una sola tabla `movimientos` con columna `tipo`.
+El monto se guarda en centavos (INTEGER) y las fechas en ISO (YYYY-MM-DD),
+con índices por año/mes/tipo y por contraparte para filtrar sin leer todo.
+
+Cada libro lleva su propio contador de versión (tabla `versiones`, al día
+por triggers): guardar ventas no invalida las cachés ni los agregados de
+compras, y un checkpoint del WAL no cambia la versión de nadie.
+
+Hacia afuera los registros se regresan con las mismas columnas que el CSV,
+ya con el esquema tipado de data_utils (monto float, fechas datetime).
+"""
+import sqlite3
+import threading
+from datetime import datetime
+
+import pandas as pd
+
+from busqueda import consulta_fts
+from data_utils import (
+    BLOQUE_LECTURA,
+    CONTRAPARTE,
+    MESES,
+    TIPOS,
+    Rangos,
+    columnas_ledger,
+    ledger_vacio,
+    parse_monto,
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS movimientos (
+    id              INTEGER PRIMARY KEY,
+    tipo            TEXT    NOT NULL CHECK (tipo IN ('Ventas', 'Compras')),
+    anio            INTEGER NOT NULL,
+    mes             INTEGER NOT NULL CHECK (mes BETWEEN 1 AND 12),
+    numero_factura  TEXT    NOT NULL,
+    fecha_emision   TEXT,
+    contraparte     TEXT    NOT NULL,
+    monto_centavos  INTEGER NOT NULL,
+    fecha_pago      TEXT,
+    metodo_pago     TEXT,
+    UNIQUE (tipo, anio, mes, numero_factura, fecha_emision, contraparte,
+            monto_centavos, fecha_pago, metodo_pago)
+);
+CREATE INDEX IF NOT EXISTS idx_mov_periodo ON movimientos (tipo, anio, mes);
+CREATE INDEX IF NOT EXISTS idx_mov_anio_mes ON movimientos (anio, mes);
+CREATE INDEX IF NOT EXISTS idx_mov_contraparte ON movimientos (tipo, contraparte);
+CREATE INDEX IF NOT EXISTS idx_mov_emision ON movimientos (tipo, fecha_emision);
+CREATE INDEX IF NOT EXISTS idx_mov_pago ON movimientos (tipo, fecha_pago);
+CREATE INDEX IF NOT EXISTS idx_mov_monto ON movimientos (tipo, monto_centavos);
+"""
+
+# Búsqueda por texto: índice FTS5 sobre la misma tabla (external content),
+# mantenido por triggers en cada INSERT/DELETE. Mismo tokenizador que
+# busqueda.palabras(): minúsculas, sin acentos, letras y números.
+SCHEMA_BUSQUEDA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS movimientos_fts USING fts5(
+    contraparte, numero_factura,
+    content='movimientos', content_rowid='id',
+    tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+);
+CREATE TRIGGER IF NOT EXISTS movimientos_fts_ai AFTER INSERT ON movimientos BEGIN
+    INSERT INTO movimientos_fts (rowid, contraparte, numero_factura)
+    VALUES (new.id, new.contraparte, new.numero_factura);
+END;
+CREATE TRIGGER IF NOT EXISTS movimientos_fts_ad AFTER DELETE ON movimientos BEGIN
+    INSERT INTO movimientos_fts (movimientos_fts, rowid, contraparte, numero_factura)
+    VALUES ('delete', old.id, old.contraparte, old.numero_factura);
+END;
+"""
+
+# Versión por libro. Arranca en un número al azar para que una base
+# reemplazada por otra no repita la versión que ya tenían las cachés.
+SCHEMA_VERSIONES = """
+CREATE TABLE IF NOT EXISTS versiones (
+    tipo     TEXT PRIMARY KEY,
+    version  INTEGER NOT NULL
+) WITHOUT ROWID;
+INSERT OR IGNORE INTO versiones (tipo, version) VALUES
+    ('Ventas', abs(random() % 1000000000000)),
+    ('Compras', abs(random() % 1000000000000));
+CREATE TRIGGER IF NOT EXISTS movimientos_version_ai AFTER INSERT ON movimientos BEGIN
+    UPDATE versiones SET version = version + 1 WHERE tipo = new.tipo;
+END;
+CREATE TRIGGER IF NOT EXISTS movimientos_version_ad AFTER DELETE ON movimientos BEGIN
+    UPDATE versiones SET version = version + 1 WHERE tipo = old.tipo;
+END;
+CREATE TRIGGER IF NOT EXISTS movimientos_version_au AFTER UPDATE ON movimientos BEGIN
+    UPDATE versiones SET version = version + 1 WHERE tipo IN (old.tipo, new.tipo);
+END;
+"""
+
+_COLS_SQL = (
+    "anio, mes, numero_factura, fecha_emision, contraparte, "
+    "monto_centavos, fecha_pago, metodo_pago"
+)
+
+# Columnas de ORDER BY para cada orden de data_utils.ORDEN_HISTORICO
+_ORDEN_SQL = {
+    "Captura": [],
+    "Periodo": ["anio", "mes"],
+    "Fecha emisión": ["fecha_emision"],
+    "Fecha pago": ["fecha_pago"],
+    "Monto MXN": ["monto_centavos"],
+    "Número factura": ["numero_factura"],
+}
+
+
+# ---------- conversiones registro <-> fila SQL ----------
+
+def _a_centavos(texto) -> int:
+    monto = parse_monto(texto)
+    if monto is None:
+        raise ValueError(f"Monto inválido: {texto!r}")
+    return int(round(monto * 100))
+
+
+def _a_iso(fecha) -> str | None:
+    if fecha is None or str(fecha).strip() == "":
+        return None
+    return datetime.strptime(str(fecha).strip(), "%d/%m/%Y").date().isoformat()
+
+
+def _a_fila_sql(ledger: str, row: dict) -> tuple:
+    """Convierte un registro (formato CSV/página) a la tupla de la tabla."""
+    return (
+        TIPOS[ledger],
+        int(row["Año"]),
+        MESES.index(row["Mes"]) + 1,
+        str(row["Número factura"]),
+        _a_iso(row.get("Fecha emisión")),
+        str(row[CONTRAPARTE[ledger]]),
+        _a_centavos(row["Monto MXN"]),
+        _a_iso(row.get("Fecha pago")),
+        str(row.get("Método pago") or ""),
+    )
+
+
+def _a_dataframe(filas: list[tuple], ledger: str) -> pd.DataFrame:
+    """Filas SQL -> DataFrame con el esquema tipado de data_utils."""
+    if not filas:
+        return ledger_vacio(ledger)
+    cols = columnas_ledger(ledger)
+    contraparte = CONTRAPARTE[ledger]
+    df = pd.DataFrame(filas, columns=cols)
+    return pd.DataFrame({
+        "Año": df["Año"].astype("Int16"),
+        "Mes": pd.Categorical.from_codes(df["Mes"] - 1, categories=MESES, ordered=True),
+        "Número factura": df["Número factura"].astype("string"),
+        "Fecha emisión": pd.to_datetime(df["Fecha emisión"], format="%Y-%m-%d"),
+        contraparte: df[contraparte].astype("category"),
+        "Monto MXN": df["Monto MXN"] / 100,
+        "Fecha pago": pd.to_datetime(df["Fecha pago"], format="%Y-%m-%d"),
+        "Método pago": df["Método pago"].astype("category"),
+    })
+
+
+def _rangos_sql(rangos: Rangos) -> tuple[list[str], list]:
+    """Condiciones WHERE de los rangos, sobre columnas con índice (tipo, columna)."""
+    where, params = [], []
+    columnas = {
+        "Fecha emisión": ("fecha_emision", lambda d: pd.Timestamp(d).date().isoformat()),
+        "Fecha pago": ("fecha_pago", lambda d: pd.Timestamp(d).date().isoformat()),
+        "Monto MXN": ("monto_centavos", lambda m: int(round(float(m) * 100))),
+    }
+    for col, desde, hasta in rangos.limites():
+        sql, convertir = columnas[col]
+        if desde is not None:
+            where.append(f"{sql} >= ?")
+            params.append(convertir(desde))
+        if hasta is not None:
+            where.append(f"{sql} <= ?")
+            params.append(convertir(hasta))
+    if rangos.sin_pago:
+        where.append("fecha_pago IS NULL")
+    return where, params
+
+
+# ---------- backend ----------
+
+class SQLiteBackend:
+    nombre = "sqlite"
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._local = threading.local()
+        conn = self._conn()
+        conn.executescript(SCHEMA)
+        nueva = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'movimientos_fts'"
+        ).fetchone() is None
+        conn.executescript(SCHEMA_BUSQUEDA)
+        conn.executescript(SCHEMA_VERSIONES)
+        if nueva:
+            # Base creada antes de la búsqueda: indexamos lo que ya tenía
+            with conn:
+                conn.execute("INSERT INTO movimientos_fts (movimientos_fts) VALUES ('rebuild')")
+
+    def _conn(self) -> sqlite3.Connection:
+        # Streamlit atiende cada sesión en su propio hilo: una conexión por hilo.
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def firma(self, ledger: str):
+        # Sólo cambia cuando cambian las filas de este libro
+        fila = self._conn().execute(
+            "SELECT version FROM versiones WHERE tipo = ?", (TIPOS[ledger],)
+        ).fetchone()
+        return fila[0]
+
+    def guardar(self, ledger: str, row: dict) -> bool:
+        conn = self._conn()
+        with conn:
+            cur = conn.execute(
+                f"INSERT OR IGNORE INTO movimientos (tipo, {_COLS_SQL}) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                _a_fila_sql(ledger, row),
+            )
+        return cur.rowcount == 1
+
+    def guardar_muchos(self, ledger: str, rows: list[dict]) -> list[dict]:
+        """Inserta varios registros en una sola transacción. Regresa los que entraron."""
+        conn = self._conn()
+        escritos = []
+        with conn:
+            for row in rows:
+                cur = conn.execute(
+                    f"INSERT OR IGNORE INTO movimientos (tipo, {_COLS_SQL}) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    _a_fila_sql(ledger, row),
+                )
+                if cur.rowcount == 1:
+                    escritos.append(row)
+        return escritos
+
+    @staticmethod
+    def _where(ledger: str, año=None, mes=None, contraparte=None, texto=None,
+               rangos: Rangos | None = None) -> tuple[str, list]:
+        where = ["tipo = ?"]
+        params: list = [TIPOS[ledger]]
+        if año is not None:
+            where.append("anio = ?")
+            params.append(int(año))
+        if mes is not None:
+            where.append("mes = ?")
+            params.append(MESES.index(mes) + 1)
+        if contraparte is not None:
+            where.append("contraparte = ?")
+            params.append(contraparte)
+        consulta = consulta_fts(texto) if texto else None
+        if consulta is not None:
+            where.append(
+                "id IN (SELECT rowid FROM movimientos_fts WHERE movimientos_fts MATCH ?)"
+            )
+            params.append(consulta)
+        if rangos is not None:
+            where_r, params_r = _rangos_sql(rangos)
+            where += where_r
+            params += params_r
+        return " AND ".join(where), params
+
+    def consultar(self, ledger: str, año=None, mes=None, contraparte=None) -> pd.DataFrame:
+        where, params = self._where(ledger, año, mes, contraparte)
+        filas = self._conn().execute(
+            f"SELECT {_COLS_SQL} FROM movimientos WHERE {where} ORDER BY id",
+            params,
+        ).fetchall()
+        return _a_dataframe(filas, ledger)
+
+    def consultar_bloques(self, ledger: str, año=None, mes=None, texto=None,
+                          rangos: Rangos | None = None, tamaño: int = BLOQUE_LECTURA):
+        """Como consultar(), pero con fetchmany: a lo más `tamaño` filas en memoria."""
+        where, params = self._where(ledger, año, mes, texto=texto, rangos=rangos)
+        cur = self._conn().execute(
+            f"SELECT {_COLS_SQL} FROM movimientos WHERE {where} ORDER BY id",
+            params,
+        )
+        try:
+            while filas := cur.fetchmany(tamaño):
+                yield _a_dataframe(filas, ledger)
+        finally:
+            cur.close()
+
+    def contar(self, ledger: str, año=None, mes=None, texto=None,
+               rangos: Rangos | None = None) -> int:
+        """COUNT(*) resuelto con los índices (y el FTS si hay texto), sin leer las filas."""
+        where, params = self._where(ledger, año, mes, texto=texto, rangos=rangos)
+        return self._conn().execute(
+            f"SELECT COUNT(*) FROM movimientos WHERE {where}", params
+        ).fetchone()[0]
+
+    def pagina(self, ledger: str, año=None, mes=None, orden: str = "Captura",
+               ascendente: bool = True, offset: int = 0, limite: int = 50,
+               texto=None, rangos: Rangos | None = None) -> pd.DataFrame:
+        """Sólo las filas [offset, offset + limite) del filtro, con ORDER BY / LIMIT en SQL."""
+        where, params = self._where(ledger, año, mes, texto=texto, rangos=rangos)
+        direccion = "ASC" if ascendente else "DESC"
+        if _ORDEN_SQL[orden]:
+            # Nulos al final en ambos sentidos y empates en orden de captura,
+            # igual que el sort estable de pandas en el backend CSV
+            orden_sql = ", ".join(
+                f"{col} IS NULL, {col} {direccion}" for col in _ORDEN_SQL[orden]
+            ) + ", id"
+        else:
+            orden_sql = f"id {direccion}"
+        filas = self._conn().execute(
+            f"SELECT {_COLS_SQL} FROM movimientos WHERE {where} "
+            f"ORDER BY {orden_sql} LIMIT ? OFFSET ?",
+            [*params, int(limite), int(offset)],
+        ).fetchall()
+        return _a_dataframe(filas, ledger)
+
+    def años(self, ledger: str) -> list[int]:
+        filas = self._conn().execute(
+            "SELECT DISTINCT anio FROM movimientos WHERE tipo = ? ORDER BY anio",
+            (TIPOS[ledger],),
+        ).fetchall()
+        return [f[0] for f in filas]
+
+    def montos_invalidos(self, ledger: str) -> int:
+        # monto_centavos es INTEGER NOT NULL: aquí no puede haber ilegibles
+        return 0
+
+    def meses(self, ledger: str) -> list[str]:
+        filas = self._conn().execute(
+            "SELECT DISTINCT mes FROM movimientos WHERE tipo = ? ORDER BY mes",
+            (TIPOS[ledger],),
+        ).fetchall()
+        return [MESES[f[0] - 1] for f in filas]
+
+    def totales(self, ledger: str, rangos: Rangos | None = None) -> pd.DataFrame:
+        """Suma, conteo, mínimo y máximo del monto por (Año, Mes), resuelto con el índice."""
+        where, params = self._where(ledger, rangos=rangos)
+        filas = self._conn().execute(
+            "SELECT anio, mes, SUM(monto_centavos), COUNT(*), "
+            "MIN(monto_centavos), MAX(monto_centavos) FROM movimientos "
+            f"WHERE {where} GROUP BY anio, mes ORDER BY anio, mes",
+            params,
+        ).fetchall()
+        return pd.DataFrame(
+            [
+                (a, MESES[m - 1], suma / 100, n, mn / 100, mx / 100)
+                for a, m, suma, n, mn, mx in filas
+            ],
+            columns=["Año", "Mes", "suma", "n", "minimo", "maximo"],
+        )
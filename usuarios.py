@@ -0,0 +1,270 @@
+# usuarios.py
+"""
+Directorio de usuarios del login, con dos backends intercambiables
+(IMPRESOS_USUARIOS):
+
+- "json" (default): data/usuarios.json, compatible con el formato de
+  siempre (incluido el viejo "usuario": "<hash>"). Se lee una vez y se
+  comparte entre sesiones por firma del archivo; cada alta reescribe el
+  archivo completo bajo bloqueo, así que conviene para pocos usuarios.
+- "sqlite": tabla `usuarios` en data/usuarios.db (IMPRESOS_USUARIOS_DB),
+  una fila por usuario con llave primaria en el nombre: validar un login o
+  dar de alta cuesta lo mismo con 5 que con 50,000 usuarios. Va en su
+  propia base y no en la del histórico, para que un alta o un rehash de
+  contraseña no cambie la firma de los libros ni invalide sus cachés.
+
+Los dos regresan el mismo registro normalizado:
+    {password, role, nombre, apellidos, email, telefono, pais}
+
+Para pasar de JSON a SQLite:  python usuarios.py migrar-sqlite
+"""
+import os
+import json
+import sqlite3
+import threading
+from pathlib import Path
+
+from data_utils import (
+    DATA_DIR,
+    bloqueo_archivo,
+    escribir_atomico,
+    invalidar_cache,
+    leer_con_cache,
+)
+from rendimiento import tramo
+
+USERS_FILE = Path(DATA_DIR) / "usuarios.json"
+USERS_FILE.parent.mkdir(parents=True, exist_ok=True)
+
+USUARIOS_BACKEND = os.environ.get("IMPRESOS_USUARIOS", "json").lower()
+USUARIOS_DB = os.environ.get("IMPRESOS_USUARIOS_DB", os.path.join(DATA_DIR, "usuarios.db"))
+
+CAMPOS_PERFIL = ["nombre", "apellidos", "email", "telefono", "pais"]
+_COLS_USUARIO = ["password", "role", *CAMPOS_PERFIL]
+
+
+def normalizar_usuario(info) -> dict | None:
+    """
+    Registro con todas las llaves. Acepta el formato viejo (sólo el hash
+    como texto) y "password_hash" en lugar de "password".
+    """
+    if isinstance(info, str):
+        return {"password": info, "role": "user", **{c: "" for c in CAMPOS_PERFIL}}
+    if isinstance(info, dict):
+        return {
+            "password": info.get("password_hash") or info.get("password") or "",
+            "role": info.get("role", "user"),
+            **{c: info.get(c, "") for c in CAMPOS_PERFIL},
+        }
+    return None
+
+
+# ------------ JSON ------------
+
+class JSONUsuarios:
+    """usuarios.json completo en memoria (caché compartida), reescrito en cada alta."""
+
+    nombre = "json"
+
+    def __init__(self, path: Path = USERS_FILE):
+        self.path = str(path)
+
+    @tramo("leer usuarios.json")
+    def _leer(self) -> dict:
+        """Lee y normaliza el JSON (sin caché)."""
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except Exception:
+            return {}
+        users = {}
+        for user, info in data.items():
+            registro = normalizar_usuario(info)
+            if registro is not None:
+                users[user] = registro
+        return users
+
+    def _directorio(self) -> dict:
+        # Compartido entre sesiones: no hay que modificarlo
+        return leer_con_cache(self.path, self._leer)
+
+    def _escribir(self, users: dict) -> None:
+        escribir_atomico(
+            self.path,
+            lambda f: json.dump(users, f, indent=2, ensure_ascii=False),
+            encoding="utf-8",
+        )
+        invalidar_cache(self.path)
+
+    def obtener(self, username: str) -> dict | None:
+        return self._directorio().get(username)
+
+    def hay_usuarios(self) -> bool:
+        return bool(self._directorio())
+
+    def todos(self) -> dict:
+        return dict(self._directorio())
+
+    def agregar(self, username: str, info: dict) -> bool:
+        """
+        Da de alta releyendo el JSON bajo el bloqueo, para que dos registros
+        simultáneos no se pisen. False si el usuario ya existía.
+        """
+        with bloqueo_archivo(self.path):
+            users = self._leer()
+            if username in users:
+                return False
+            users[username] = normalizar_usuario(info)
+            self._escribir(users)
+        return True
+
+    def actualizar(self, username: str, **campos) -> bool:
+        """Cambia campos de un usuario existente (p. ej. password). False si no existe."""
+        campos = {c: v for c, v in campos.items() if c in _COLS_USUARIO}
+        with bloqueo_archivo(self.path):
+            users = self._leer()
+            if username not in users:
+                return False
+            users[username] = {**users[username], **campos}
+            self._escribir(users)
+        return True
+
+
+# ------------ SQLITE ------------
+
+SCHEMA_USUARIOS = """
+CREATE TABLE IF NOT EXISTS usuarios (
+    username   TEXT PRIMARY KEY,
+    password   TEXT NOT NULL,
+    role       TEXT NOT NULL DEFAULT 'user',
+    nombre     TEXT NOT NULL DEFAULT '',
+    apellidos  TEXT NOT NULL DEFAULT '',
+    email      TEXT NOT NULL DEFAULT '',
+    telefono   TEXT NOT NULL DEFAULT '',
+    pais       TEXT NOT NULL DEFAULT ''
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_usuarios_role ON usuarios (role);
+"""
+
+
+class SQLiteUsuarios:
+    """Una fila por usuario; cada operación toca sólo esa fila."""
+
+    nombre = "sqlite"
+
+    def __init__(self, db_path: str = USUARIOS_DB):
+        self.db_path = db_path
+        self._local = threading.local()
+        self._conn().executescript(SCHEMA_USUARIOS)
+
+    def _conn(self) -> sqlite3.Connection:
+        # Una conexión por hilo, como en sqlite_backend
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def obtener(self, username: str) -> dict | None:
+        fila = self._conn().execute(
+            f"SELECT {', '.join(_COLS_USUARIO)} FROM usuarios WHERE username = ?", (username,)
+        ).fetchone()
+        return None if fila is None else dict(zip(_COLS_USUARIO, fila))
+
+    def hay_usuarios(self) -> bool:
+        return self._conn().execute("SELECT 1 FROM usuarios LIMIT 1").fetchone() is not None
+
+    def todos(self) -> dict:
+        filas = self._conn().execute(
+            f"SELECT username, {', '.join(_COLS_USUARIO)} FROM usuarios ORDER BY username"
+        ).fetchall()
+        return {f[0]: dict(zip(_COLS_USUARIO, f[1:])) for f in filas}
+
+    def agregar(self, username: str, info: dict) -> bool:
+        registro = normalizar_usuario(info)
+        conn = self._conn()
+        with conn:
+            cur = conn.execute(
+                f"INSERT OR IGNORE INTO usuarios (username, {', '.join(_COLS_USUARIO)}) "
+                f"VALUES (?, {', '.join('?' for _ in _COLS_USUARIO)})",
+                (username, *(registro[c] or "" for c in _COLS_USUARIO)),
+            )
+        return cur.rowcount == 1
+
+    def agregar_muchos(self, usuarios: dict) -> int:
+        """Alta de varios usuarios en una transacción (los existentes se respetan)."""
+        conn = self._conn()
+        antes = conn.total_changes
+        with conn:
+            conn.executemany(
+                f"INSERT OR IGNORE INTO usuarios (username, {', '.join(_COLS_USUARIO)}) "
+                f"VALUES (?, {', '.join('?' for _ in _COLS_USUARIO)})",
+                [
+                    (username, *(registro[c] or "" for c in _COLS_USUARIO))
+                    for username, registro in usuarios.items()
+                ],
+            )
+        return conn.total_changes - antes
+
+    def actualizar(self, username: str, **campos) -> bool:
+        campos = {c: v for c, v in campos.items() if c in _COLS_USUARIO}
+        if not campos:
+            return self.obtener(username) is not None
+        conn = self._conn()
+        with conn:
+            cur = conn.execute(
+                f"UPDATE usuarios SET {', '.join(f'{c} = ?' for c in campos)} WHERE username = ?",
+                (*campos.values(), username),
+            )
+        return cur.rowcount == 1
+
+
+# ------------ ACCESO ------------
+
+_STORE = None
+_STORE_LOCK = threading.Lock()
+
+
+def get_store():
+    """Regresa el directorio configurado en IMPRESOS_USUARIOS (una instancia por proceso)."""
+    global _STORE
+    with _STORE_LOCK:
+        if _STORE is not None:
+            return _STORE
+        if USUARIOS_BACKEND == "sqlite":
+            _STORE = SQLiteUsuarios(USUARIOS_DB)
+        elif USUARIOS_BACKEND == "json":
+            _STORE = JSONUsuarios(USERS_FILE)
+        else:
+            raise ValueError(f"IMPRESOS_USUARIOS desconocido: {USUARIOS_BACKEND!r}")
+        return _STORE
+
+
+def migrar_json_a_sqlite(json_path: Path = USERS_FILE, db_path: str = USUARIOS_DB) -> dict:
+    """
+    Copia usuarios.json (con sus formatos viejos ya normalizados) a la tabla
+    `usuarios`. Se puede correr varias veces: los usuarios que ya estaban
+    en SQLite no se tocan.
+    """
+    origen = JSONUsuarios(json_path).todos()
+    importados = SQLiteUsuarios(db_path).agregar_muchos(origen)
+    return {"importados": importados, "ya_existian": len(origen) - importados}
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Utilerías del directorio de usuarios")
+    sub = parser.add_subparsers(dest="comando", required=True)
+
+    p_sql = sub.add_parser("migrar-sqlite", help="Importa usuarios.json a la base SQLite")
+    p_sql.add_argument("--json", default=str(USERS_FILE))
+    p_sql.add_argument("--db", default=USUARIOS_DB)
+
+    args = parser.parse_args()
+    if args.comando == "migrar-sqlite":
+        print(migrar_json_a_sqlite(Path(args.json), args.db))
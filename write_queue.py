@@ -0,0 +1,132 @@
+# write_queue.py
+"""
+Escritura diferida de facturas (opcional, IMPRESOS_ESCRITURA_DIFERIDA=1).
+
+Al guardar, el registro sólo se agrega a un diario (data/pendientes.jsonl,
+con fsync) y el callback regresa de inmediato. Un hilo de fondo pasa los
+pendientes al histórico en lotes cada LOTE_FILAS registros o LOTE_SEGUNDOS
+segundos, con una sola escritura por libro.
+
+Si el proceso se cae, lo que quedó en el diario se vuelve a aplicar en el
+siguiente arranque; el índice de llaves descarta lo que ya se había escrito.
+"""
+import os
+import json
+import time
+import atexit
+import logging
+import threading
+
+from data_utils import (
+    DATA_DIR,
+    TIPOS,
+    agregar_sincronizado,
+    bloqueo_archivo,
+    escribir_atomico,
+    guardar_lote_historico,
+)
+
+logger = logging.getLogger(__name__)
+
+JOURNAL_FILE = os.path.join(DATA_DIR, "pendientes.jsonl")
+LOTE_FILAS = int(os.environ.get("IMPRESOS_LOTE_FILAS", "50"))
+LOTE_SEGUNDOS = float(os.environ.get("IMPRESOS_LOTE_SEGUNDOS", "2"))
+
+
+def _leer_diario() -> list[dict]:
+    if not os.path.exists(JOURNAL_FILE):
+        return []
+    entradas = []
+    with open(JOURNAL_FILE, "r", encoding="utf-8") as f:
+        for linea in f:
+            try:
+                entradas.append(json.loads(linea))
+            except ValueError:
+                # línea cortada por una caída a media escritura
+                logger.warning("Entrada ilegible en %s, se descarta", JOURNAL_FILE)
+    return entradas
+
+
+def flush_pendientes() -> int:
+    """Pasa todo lo pendiente del diario al histórico. Regresa cuántos registros aplicó."""
+    with bloqueo_archivo(JOURNAL_FILE):
+        entradas = _leer_diario()
+        if not entradas:
+            return 0
+        for ledger in TIPOS:
+            rows = [e["row"] for e in entradas if e["ledger"] == ledger]
+            if rows:
+                guardar_lote_historico(ledger, rows)
+        # Sólo vaciamos el diario cuando el histórico ya quedó escrito
+        escribir_atomico(JOURNAL_FILE, lambda f: None, encoding="utf-8")
+    return len(entradas)
+
+
+def pendientes(ledger: str | None = None) -> int:
+    """Registros en el diario que todavía no llegan al histórico."""
+    return sum(1 for e in _leer_diario() if ledger is None or e["ledger"] == ledger)
+
+
+class _ColaEscritura:
+    """Hilo de fondo que vacía el diario por lotes (uno por proceso)."""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._pendientes = 0
+        self._desde = None
+        self._hilo = None
+
+    def _avisar(self, n: int, inmediato: bool = False) -> None:
+        with self._cond:
+            self._pendientes += n
+            if self._desde is None or inmediato:
+                self._desde = time.monotonic() - (LOTE_SEGUNDOS if inmediato else 0)
+            if self._hilo is None:
+                self._hilo = threading.Thread(
+                    target=self._bucle, name="impresos-flusher", daemon=True
+                )
+                self._hilo.start()
+            self._cond.notify()
+
+    def encolar(self, ledger: str, row: dict) -> None:
+        linea = json.dumps({"ledger": ledger, "row": row}, ensure_ascii=False, default=str)
+        with bloqueo_archivo(JOURNAL_FILE):
+            agregar_sincronizado(JOURNAL_FILE, linea + "\n")
+        self._avisar(1)
+
+    def _bucle(self) -> None:
+        while True:
+            with self._cond:
+                while self._pendientes == 0:
+                    self._cond.wait()
+                restante = self._desde + LOTE_SEGUNDOS - time.monotonic()
+                if self._pendientes < LOTE_FILAS and restante > 0:
+                    self._cond.wait(restante)
+                    continue
+                self._pendientes = 0
+                self._desde = None
+            try:
+                flush_pendientes()
+            except Exception:
+                logger.exception("No se pudo vaciar el diario de pendientes; se reintenta")
+                self._avisar(1)
+
+
+_COLA = _ColaEscritura()
+
+# Lo que haya quedado de una corrida anterior se aplica en cuanto arrancamos
+if os.path.exists(JOURNAL_FILE) and os.path.getsize(JOURNAL_FILE) > 0:
+    _COLA._avisar(1, inmediato=True)
+
+
+def encolar(ledger: str, row: dict) -> None:
+    """Agrega el registro al diario y regresa de inmediato."""
+    _COLA.encolar(ledger, row)
+
+
+@atexit.register
+def _flush_al_salir() -> None:
+    try:
+        flush_pendientes()
+    except Exception:
+        logger.exception("Quedaron registros pendientes en %s", JOURNAL_FILE)